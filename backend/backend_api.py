@@ -3,21 +3,28 @@
 
 import os
 import sys
-import glob
 import json
+import time
+import fnmatch
 import shutil
 import psutil
 from datetime import datetime
-from flask import Flask, jsonify
-from threading import Thread
+from flask import Flask, jsonify, request
+from threading import Thread, Lock
 from dotenv import load_dotenv
 
 # Jika utils.py berada di /app/scripts, kita tambahkan path
 sys.path.append("/app/scripts")
 from utils import (
     setup_category_logger,
-    file_write_lock
+    file_write_lock,
+    StateReader
 )
+from state_segment import StateSegment
+from metric_history import MetricHistory, METRIC_HISTORY_PATH
+from recording_catalog import RecordingCatalog
+from backup_scanner import BackupTreeScanner
+from status_sampler import StatusSampler
 
 # -------------------------------------------------------------------------------
 # 1) Load environment variables
@@ -30,6 +37,69 @@ SYSLOG_DIR = os.getenv("SYSLOG_DIR", "/mnt/Data/Syslog")
 RESOURCE_JSON_PATH = "/mnt/Data/Syslog/resource/resource_monitor_state.json"
 VALIDATION_JSON_PATH = "/mnt/Data/Syslog/rtsp/channel_validation.json"
 
+# Dokumen resource dipublikasikan atomic oleh resource_monitor (utils.publish_state)
+resource_state = StateReader(RESOURCE_JSON_PATH)
+
+# Metrik gap recorder per channel (backup/recorder_watchdog.py)
+RECORD_WATCHDOG_STATE_PATH = os.getenv("RECORD_WATCHDOG_STATE_PATH",
+                                       "/mnt/Data/Syslog/rtsp/recorder_watchdog.json")
+recorder_state = StateReader(RECORD_WATCHDOG_STATE_PATH)
+
+# Segmen state biner (mmap, lock-free) => dibuka lazy karena writer bisa start belakangan
+_state_segment = None
+
+def get_state_segment():
+    global _state_segment
+    if _state_segment is None:
+        _state_segment = StateSegment.open_reader()
+    return _state_segment
+
+# Katalog rekaman (SQLite, ditulis BackupSession) => dibuka lazy seperti segmen state
+_recording_catalog = None
+
+def get_recording_catalog():
+    global _recording_catalog
+    if _recording_catalog is None:
+        _recording_catalog = RecordingCatalog.open_reader()
+    return _recording_catalog
+
+# Sumber backup_info di /status + scanner inkremental (satu per direktori per worker)
+BACKUP_INFO_SOURCE = os.getenv("BACKUP_INFO_SOURCE", "auto").lower()
+
+# Interval refresh sumber /status (detik) & batas waktu sebelum ditandai stale
+STATUS_FAST_INTERVAL  = float(os.getenv("STATUS_FAST_INTERVAL", "2"))
+STATUS_SLOW_INTERVAL  = float(os.getenv("STATUS_SLOW_INTERVAL", "30"))
+STATUS_SOURCE_TIMEOUT = float(os.getenv("STATUS_SOURCE_TIMEOUT", "5"))
+_backup_scanners = {}
+
+def get_backup_scanner(directory: str) -> BackupTreeScanner:
+    scanner = _backup_scanners.get(directory)
+    if scanner is None:
+        scanner = _backup_scanners[directory] = BackupTreeScanner(directory)
+    return scanner
+
+# Riwayat metrik (ring buffer mmap, ditulis resource_monitor)
+HISTORY_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", "1500"))
+_metric_history = (None, None)   # (stat_key, MetricHistory)
+
+def get_metric_history():
+    """
+    Buka ulang jika file dibuat ulang writer (layout metrik berubah); reader lama
+    ditutup agar mapping file lama tidak menumpuk.
+    """
+    global _metric_history
+    try:
+        st = os.stat(METRIC_HISTORY_PATH)
+    except FileNotFoundError:
+        return None
+    key = (st.st_ino, st.st_size)
+    if _metric_history[0] != key or _metric_history[1] is None:
+        old = _metric_history[1]
+        _metric_history = (key, MetricHistory.open_reader(METRIC_HISTORY_PATH))
+        if old is not None:
+            old.close()
+    return _metric_history[1]
+
 HOST = os.getenv("FLASK_HOST", "0.0.0.0")
 PORT = int(os.getenv("FLASK_PORT", "5001"))
 
@@ -121,13 +191,11 @@ def parse_resource_json() -> dict:
       }
     }
     """
-    try:
-        with open(RESOURCE_JSON_PATH, 'r') as f:
-            data = json.load(f)
-            return data
-    except Exception as e:
-        logger.error(f"Gagal membaca {RESOURCE_JSON_PATH}: {e}", exc_info=True)
+    data = resource_state.read()
+    if data is None:
+        logger.error(f"Gagal membaca {RESOURCE_JSON_PATH}: belum ada versi valid")
         return {}
+    return data
 
 def parse_validation_json() -> dict:
     """
@@ -147,52 +215,169 @@ def parse_validation_json() -> dict:
         logger.error(f"Gagal membaca {VALIDATION_JSON_PATH}: {e}", exc_info=True)
         return {}
 
+def _format_backup_date(ts):
+    return datetime.fromtimestamp(ts).strftime("%d-%m-%Y") if ts else None
+
 def get_backup_info(directory: str) -> dict:
     """
-    Hitung:
+    Hitung (dari scanner inkremental, tanpa menunggu scan):
     - Jumlah file di 'directory'
     - Rentang tanggal (start, end) format dd-MM-yyyy berdasar mtime
+    Hasil basi => di-refresh di background (stale-while-revalidate).
     """
-    try:
-        # Dapatkan semua file (rekursif). Ubah pattern jika perlu (misal "*.mp4").
-        all_files = glob.glob(f"{directory}/**/*", recursive=True)
-        file_paths = [f for f in all_files if os.path.isfile(f)]
-        file_count = len(file_paths)
-
-        if file_count == 0:
-            return {
-                "file_count": 0,
-                "date_range": {
-                    "start": None,
-                    "end": None
-                }
-            }
-        
-        mtimes = [os.path.getmtime(p) for p in file_paths]
-        mtime_min = min(mtimes)
-        mtime_max = max(mtimes)
-
-        # Format dd-MM-yyyy
-        start_str = datetime.fromtimestamp(mtime_min).strftime("%d-%m-%Y")
-        end_str   = datetime.fromtimestamp(mtime_max).strftime("%d-%m-%Y")
-
+    scanner = get_backup_scanner(directory)
+    snap = scanner.get()
+    agg = snap["aggregate"]
+    if agg is None:
+        # Scan pertama sejak worker start masih berjalan
         return {
-            "file_count": file_count,
-            "date_range": {
-                "start": start_str,
-                "end": end_str
-            }
-        }
-    except Exception as e:
-        logger.error(f"Gagal mendapatkan info backup di {directory}: {e}", exc_info=True)
-        return {
-            "file_count": 0,
+            "file_count": None,
             "date_range": {
                 "start": None,
                 "end": None
             },
-            "error": str(e)
+            "source": "scan",
+            "scanning": True
         }
+    return {
+        "file_count": agg["file_count"],
+        "date_range": {
+            "start": _format_backup_date(agg["min_mtime"]),
+            "end": _format_backup_date(agg["max_mtime"])
+        },
+        "total_bytes": agg["bytes"],
+        "source": "scan",
+        "age_s": snap["age_s"],
+        "stale": snap["stale"]
+    }
+
+def get_catalog_backup_info():
+    """
+    Sama seperti get_backup_info, tapi dari katalog rekaman (query ter-index).
+    None jika katalog belum ada / backfill rekaman lama belum selesai => pakai scan.
+    """
+    catalog = get_recording_catalog()
+    if catalog is None or not catalog.backfilled:
+        return None
+    try:
+        summary = catalog.summary()
+    except Exception as e:
+        logger.warning(f"Gagal query katalog rekaman: {e}")
+        return None
+
+    return {
+        "file_count": summary["file_count"],
+        "date_range": {
+            "start": _format_backup_date(summary["start_ts"]),
+            "end": _format_backup_date(summary["end_ts"])
+        },
+        "total_bytes": summary["total_bytes"],
+        "source": "catalog"
+    }
+
+# -------------------------------------------------------------------------------
+# 2b) Sumber data /status (dijalankan sampler background)
+# -------------------------------------------------------------------------------
+def collect_resource() -> dict:
+    """
+    stream_title, CPU & RAM (segmen state jika tersedia, fallback JSON resource).
+    """
+    segment = get_state_segment()
+    resource_data = parse_resource_json()
+    cpu_data = {}
+    mem_data = {}
+    stream_title = "Unknown Node"
+    if resource_data:
+        # stream_config => ambil 'stream_title'
+        stream_config = resource_data.get("stream_config", {})
+        stream_title = stream_config.get("stream_title", "Unknown Location")
+
+        cpu_dict = resource_data.get("resource_usage", {}).get("cpu", {})
+        cpu_data = {
+            "usage_percent": cpu_dict.get("usage_percent", 0),
+            "core_count_logical": cpu_dict.get("core_count_logical", 0)
+        }
+
+        ram_dict = resource_data.get("resource_usage", {}).get("ram", {})
+        mem_data = {
+            "usage_percent": ram_dict.get("usage_percent", 0),
+            "used_mb": round(ram_dict.get("used", 0) / (1024 * 1024), 1),
+            "free_mb": round(ram_dict.get("free", 0) / (1024 * 1024), 1)
+        }
+
+    # CPU/RAM terbaru dari segmen state (jika tersedia) => tanpa parse JSON
+    seg_res = segment.read_resource() if segment else None
+    if seg_res:
+        cpu_data = {
+            "usage_percent": round(seg_res["cpu_percent"], 1),
+            "core_count_logical": seg_res["cpu_count"]
+        }
+        mem_data = {
+            "usage_percent": round(seg_res["ram_percent"], 1),
+            "used_mb": round(seg_res["ram_used"] / (1024 * 1024), 1),
+            "free_mb": round(seg_res["ram_free"] / (1024 * 1024), 1)
+        }
+    return {"stream_title": stream_title, "cpu": cpu_data, "memory": mem_data}
+
+def collect_active_channels() -> list:
+    # Segmen state, fallback channel_validation.json
+    segment = get_state_segment()
+    validation_data = segment.read_channels() if segment else None
+    if not validation_data:
+        validation_data = parse_validation_json()
+    active_channels = []
+    if validation_data:
+        for ch_str, ch_info in validation_data.items():
+            if ch_info.get("is_active") is True:
+                active_channels.append(int(ch_str))
+        active_channels.sort()
+    return active_channels
+
+def collect_recorder_gaps() -> dict:
+    # {channel: {state, restarts, dead, stalled, gap_total_s, last_gap_s, ...}}
+    doc = recorder_state.read(default=None) or {}
+    return doc.get("channels", {})
+
+def collect_backup_info() -> dict:
+    # BACKUP_INFO_SOURCE: auto (katalog jika siap, fallback scanner) | scan
+    backup_info = None
+    if BACKUP_INFO_SOURCE != "scan":
+        backup_info = get_catalog_backup_info()
+    if backup_info is None:
+        backup_info = get_backup_info(BACKUP_DIR)
+    return backup_info
+
+# Semua sumber /status dikumpulkan di background (status_sampler.py), per worker
+_status_sampler = None
+_status_sampler_lock = Lock()
+
+def get_status_sampler() -> StatusSampler:
+    """
+    Dibuat lazy (setelah fork worker gunicorn) => thread sampler milik worker ini.
+    """
+    global _status_sampler
+    with _status_sampler_lock:
+        if _status_sampler is None:
+            _status_sampler = (
+                StatusSampler()
+                .register("uptime", hitung_uptime_sistem,
+                          STATUS_SLOW_INTERVAL, STATUS_SOURCE_TIMEOUT, default=None)
+                .register("backup_disk_usage", lambda: monitor_directory_usage(BACKUP_DIR),
+                          STATUS_SLOW_INTERVAL, STATUS_SOURCE_TIMEOUT, default={})
+                .register("syslog_disk_usage", lambda: monitor_directory_usage(SYSLOG_DIR),
+                          STATUS_SLOW_INTERVAL, STATUS_SOURCE_TIMEOUT, default={})
+                .register("resource", collect_resource,
+                          STATUS_FAST_INTERVAL, STATUS_SOURCE_TIMEOUT,
+                          default={"stream_title": "Unknown Node", "cpu": {}, "memory": {}})
+                .register("active_channels", collect_active_channels,
+                          STATUS_FAST_INTERVAL, STATUS_SOURCE_TIMEOUT, default=[])
+                .register("recorder", collect_recorder_gaps,
+                          STATUS_FAST_INTERVAL, STATUS_SOURCE_TIMEOUT, default={})
+                .register("backup_info", collect_backup_info,
+                          STATUS_SLOW_INTERVAL, STATUS_SOURCE_TIMEOUT, default={})
+                .start()
+            )
+    return _status_sampler
 
 # -------------------------------------------------------------------------------
 # 3) SATU ENDPOINT => /status
@@ -200,7 +385,7 @@ def get_backup_info(directory: str) -> dict:
 @app.route('/status', methods=['GET'])
 def status_all():
     """
-    Menampilkan:
+    Menampilkan (dari snapshot sampler background, tanpa I/O di request):
     - Informasi node (stream_title) dari resource_monitor_state.json
     - Uptime
     - current_time
@@ -208,63 +393,32 @@ def status_all():
     - CPU usage (usage_percent, core_count_logical)
     - Memory usage (usage_percent, used, free)
     - Channel aktif
+    - Recorder per channel (restart & gap rekaman dari recorder watchdog)
     - Info file backup
+    - snapshot => umur data & sumber yang stale (lambat/timeout)
     """
     try:
-        # 1) Uptime & current_time
-        uptime_str = hitung_uptime_sistem()
-        current_time_str = get_local_time_with_timezone()
-
-        # 2) Disk usage => backup, syslog
-        backup_usage = monitor_directory_usage(BACKUP_DIR)
-        syslog_usage = monitor_directory_usage(SYSLOG_DIR)
-
-        # 3) Baca resource_data => CPU, RAM, dan stream_title
-        resource_data = parse_resource_json()
-        cpu_data = {}
-        mem_data = {}
-        stream_title = "Unknown Node"
-        if resource_data:
-            # stream_config => ambil 'stream_title'
-            stream_config = resource_data.get("stream_config", {})
-            stream_title = stream_config.get("stream_title", "Unknown Location")
-
-            cpu_dict = resource_data.get("resource_usage", {}).get("cpu", {})
-            cpu_data = {
-                "usage_percent": cpu_dict.get("usage_percent", 0),
-                "core_count_logical": cpu_dict.get("core_count_logical", 0)
-            }
-
-            ram_dict = resource_data.get("resource_usage", {}).get("ram", {})
-            mem_data = {
-                "usage_percent": ram_dict.get("usage_percent", 0),
-                "used_mb": round(ram_dict.get("used", 0) / (1024 * 1024), 1),
-                "free_mb": round(ram_dict.get("free", 0) / (1024 * 1024), 1)
-            }
-
-        # 4) Channel aktif
-        validation_data = parse_validation_json()
-        active_channels = []
-        if validation_data:
-            for ch_str, ch_info in validation_data.items():
-                if ch_info.get("is_active") is True:
-                    active_channels.append(int(ch_str))
-            active_channels.sort()
-
-        # 5) Backup info => file_count, date_range (dd-MM-yyyy)
-        backup_info = get_backup_info(BACKUP_DIR)
+        snap = get_status_sampler().snapshot()
+        values = snap["values"]
+        resource = values["resource"]
 
         # Gabungkan semua
         result = {
-            "node_title": stream_title,  # Informasi lokasi / nama node
-            "uptime": uptime_str,
-            "current_time": current_time_str,
-            "backup_disk_usage": backup_usage,
-            "syslog_disk_usage": syslog_usage,
-            "cpu": cpu_data,
-            "memory": mem_data,
-            "active_channels": active_channels,
-            "backup_info": backup_info
+            "node_title": resource.get("stream_title"),  # Informasi lokasi / nama node
+            "uptime": values["uptime"],
+            "current_time": get_local_time_with_timezone(),
+            "backup_disk_usage": values["backup_disk_usage"],
+            "syslog_disk_usage": values["syslog_disk_usage"],
+            "cpu": resource.get("cpu", {}),
+            "memory": resource.get("memory", {}),
+            "active_channels": values["active_channels"],
+            "recorder": values["recorder"],
+            "backup_info": values["backup_info"],
+            "snapshot": {
+                "age_s": snap["age_s"],
+                "stale_sources": [n for n, m in snap["sources"].items() if m["stale"]],
+                "sources": snap["sources"]
+            }
         }
 
         return jsonify(result)
@@ -273,6 +427,67 @@ def status_all():
         logger.error(f"Error di endpoint /status: {e}", exc_info=True)
         return jsonify({"error": "Terjadi kesalahan saat membaca status."}), 500
 
+# -------------------------------------------------------------------------------
+# 3b) /history => range query riwayat metrik
+# -------------------------------------------------------------------------------
+def _parse_time_arg(value, default: float, now: float) -> float:
+    if value is None or value == "":
+        return default
+    t = float(value)
+    return now + t if t <= 0 else t   # nilai <= 0 => relatif terhadap sekarang
+
+def _parse_resolution(value: str):
+    if not value or value == "auto":
+        return None
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1] in units:
+        return int(value[:-1]) * units[value[-1]]
+    return int(value)
+
+@app.route('/history', methods=['GET'])
+def history_range():
+    """
+    Query:
+    - metrics => daftar dipisah koma, boleh wildcard (mis. "cpu_percent,ch3_*").
+                 Default: semua metrik non-channel.
+    - from/to => epoch detik, atau negatif relatif ke sekarang (default from=-3600).
+    - res     => auto | 1s | 1m | 1h (auto => tier terhalus dengan titik <= HISTORY_MAX_POINTS)
+    - stat    => avg,min,max (default semuanya)
+    Respons kolom: {"resolution", "start", "points", "metrics": {nama: {avg: [...], ...}}}.
+    """
+    history = get_metric_history()
+    if history is None:
+        return jsonify({"error": "Metric history belum tersedia."}), 503
+    try:
+        now   = time.time()
+        end   = _parse_time_arg(request.args.get("to"), now, now)
+        start = _parse_time_arg(request.args.get("from"), end - 3600, now)
+        res   = _parse_resolution(request.args.get("res", "auto"))
+    except ValueError:
+        return jsonify({"error": "Parameter from/to/res tidak valid."}), 400
+    if start > end:
+        return jsonify({"error": "from harus <= to."}), 400
+
+    tiers = [r for r, _ in history.tiers]
+    if res is None:
+        res = history.pick_resolution(start, end, HISTORY_MAX_POINTS)
+    elif res not in tiers:
+        return jsonify({"error": f"res harus salah satu dari {tiers} detik."}), 400
+
+    patterns = [p.strip() for p in request.args.get("metrics", "").split(",") if p.strip()]
+    if patterns:
+        names = [n for n in history.names if any(fnmatch.fnmatchcase(n, p) for p in patterns)]
+    else:
+        names = [n for n in history.names if not n.startswith("ch")]
+    stats = [st for st in request.args.get("stat", "avg,min,max").split(",")
+             if st in ("avg", "min", "max")] or ["avg"]
+
+    try:
+        result = history.query(names, start, end, res, stats)
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(result)
+
 # -------------------------------------------------------------------------------
 # 4) Menjalankan Flask jika diperlukan (standalone)
 # -------------------------------------------------------------------------------
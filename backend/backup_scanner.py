@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+backup_scanner.py
+
+Scanner inkremental pohon /mnt/Data/Backup untuk backend_api.py (/status).
+Pengganti glob rekursif + getmtime per file di setiap request.
+
+- Agregat (jumlah file, byte, min/max mtime) di-cache per direktori
+  (mis. dd-mm-YYYY/Channel-N), dengan kunci mtime direktori. Direktori yang mtime-nya
+  tidak berubah => tidak di-list ulang (cukup satu stat per direktori).
+- mtime direktori tidak berubah saat isi file bertambah (rekaman yang sedang ditulis),
+  jadi direktori "panas" (file terbarunya < BACKUP_SCAN_HOT_WINDOW detik) selalu di-scan ulang.
+- Stale-while-revalidate: get() selalu menjawab dari memori; jika umur hasil
+  > BACKUP_SCAN_TTL, refresh dijalankan di thread background (maks satu sekaligus).
+  Latency /status tidak bergantung pada ukuran arsip.
+
+Dipakai juga saat katalog rekaman (recording_catalog.py) belum siap atau dibangun ulang,
+atau file masuk ke NAS dari sumber lain.
+
+Author: (Anda)
+"""
+
+import os
+import time
+import logging
+import threading
+
+BACKUP_SCAN_TTL        = float(os.getenv("BACKUP_SCAN_TTL", "60"))
+BACKUP_SCAN_HOT_WINDOW = float(os.getenv("BACKUP_SCAN_HOT_WINDOW", "900"))
+
+logger = logging.getLogger("HDD Monitoring")
+
+
+def _empty_aggregate() -> dict:
+    return {"file_count": 0, "bytes": 0, "min_mtime": None, "max_mtime": None}
+
+
+def _merge(total: dict, part: dict):
+    total["file_count"] += part["file_count"]
+    total["bytes"]      += part["bytes"]
+    if part["min_mtime"] is not None:
+        if total["min_mtime"] is None or part["min_mtime"] < total["min_mtime"]:
+            total["min_mtime"] = part["min_mtime"]
+    if part["max_mtime"] is not None:
+        if total["max_mtime"] is None or part["max_mtime"] > total["max_mtime"]:
+            total["max_mtime"] = part["max_mtime"]
+
+
+class BackupTreeScanner:
+    def __init__(self, root: str, ttl: float = None, hot_window: float = None):
+        self.root       = root
+        self.ttl        = BACKUP_SCAN_TTL if ttl is None else ttl
+        self.hot_window = BACKUP_SCAN_HOT_WINDOW if hot_window is None else hot_window
+
+        self._dirs      = {}      # {path: (dir_mtime_ns, aggregate file langsung di dir)}
+        self._result    = None    # agregat total terakhir
+        self._scanned_at = 0.0
+        self._last_stats = {}
+        self._lock      = threading.Lock()
+        self._refreshing = False
+
+    # ------------------------------------------------------------------
+    def _scan_dir_files(self, entries) -> dict:
+        agg = _empty_aggregate()
+        for entry in entries:
+            # File tersembunyi = sidecar indeks / file sementara (.part, .transcode), bukan rekaman
+            if entry.name.startswith("."):
+                continue
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            agg["file_count"] += 1
+            agg["bytes"]      += st.st_size
+            m = st.st_mtime
+            if agg["min_mtime"] is None or m < agg["min_mtime"]:
+                agg["min_mtime"] = m
+            if agg["max_mtime"] is None or m > agg["max_mtime"]:
+                agg["max_mtime"] = m
+        return agg
+
+    def scan(self) -> dict:
+        """
+        Satu putaran inkremental (blocking). Return agregat total.
+        """
+        t0 = time.monotonic()
+        now = time.time()
+        new_dirs = {}
+        total = _empty_aggregate()
+        rescanned = reused = 0
+
+        stack = [self.root]
+        while stack:
+            path = stack.pop()
+            try:
+                dir_mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            cached = self._dirs.get(path)
+            hot = (cached is not None and cached[1]["max_mtime"] is not None
+                   and now - cached[1]["max_mtime"] < self.hot_window)
+
+            if cached is not None and cached[0] == dir_mtime and not hot and cached[2] is not None:
+                # Tidak berubah => pakai agregat cache, turun ke subdir yang diketahui
+                agg, subdirs = cached[1], cached[2]
+                reused += 1
+            else:
+                try:
+                    with os.scandir(path) as it:
+                        entries = list(it)
+                except OSError:
+                    continue
+                subdirs = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                    except OSError:
+                        continue
+                agg = self._scan_dir_files(entries)
+                rescanned += 1
+
+            new_dirs[path] = (dir_mtime, agg, subdirs)
+            _merge(total, agg)
+            stack.extend(subdirs)
+
+        # Direktori yang sudah dihapus (cleanup) otomatis hilang dari cache
+        self._dirs = new_dirs
+        self._last_stats = {
+            "dirs": len(new_dirs), "rescanned": rescanned, "reused": reused,
+            "duration_ms": round((time.monotonic() - t0) * 1000.0, 1),
+        }
+        with self._lock:
+            self._result = total
+            self._scanned_at = time.time()
+        return total
+
+    # ------------------------------------------------------------------
+    def _refresh_bg(self):
+        try:
+            self.scan()
+        except Exception as e:
+            logger.error(f"Scan backup {self.root} gagal: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_bg, daemon=True, name="backup-scan").start()
+
+    def get(self) -> dict:
+        """
+        Hasil terakhir dari memori (tidak pernah blocking). Hasil basi => refresh background.
+        Return dict: aggregate (None jika scan pertama belum selesai), age_s, stale, stats.
+        """
+        with self._lock:
+            result, scanned_at = self._result, self._scanned_at
+        age = time.time() - scanned_at if result is not None else None
+        stale = result is None or age > self.ttl
+        if stale:
+            self.refresh_async()
+        return {
+            "aggregate": dict(result) if result is not None else None,
+            "age_s": round(age, 1) if age is not None else None,
+            "stale": stale,
+            "stats": dict(self._last_stats),
+        }
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+status_sampler.py
+
+Sampler background untuk backend_api.py (/status).
+
+- Setiap sumber (uptime, disk usage, resource, channel, backup info) didaftarkan
+  dengan interval refresh & timeout sendiri.
+- Sumber dijalankan di thread worker masing-masing => satu sumber yang macet
+  (mis. NFS hang di shutil.disk_usage) tidak menahan sumber lain maupun request.
+- Worker yang melewati timeout ditandai "timeout" & nilainya stale; tidak ada worker
+  baru untuk sumber itu sampai worker lama kembali (thread tidak menumpuk).
+- /status membaca snapshot terakhir dari memori (tanpa I/O), lengkap dengan umur
+  dan flag stale per sumber.
+
+Author: (Anda)
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger("HDD Monitoring")
+
+_TICK = 0.25
+
+
+class _Source:
+    def __init__(self, name, fn, interval, timeout, default):
+        self.name       = name
+        self.fn         = fn
+        self.interval   = interval
+        self.timeout    = timeout
+        self.value      = default
+        self.updated_at = None     # time.time() hasil sukses terakhir
+        self.error      = None
+        self.running_since = None  # monotonic; None jika tidak ada worker aktif
+        self.next_run   = 0.0      # monotonic
+
+
+class StatusSampler:
+    def __init__(self):
+        self._sources = {}
+        self._lock    = threading.Lock()
+        self._thread  = None
+
+    def register(self, name: str, fn, interval: float, timeout: float, default=None):
+        self._sources[name] = _Source(name, fn, interval, timeout, default)
+        return self
+
+    # ------------------------------------------------------------------
+    def _run_source(self, src: _Source):
+        try:
+            value = src.fn()
+            with self._lock:
+                src.value, src.updated_at, src.error = value, time.time(), None
+        except Exception as e:
+            logger.error(f"[STATUS] sumber {src.name} gagal: {e}")
+            with self._lock:
+                src.error = str(e)
+        finally:
+            with self._lock:
+                took = time.monotonic() - src.running_since
+                if took > src.timeout:
+                    logger.warning(f"[STATUS] sumber {src.name} kembali setelah {took:.1f}s "
+                                   f"(timeout {src.timeout}s)")
+                src.running_since = None
+                src.next_run = time.monotonic() + src.interval
+
+    def _loop(self):
+        while True:
+            now = time.monotonic()
+            for src in self._sources.values():
+                with self._lock:
+                    if src.running_since is not None or now < src.next_run:
+                        continue
+                    src.running_since = now
+                threading.Thread(target=self._run_source, args=(src,), daemon=True,
+                                 name=f"status-{src.name}").start()
+            time.sleep(_TICK)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="status-sampler")
+            self._thread.start()
+        return self
+
+    # ------------------------------------------------------------------
+    def snapshot(self) -> dict:
+        """
+        {"values": {nama: nilai}, "sources": {nama: {age_s, stale, error}}, "age_s": maks}
+        stale => belum pernah sukses, worker melewati timeout, atau umur > 2x interval.
+        """
+        now_wall, now_mono = time.time(), time.monotonic()
+        values, meta, ages = {}, {}, []
+        with self._lock:
+            for name, src in self._sources.items():
+                age = now_wall - src.updated_at if src.updated_at is not None else None
+                timed_out = (src.running_since is not None
+                             and now_mono - src.running_since > src.timeout)
+                error = "timeout" if timed_out else src.error
+                stale = age is None or timed_out or age > 2 * src.interval + src.timeout
+                values[name] = src.value
+                meta[name] = {
+                    "age_s": round(age, 1) if age is not None else None,
+                    "stale": stale,
+                    "error": error,
+                }
+                if age is not None:
+                    ages.append(age)
+        return {
+            "values": values,
+            "sources": meta,
+            "age_s": round(max(ages), 1) if ages else None,
+        }
@@ -1,23 +1,96 @@
 import os
+import sys
 import time
+import signal
+import logging
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append("/app/scripts")
+from recording_catalog import RecordingCatalog
+from recording_index import write_index
+from spool import get_spool
+
+logger = logging.getLogger("Backup-Manager")
+
+# RECORD_FORMAT => "mkv" (Matroska -c copy, default lama) / "fmp4" (MP4 terfragmentasi
+# per keyframe: file yang terpotong tetap bisa diputar & di-seek)
+RECORD_FORMAT       = os.getenv("RECORD_FORMAT", "mkv").lower()
+RECORD_STOP_TIMEOUT = float(os.getenv("RECORD_STOP_TIMEOUT", "10"))
+RECORD_INDEX_ENABLE = os.getenv("RECORD_INDEX_ENABLE", "true").lower() == "true"
+# Worker finalisasi file selesai (indeks keyframe => spool / katalog), bersama semua channel
+RECORD_FINALIZE_WORKERS = int(os.getenv("RECORD_FINALIZE_WORKERS", "2"))
+
+FMP4_MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+
+# Satu katalog per proses (koneksi SQLite per thread di dalamnya)
+_catalog = None
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        try:
+            _catalog = RecordingCatalog()
+        except Exception as e:
+            logger.warning("[CATALOG] Katalog rekaman tidak tersedia => %s", e)
+    return _catalog
+
+# File yang sudah ditutup ffmpeg difinalisasi di background => ffprobe indeks (mkv bisa
+# membaca seluruh chunk, sering lewat NFS) tidak menahan start file berikutnya
+_finalizer = None
+_finalizer_lock = threading.Lock()
+
+def get_finalizer() -> ThreadPoolExecutor:
+    global _finalizer
+    with _finalizer_lock:
+        if _finalizer is None:
+            _finalizer = ThreadPoolExecutor(max_workers=max(1, RECORD_FINALIZE_WORKERS),
+                                            thread_name_prefix="rec-finalize")
+        return _finalizer
+
+def probe_video_codec(path: str):
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "stream=codec_name", "-of", "csv=p=0", path],
+            capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
 
 class BackupSession:
     """
     Satu sesi perekaman ffmpeg:
       - start_recording() => panggil ffmpeg (tanpa -t)
       - still_ok(max_dur) => cek durasi
-      - stop_recording() => terminate ffmpeg
+      - stop_recording() => SIGINT ffmpeg (file ditutup rapi)
+      - rollover() => ffmpeg file baru dijalankan dulu, baru ffmpeg lama dihentikan
+        (tanpa gap di batas chunk)
+      File yang selesai difinalisasi di background (get_finalizer): indeks keyframe
+      sidecar (scripts/recording_index.py), lalu dicatat ke katalog rekaman
+      (SPOOL_ENABLE => file ditulis ke spool lokal & diantrikan transfer ke NAS).
+    trigger => "full" / "motion" / "object" (alasan rekaman, disimpan di katalog)
     """
-    def __init__(self, rtsp_url, channel, stream_title="Untitled"):
+    def __init__(self, rtsp_url, channel, stream_title="Untitled", trigger="full"):
         self.rtsp_url     = rtsp_url
         self.channel      = channel
         self.stream_title = stream_title
+        self.trigger      = trigger
         self.proc         = None
         self.start_time   = None
         self.file_path    = None
+        self.codec        = None   # di-probe sekali per sesi (stream sama => codec sama)
+        # Thread channel & recorder watchdog sama-sama start/stop sesi ini
+        self.lock         = threading.RLock()
 
-    def start_recording(self):
+    def start_recording(self, trigger=None):
+        with self.lock:
+            return self._start_recording(trigger)
+
+    def _start_recording(self, trigger=None):
+        if trigger:
+            self.trigger = trigger
         self.start_time = time.time()
         out_file = self._make_filename()
         self.file_path = out_file
@@ -28,7 +101,15 @@ class BackupSession:
             "-loglevel", "error",
             "-rtsp_transport", "tcp",
             "-i", self.rtsp_url,
-            "-c", "copy",
+        ]
+        if RECORD_FORMAT == "fmp4":
+            # Audio NVR (G.711) tidak didukung container MP4 => audio di-encode AAC (ringan),
+            # video tetap copy
+            cmd += ["-map", "0:v:0", "-map", "0:a?", "-c:v", "copy", "-c:a", "aac", "-b:a", "32k",
+                    "-f", "mp4", "-movflags", FMP4_MOVFLAGS]
+        else:
+            cmd += ["-c", "copy"]
+        cmd += [
             "-metadata", f"title={self.stream_title}",
             out_file
         ]
@@ -40,24 +121,138 @@ class BackupSession:
         date_str    = time.strftime("%d-%m-%Y")
         time_str    = time.strftime("%H-%M-%S")
         ch_folder   = f"Channel-{self.channel}"
+        # Spool lokal aktif => ffmpeg tidak pernah menulis langsung ke NAS
+        spool = get_spool(get_catalog())
+        if spool is not None:
+            try:
+                return spool.local_path_for(date_str, self.channel,
+                                            f"CH{self.channel}-{time_str}{self._extension()}")
+            except OSError as e:
+                logger.warning("[SPOOL] ch=%s spool tidak bisa dipakai => tulis ke NAS (%s)",
+                               self.channel, e)
         final_dir   = os.path.join(backup_root, date_str, ch_folder)
         os.makedirs(final_dir, exist_ok=True)
-        return os.path.join(final_dir, f"CH{self.channel}-{time_str}.mkv")
+        return os.path.join(final_dir, f"CH{self.channel}-{time_str}{self._extension()}")
+
+    @staticmethod
+    def _extension():
+        return ".mp4" if RECORD_FORMAT == "fmp4" else ".mkv"
 
     def still_ok(self, max_dur=300):
         """
         True jika belum melewati max_dur detik perekaman.
+        (ffmpeg mati / output macet => ditangani recorder_watchdog.py)
         """
         if not self.proc:
             return False
         elapsed = time.time() - self.start_time
         return (elapsed < max_dur)
 
+    def _stop_process(self, proc):
+        """
+        SIGINT => ffmpeg menutup file dengan rapi (cues mkv / fragmen terakhir mp4).
+        Tidak berhenti dalam RECORD_STOP_TIMEOUT => terminate, lalu kill.
+        """
+        for sig, timeout in ((signal.SIGINT, RECORD_STOP_TIMEOUT), (signal.SIGTERM, 5), (signal.SIGKILL, 5)):
+            if proc.poll() is not None:
+                return
+            try:
+                proc.send_signal(sig)
+                proc.wait(timeout=timeout)
+                return
+            except subprocess.TimeoutExpired:
+                logger.warning("[EVENT] ch=%s ffmpeg tidak berhenti dalam %ss setelah %s",
+                               self.channel, timeout, signal.Signals(sig).name)
+            except OSError:
+                return
+
     def stop_recording(self):
+        with self.lock:
+            self._stop_recording()
+
+    def rollover(self, trigger=None) -> bool:
+        """
+        Ganti file: ffmpeg baru merekam dulu, baru ffmpeg lama ditutup & file lama
+        difinalisasi di background. False jika sesi sudah dihentikan pipeline.
+        """
+        with self.lock:
+            if self.proc is None:
+                return False
+            old = (self.proc, self.file_path, self.start_time, self.trigger)
+            # Nama file per detik => tunggu detik berikutnya agar file lama tidak ditimpa
+            while os.path.basename(old[1]).endswith(time.strftime("-%H-%M-%S") + self._extension()):
+                time.sleep(0.05)
+            self._start_recording(trigger)
+            self._stop_process(old[0])
+            self._finalize_async(*old[1:])
+            return True
+
+    def restart_recording(self) -> bool:
+        """
+        Recorder watchdog: tutup file lama (parsial tetap dicatat) & mulai file baru
+        dengan trigger yang sama.
+        """
+        return self.rollover()
+
+    def _stop_recording(self):
         if self.proc:
-            self.proc.terminate()
-            try:
-                self.proc.wait(timeout=5)
-            except:
-                pass
-            self.proc = None
\ No newline at end of file
+            self._stop_process(self.proc)
+            self.proc = None
+            self._finalize_async(self.file_path, self.start_time, self.trigger)
+
+    def _finalize_async(self, path, start_ts, trigger):
+        get_finalizer().submit(self._finalize, path, start_ts, time.time(), trigger)
+
+    def _finalize(self, path, start_ts, end_ts, trigger):
+        """
+        Background: indeks keyframe dulu, baru spool / katalog => file yang terlihat di
+        katalog (dan arsip HLS) sudah punya sidecar.
+        """
+        try:
+            self._write_index(path, start_ts)
+            spool = get_spool()
+            if spool is not None and spool.owns(path):
+                self._spool_file(spool, path, start_ts, end_ts, trigger)
+            else:
+                self._catalog_file(path, start_ts, end_ts, trigger)
+        except Exception as e:
+            logger.error("[EVENT] ch=%s finalisasi %s gagal => %s", self.channel, path, e)
+
+    def _write_index(self, path, start_ts):
+        # Sidecar keyframe => seek O(log n); gagal indeks tidak mengganggu perekaman
+        if not RECORD_INDEX_ENABLE or not path or not os.path.isfile(path):
+            return
+        try:
+            write_index(path, start_ts)
+        except Exception as e:
+            logger.warning("[INDEX] ch=%s indeks %s gagal => %s", self.channel, path, e)
+
+    def _spool_file(self, spool, path, start_ts, end_ts, trigger):
+        """
+        File selesai di spool lokal => antrian transfer ke NAS (dicatat ke katalog
+        setelah tiba di NAS).
+        """
+        if self.codec is None and os.path.isfile(path):
+            self.codec = probe_video_codec(path)
+        spool.enqueue(path, self.channel, start_ts, end_ts, self.codec, trigger)
+
+    def _catalog_file(self, path, start_ts, end_ts, trigger):
+        """
+        File sudah ditutup ffmpeg => satu baris di katalog. Gagal katalog tidak
+        boleh mengganggu perekaman.
+        """
+        catalog = get_catalog()
+        if catalog is None or not path:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if size <= 0:
+            return
+        if self.codec is None:
+            self.codec = probe_video_codec(path)
+        try:
+            catalog.add(path, self.channel, start_ts, end_ts, size, self.codec, trigger)
+        except Exception as e:
+            logger.warning("[CATALOG] ch=%s gagal mencatat %s => %s", self.channel, path, e)
\ No newline at end of file
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+channel_supervisor.py
+
+Supervisor per channel untuk thread_for_channel (backup/main.py).
+Menggantikan sys.exit(1) saat banyak channel gagal: channel yang gagal diisolasi,
+channel sehat tetap merekam tanpa terganggu.
+
+- Backoff eksponensial + jitter:
+    delay = min(SUPERVISOR_BACKOFF_MAX, SUPERVISOR_BACKOFF_BASE * 2^(gagal-1)) +/- jitter
+  sehingga channel yang gagal bersamaan tidak reconnect serempak.
+- Circuit breaker per channel:
+    closed    => normal, kegagalan dihitung
+    open      => gagal beruntun >= SUPERVISOR_BREAKER_THRESHOLD; tidak ada percobaan
+                 sampai SUPERVISOR_BREAKER_COOLDOWN detik berlalu
+    half_open => satu percobaan uji; sukses (stabil SUPERVISOR_STABLE_AFTER detik)
+                 => closed, gagal => open lagi
+- Batas percobaan reconnect serentak ke NVR (SUPERVISOR_MAX_CONNECT): slot dipegang
+  selama validasi (ffmpeg black/freeze) + buka stream, dilepas begitu pipeline jalan.
+
+Author: (Anda)
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("Backup-Manager")
+
+# Fallback ke RESTART_DELAY (jeda retry tetap versi lama) jika belum dikonfigurasi
+SUPERVISOR_BACKOFF_BASE      = float(os.getenv("SUPERVISOR_BACKOFF_BASE", os.getenv("RESTART_DELAY", "5")))
+SUPERVISOR_BACKOFF_MAX       = float(os.getenv("SUPERVISOR_BACKOFF_MAX", "300"))
+SUPERVISOR_JITTER            = float(os.getenv("SUPERVISOR_JITTER", "0.3"))
+SUPERVISOR_BREAKER_THRESHOLD = int(os.getenv("SUPERVISOR_BREAKER_THRESHOLD", "5"))
+SUPERVISOR_BREAKER_COOLDOWN  = float(os.getenv("SUPERVISOR_BREAKER_COOLDOWN", "600"))
+SUPERVISOR_STABLE_AFTER      = float(os.getenv("SUPERVISOR_STABLE_AFTER", "120"))
+SUPERVISOR_MAX_CONNECT       = int(os.getenv("SUPERVISOR_MAX_CONNECT", "2"))
+
+CLOSED    = "closed"
+OPEN      = "open"
+HALF_OPEN = "half_open"
+
+# Dibagi semua channel dalam proses => NVR tidak dibanjiri koneksi baru
+_connect_slots = threading.BoundedSemaphore(max(1, SUPERVISOR_MAX_CONNECT))
+
+
+@contextmanager
+def connect_slot():
+    """
+    Slot reconnect untuk percobaan di luar supervisor (mis. re-validasi background).
+    """
+    with _connect_slots:
+        yield
+
+
+def backoff_delay(failures: int) -> float:
+    if failures <= 0:
+        return 0.0
+    delay = min(SUPERVISOR_BACKOFF_MAX, SUPERVISOR_BACKOFF_BASE * (2 ** (failures - 1)))
+    spread = delay * SUPERVISOR_JITTER
+    return max(0.0, delay + random.uniform(-spread, spread))
+
+
+class ChannelSupervisor:
+    """
+    Alur pemakaian di thread channel:
+
+        sup.wait_turn()              # backoff / tunggu breaker
+        with sup.attempt():          # slot reconnect
+            ... validasi ...
+            sup.connected()          # stream terbuka => slot dilepas
+            ... pipeline (blocking) ...
+        sup.record_failure(reason)   # pipeline keluar / validasi gagal
+
+    sup.healthy() dipanggil berkala dari pipeline; setelah stabil
+    SUPERVISOR_STABLE_AFTER detik, breaker ditutup & hitungan gagal di-reset.
+    """
+    def __init__(self, channel, on_change=None):
+        self.channel      = channel
+        self.state        = CLOSED
+        self.failures     = 0
+        self.opened_at    = None
+        self.next_try_at  = 0.0
+        self.connected_at = None
+        self.last_error   = None
+        self._on_change   = on_change
+        self._has_slot    = False
+
+    # ------------------------------------------------------------------
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        logger.warning("[SUPERVISOR] ch=%s breaker %s -> %s (gagal beruntun=%d)",
+                       self.channel, self.state, state, self.failures)
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.time()
+
+    def _publish(self):
+        if self._on_change is not None:
+            try:
+                self._on_change(self.channel, self.snapshot())
+            except Exception as e:
+                logger.warning("[SUPERVISOR] ch=%s gagal publish => %s", self.channel, e)
+
+    def snapshot(self) -> dict:
+        return {
+            "breaker_state": self.state,
+            "consecutive_failures": self.failures,
+            "next_retry_at": self.next_try_at or None,
+        }
+
+    # ------------------------------------------------------------------
+    def wait_turn(self):
+        """
+        Blok sampai channel boleh mencoba lagi (backoff atau cooldown breaker).
+        """
+        delay = self.next_try_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        if self.state == OPEN:
+            self._set_state(HALF_OPEN)
+            self._publish()
+
+    @contextmanager
+    def attempt(self):
+        _connect_slots.acquire()
+        self._has_slot = True
+        try:
+            yield self
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        if self._has_slot:
+            self._has_slot = False
+            _connect_slots.release()
+
+    def connected(self):
+        """
+        Stream terbuka & pipeline mulai jalan => slot reconnect dilepas.
+        """
+        self.connected_at = time.monotonic()
+        self._release_slot()
+
+    def healthy(self):
+        if self.connected_at is None:
+            return
+        if self.failures == 0 and self.state == CLOSED:
+            return
+        if time.monotonic() - self.connected_at >= SUPERVISOR_STABLE_AFTER:
+            if self.state != CLOSED:
+                logger.info("[SUPERVISOR] ch=%s stabil %.0fs => breaker ditutup",
+                            self.channel, SUPERVISOR_STABLE_AFTER)
+            self.failures = 0
+            self.next_try_at = 0.0
+            self._set_state(CLOSED)
+            self._publish()
+
+    def record_failure(self, reason: str = None) -> float:
+        """
+        Catat kegagalan & jadwalkan percobaan berikutnya. Return delay (detik).
+        """
+        # Pipeline yang sempat stabil lalu putus => mulai backoff dari awal
+        if self.connected_at is not None and \
+                time.monotonic() - self.connected_at >= SUPERVISOR_STABLE_AFTER:
+            self.failures = 0
+            self._set_state(CLOSED)
+        self.connected_at = None
+        self.last_error = reason
+        self.failures += 1
+
+        if self.state == HALF_OPEN or self.failures >= SUPERVISOR_BREAKER_THRESHOLD:
+            self._set_state(OPEN)
+            delay = SUPERVISOR_BREAKER_COOLDOWN * random.uniform(1.0, 1.0 + SUPERVISOR_JITTER)
+        else:
+            delay = backoff_delay(self.failures)
+        self.next_try_at = time.time() + delay
+
+        logger.info("[SUPERVISOR] ch=%s gagal #%d (%s) => retry dalam %.1fs [%s]",
+                    self.channel, self.failures, reason or "-", delay, self.state)
+        self._publish()
+        return delay
+
+
+def summarize(supervisors) -> dict:
+    """
+    {"closed": n, "open": n, "half_open": n, "isolated_channels": [...]}
+    """
+    out = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0, "isolated_channels": []}
+    for ch, sup in sorted(supervisors.items()):
+        out[sup.state] += 1
+        if sup.state != CLOSED:
+            out["isolated_channels"].append(ch)
+    return out
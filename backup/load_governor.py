@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+load_governor.py
+
+Governor beban berbasis CPU & memori (live) untuk pipeline backup.
+
+Level sistem naik satu langkah jika tekanan tinggi bertahan GOVERNOR_RAISE_AFTER detik,
+dan turun satu langkah jika tekanan rendah bertahan GOVERNOR_RESTORE_AFTER detik
+(hysteresis: ambang HIGH untuk naik, ambang LOW untuk turun).
+
+Langkah degradasi per channel (berurutan):
+  1. reduce_fps   => analisis sub-stream diperlambat (FRAME_SKIP x GOVERNOR_FPS_DIVISOR)
+  2. motion_only  => object detection dimatikan, cukup motion
+  3. pause_probes => cek black/freeze dilewati
+  4. pause_hls    => HLS channel boleh dihentikan jika tidak ada viewer
+                     (dieksekusi ffmpeg_manager.py di container stream)
+
+Kelas prioritas menentukan kapan channel ikut terdegradasi:
+  low    => langkah = level
+  normal => langkah = level - 1
+  high   => langkah = level - 2
+sehingga channel prioritas rendah selalu dikorbankan lebih dulu.
+
+Setiap transisi di-log ([GOVERNOR]) dan state dipublikasikan ke GOVERNOR_STATE_PATH.
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import namedtuple, deque
+
+import psutil
+
+sys.path.append("/app/scripts")
+from utils import publish_state
+
+logger = logging.getLogger("Backup-Manager")
+
+GOVERNOR_ENABLE        = os.getenv("GOVERNOR_ENABLE", "true").lower() == "true"
+GOVERNOR_INTERVAL      = float(os.getenv("GOVERNOR_INTERVAL", "2"))
+GOVERNOR_CPU_HIGH      = float(os.getenv("GOVERNOR_CPU_HIGH", "85"))
+GOVERNOR_CPU_LOW       = float(os.getenv("GOVERNOR_CPU_LOW", "65"))
+GOVERNOR_MEM_HIGH      = float(os.getenv("GOVERNOR_MEM_HIGH", "90"))
+GOVERNOR_MEM_LOW       = float(os.getenv("GOVERNOR_MEM_LOW", "80"))
+GOVERNOR_RAISE_AFTER   = float(os.getenv("GOVERNOR_RAISE_AFTER", "10"))
+GOVERNOR_RESTORE_AFTER = float(os.getenv("GOVERNOR_RESTORE_AFTER", "60"))
+GOVERNOR_FPS_DIVISOR   = int(os.getenv("GOVERNOR_FPS_DIVISOR", "3"))
+GOVERNOR_PRIORITY_HIGH = os.getenv("GOVERNOR_PRIORITY_HIGH", "")
+GOVERNOR_PRIORITY_LOW  = os.getenv("GOVERNOR_PRIORITY_LOW", "")
+GOVERNOR_STATE_PATH    = os.getenv("GOVERNOR_STATE_PATH", "/mnt/Data/Syslog/rtsp/load_governor.json")
+GOVERNOR_PUBLISH_EVERY = float(os.getenv("GOVERNOR_PUBLISH_EVERY", "30"))
+
+STEPS           = ("reduce_fps", "motion_only", "pause_probes", "pause_hls")
+PRIORITY_OFFSET = {"low": 0, "normal": 1, "high": 2}
+MAX_LEVEL       = len(STEPS) + PRIORITY_OFFSET["high"]
+
+ChannelPolicy = namedtuple("ChannelPolicy",
+                           "step fps_divisor object_detection health_probes hls_pausable")
+
+
+def parse_channel_set(spec: str) -> set:
+    """
+    "1,2,5-8" => {1, 2, 5, 6, 7, 8}
+    """
+    out = set()
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            if a.strip().isdigit() and b.strip().isdigit():
+                out.update(range(int(a), int(b) + 1))
+        elif part.isdigit():
+            out.add(int(part))
+    return out
+
+
+def policy_for_step(step: int) -> ChannelPolicy:
+    return ChannelPolicy(
+        step=step,
+        fps_divisor=GOVERNOR_FPS_DIVISOR if step >= 1 else 1,
+        object_detection=step < 2,
+        health_probes=step < 3,
+        hls_pausable=step >= 4,
+    )
+
+_POLICIES = [policy_for_step(s) for s in range(len(STEPS) + 1)]
+
+
+class LoadGovernor:
+    """
+    policy(ch) dipanggil dari thread channel (murah, tanpa lock).
+    update(cpu, mem, now) berisi logika hysteresis (dipanggil loop internal).
+    """
+    def __init__(self, channels, state_path: str = None):
+        self.channels   = sorted(int(c) for c in channels)
+        self.state_path = state_path or GOVERNOR_STATE_PATH
+        self.high_set   = parse_channel_set(GOVERNOR_PRIORITY_HIGH)
+        self.low_set    = parse_channel_set(GOVERNOR_PRIORITY_LOW)
+
+        self.level       = 0
+        self.cpu         = 0.0
+        self.mem         = 0.0
+        self.level_since = time.time()
+        self.transitions = deque(maxlen=20)
+
+        self._high_since = None
+        self._low_since  = None
+        self._thread     = None
+        self._last_pub   = 0.0
+
+    # ------------------------------------------------------------------
+    def priority(self, ch) -> str:
+        ch = int(ch)
+        if ch in self.high_set:
+            return "high"
+        if ch in self.low_set:
+            return "low"
+        return "normal"
+
+    def step_for(self, ch) -> int:
+        step = self.level - PRIORITY_OFFSET[self.priority(ch)]
+        return max(0, min(step, len(STEPS)))
+
+    def policy(self, ch) -> ChannelPolicy:
+        return _POLICIES[self.step_for(ch)]
+
+    @property
+    def overloaded(self) -> bool:
+        return self.level > 0
+
+    # ------------------------------------------------------------------
+    def update(self, cpu: float, mem: float, now: float) -> bool:
+        """
+        Return True jika level berubah.
+        """
+        self.cpu, self.mem = cpu, mem
+        high = cpu >= GOVERNOR_CPU_HIGH or mem >= GOVERNOR_MEM_HIGH
+        low  = cpu <= GOVERNOR_CPU_LOW and mem <= GOVERNOR_MEM_LOW
+
+        self._high_since = (self._high_since or now) if high else None
+        self._low_since  = (self._low_since or now) if low else None
+
+        new_level = self.level
+        if high and self.level < MAX_LEVEL and now - self._high_since >= GOVERNOR_RAISE_AFTER:
+            new_level = self.level + 1
+            self._high_since = now      # langkah berikutnya butuh jeda penuh lagi
+        elif low and self.level > 0 and now - self._low_since >= GOVERNOR_RESTORE_AFTER:
+            new_level = self.level - 1
+            self._low_since = now
+
+        if new_level == self.level:
+            return False
+        self._transition(new_level, now)
+        return True
+
+    def _transition(self, new_level: int, now: float):
+        old_steps = {ch: self.step_for(ch) for ch in self.channels}
+        old_level = self.level
+        self.level = new_level
+        self.level_since = time.time()
+
+        changed = {}
+        for ch in self.channels:
+            step = self.step_for(ch)
+            if step != old_steps[ch]:
+                changed[ch] = (STEPS[step - 1] if step else "normal")
+        self.transitions.append({
+            "at": self.level_since, "from": old_level, "to": new_level,
+            "cpu": round(self.cpu, 1), "mem": round(self.mem, 1),
+            "channels": {str(k): v for k, v in changed.items()},
+        })
+        direction = "naik" if new_level > old_level else "turun"
+        log = logger.warning if new_level > old_level else logger.info
+        log("[GOVERNOR] level %s %d -> %d (cpu=%.1f%% mem=%.1f%%) => %s",
+            direction, old_level, new_level, self.cpu, self.mem,
+            ", ".join(f"ch{ch}:{st}" for ch, st in changed.items()) or "tanpa perubahan channel")
+
+    # ------------------------------------------------------------------
+    def snapshot(self) -> dict:
+        return {
+            "level": self.level,
+            "max_level": MAX_LEVEL,
+            "level_since": self.level_since,
+            "cpu_percent": round(self.cpu, 1),
+            "mem_percent": round(self.mem, 1),
+            "thresholds": {
+                "cpu_high": GOVERNOR_CPU_HIGH, "cpu_low": GOVERNOR_CPU_LOW,
+                "mem_high": GOVERNOR_MEM_HIGH, "mem_low": GOVERNOR_MEM_LOW,
+            },
+            "channels": {
+                str(ch): {
+                    "priority": self.priority(ch),
+                    "step": STEPS[self.step_for(ch) - 1] if self.step_for(ch) else "normal",
+                    **self.policy(ch)._asdict(),
+                } for ch in self.channels
+            },
+            "hls_pausable": [ch for ch in self.channels if self.policy(ch).hls_pausable],
+            "transitions": list(self.transitions),
+        }
+
+    def publish(self):
+        try:
+            publish_state(self.state_path, self.snapshot())
+            self._last_pub = time.monotonic()
+        except Exception as e:
+            logger.warning("[GOVERNOR] Gagal publish %s => %s", self.state_path, e)
+
+    # ------------------------------------------------------------------
+    def _run(self):
+        psutil.cpu_percent(interval=None)
+        cpu_avg = None
+        self.publish()
+        while True:
+            time.sleep(GOVERNOR_INTERVAL)
+            try:
+                cpu = psutil.cpu_percent(interval=None)
+                mem = psutil.virtual_memory().percent
+                # EWMA ringan => lonjakan sesaat tidak langsung menaikkan level
+                cpu_avg = cpu if cpu_avg is None else cpu_avg + 0.3 * (cpu - cpu_avg)
+                changed = self.update(cpu_avg, mem, time.monotonic())
+                if changed or time.monotonic() - self._last_pub >= GOVERNOR_PUBLISH_EVERY:
+                    self.publish()
+            except Exception as e:
+                logger.error("[GOVERNOR] loop => %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="load-governor")
+            self._thread.start()
+        return self
@@ -4,7 +4,8 @@ main.py
 
 Menambahkan logic:
  - Re-try pipeline per-channel jika gagal (fail open, black, freeze).
- - Jika persentase channel mati > FAIL_THRESHOLD%, sys.exit(1) => Docker restart.
+ - Tiap channel diawasi ChannelSupervisor (backoff + jitter, circuit breaker,
+   batas reconnect serentak). Channel gagal diisolasi, channel sehat tidak disentuh.
  - Freeze & Blackdetect pakai param durasi, threshold dari ENV.
  - Mendukung mode 'motion_dual' dgn analisis sub-stream, rekam main-stream, 
    dan (opsional) black/freeze juga di sub-stream agar lebih ringan.
@@ -27,9 +28,16 @@ from threading import Lock
 # Pastikan folder scripts ada di PATH
 sys.path.append("/app/scripts")
 
-from utils import decode_credentials
+from utils import decode_credentials, publish_state, StateReader, set_os_thread_name, write_json_atomic
 from motion_detection import MotionDetector
-from backup_manager import BackupSession
+from backup_manager import BackupSession, get_catalog
+from spool import get_spool
+from recorder_watchdog import RecorderWatchdog, RECORD_WATCHDOG_ENABLE
+from state_segment import StateSegment
+from load_governor import LoadGovernor, GOVERNOR_ENABLE, policy_for_step
+from channel_supervisor import ChannelSupervisor, connect_slot, summarize as summarize_supervisors
+from transcode_tier import TranscodeTier, TRANSCODE_ENABLE, TRANSCODE_AFTER_DAYS
+from motion_prune import PRUNE_ENABLE
 
 
 ######################################################
@@ -116,7 +124,6 @@ MAX_RECORD          = int(os.getenv("MAX_RECORD","300"))
 MOTION_TIMEOUT      = int(os.getenv("MOTION_TIMEOUT","5"))
 POST_MOTION_DELAY   = int(os.getenv("POST_MOTION_DELAY","0"))
 CHECK_INTERVAL      = int(os.getenv("CHECK_INTERVAL","60"))
-RESTART_DELAY       = int(os.getenv("RESTART_DELAY","30"))
 
 BLACK_DURATION          = float(os.getenv("BLACK_DURATION","1.0"))
 BLACK_DETECT_THRESHOLD  = float(os.getenv("BLACK_DETECT_THRESHOLD","0.98"))
@@ -137,6 +144,13 @@ MOTION_AREA      = int(os.getenv("MOTION_AREA_THRESHOLD","3000"))
 # Interval re-check freeze/black + update JSON
 IN_PIPELINE_UPDATE_INTERVAL = int(os.getenv("IN_PIPELINE_UPDATE_INTERVAL", "10"))
 
+# Warm start => channel yang validasi terakhirnya sehat & baru langsung merekam
+WARM_START_ENABLE  = (os.getenv("WARM_START_ENABLE","true").lower()=="true")
+WARM_START_MAX_AGE = float(os.getenv("WARM_START_MAX_AGE","300"))
+
+MODEL_PROTOTXT = "/app/backup/models/mobilenet_ssd/MobileNetSSD_deploy.prototxt"
+MODEL_CAFFE    = "/app/backup/models/mobilenet_ssd/MobileNetSSD_deploy.caffemodel"
+
 logger.info("[VALIDATION] BACKUP_MODE=%s", BACKUP_MODE)
 
 
@@ -157,15 +171,25 @@ def load_validation_status():
         return {}
 
 def save_validation_status(data: dict):
-    tmp_path = VALIDATION_JSON + ".tmp"
+    # File temp unik => writer lain (thread / container) tidak menimpa .tmp yang sama
     try:
-        with open(tmp_path, "w") as f:
-            json.dump(data, f, indent=2)
-        os.replace(tmp_path, VALIDATION_JSON)
+        write_json_atomic(VALIDATION_JSON, data)
     except Exception as e:
         logger.warning("Gagal menulis %s => %s", VALIDATION_JSON, e)
 
+# Segmen state biner (tmpfs bersama) => salinan status channel yang dibaca lock-free
+try:
+    state_segment = StateSegment(writer=True)
+except OSError as e:
+    state_segment = None
+    logger.warning("[VALIDATION] State segment tidak tersedia => %s", e)
+
 def update_validation_status(channel, info: dict):
+    if state_segment is not None:
+        try:
+            state_segment.write_channel(channel, info)
+        except (IndexError, ValueError) as e:
+            logger.warning("[VALIDATION] State segment ch%s => %s", channel, e)
     with validation_lock:
         data = load_validation_status()
         cstr = str(channel)
@@ -184,9 +208,11 @@ def get_inactive_count(channels):
             cnt += 1
     return cnt
 
-def check_restart_if_too_many_fail(channels):
+def check_fail_ratio(channels):
     """
-    Jika persentase channel yang is_active=false >= FAIL_THRESHOLD_PCT => sys.exit(1)
+    Jika persentase channel yang is_active=false >= FAIL_THRESHOLD_PCT => log peringatan
+    (kemungkinan masalah NVR/jaringan). Container TIDAK di-restart: channel gagal
+    ditangani supervisor masing-masing, channel sehat tetap merekam.
     """
     total = len(channels)
     if total <= 0:
@@ -194,15 +220,165 @@ def check_restart_if_too_many_fail(channels):
     inact = get_inactive_count(channels)
     pct   = (inact / total) * 100.0
     if pct >= FAIL_THRESHOLD_PCT:
-        logger.warning("[Main] %d/%d (%.1f%%) channel inactive >= threshold=%.1f => restart container!",
-                       inact, total, pct, FAIL_THRESHOLD_PCT)
-        sys.exit(1)
+        summary = summarize_supervisors(supervisors)
+        logger.warning("[Main] %d/%d (%.1f%%) channel inactive >= threshold=%.1f => "
+                       "breaker open=%d half_open=%d (channel %s)",
+                       inact, total, pct, FAIL_THRESHOLD_PCT,
+                       summary["open"], summary["half_open"], summary["isolated_channels"])
+
+
+######################################################
+# 3b. Load governor (load_governor.py)
+######################################################
+governor = None   # diisi run_pipeline_loop
+
+def channel_policy(ch):
+    """
+    Kebijakan degradasi channel saat ini (normal jika governor nonaktif).
+    """
+    if governor is None:
+        return policy_for_step(0)
+    return governor.policy(ch)
+
+def current_cpu_usage(config) -> float:
+    # CPU live dari governor; fallback sample saat startup
+    if governor is not None and GOVERNOR_ENABLE:
+        return governor.cpu
+    return config.get("cpu_usage", 0.0)
+
+def monitor_cpu_percent():
+    """
+    CPU sistem dari resource monitor (segmen state); fallback governor jika
+    monitor tidak jalan / datanya basi. None => tidak diketahui.
+    """
+    if state_segment is not None:
+        res = state_segment.read_resource()
+        if res and time.time() - res["updated_at"] < 60:
+            return res["cpu_percent"]
+    if governor is not None and GOVERNOR_ENABLE:
+        return governor.cpu
+    return None
+
+
+######################################################
+# 3c. Channel supervisor (channel_supervisor.py)
+######################################################
+supervisors = {}   # {ch: ChannelSupervisor}, diisi run_pipeline_loop
+
+def channel_connected(ch):
+    # Stream channel terbuka => slot reconnect NVR dilepas untuk channel lain
+    sup = supervisors.get(ch)
+    if sup is not None:
+        sup.connected()
+    mark_startup(ch, "ready_s")
+
+def channel_healthy(ch):
+    sup = supervisors.get(ch)
+    if sup is not None:
+        sup.healthy()
+
+
+######################################################
+# 3d. Warm start & waktu startup
+######################################################
+BOOT_TIME      = time.time()
+warm_channels  = set()   # channel yang boleh langsung merekam saat boot
+pipeline_abort = {}      # {ch: Event} => set oleh re-validasi background yang gagal
+startup_times  = {}      # {ch: {"warm_start": bool, "ready_s": .., "first_record_s": ..}}
+startup_lock   = Lock()
+
+def load_warm_channels(channels) -> set:
+    """
+    Channel dengan validasi terakhir sehat (is_active, tidak black/freeze, tanpa error,
+    breaker closed) dan last_update <= WARM_START_MAX_AGE detik lalu.
+    Harus dipanggil sebelum thread channel menandai is_active=false.
+    """
+    if not WARM_START_ENABLE:
+        return set()
+    data = load_validation_status()
+    now  = datetime.now()
+    out  = set()
+    for ch in channels:
+        st = data.get(str(ch), {})
+        try:
+            age = (now - datetime.fromisoformat(st.get("last_update", ""))).total_seconds()
+        except (TypeError, ValueError):
+            continue
+        healthy = (st.get("is_active") and st.get("freeze_ok") is not False
+                   and st.get("black_ok") is not False and not st.get("error_msg")
+                   and st.get("breaker_state", "closed") == "closed")
+        if healthy and 0 <= age <= WARM_START_MAX_AGE:
+            out.add(ch)
+    return out
+
+def mark_startup(ch, event: str):
+    """
+    Catat detik sejak boot untuk event startup pertama channel (sekali per event).
+    ready_s        => stream terbuka, pipeline siap merekam
+    first_record_s => byte pertama rekaman tertulis ke disk
+    """
+    with startup_lock:
+        entry = startup_times.setdefault(ch, {"warm_start": ch in warm_channels})
+        if event in entry:
+            return
+        entry[event] = round(time.time() - BOOT_TIME, 2)
+        snapshot = dict(entry)
+    logger.info("[EVENT] [STARTUP] ch=%s %s=%.2fs (warm_start=%s)",
+                ch, event, snapshot[event], snapshot["warm_start"])
+    update_validation_status(ch, {"startup": snapshot})
+
+def first_record_pending(ch) -> bool:
+    with startup_lock:
+        return "first_record_s" not in startup_times.get(ch, {})
+
+def log_startup_summary(channels) -> bool:
+    """
+    Ringkasan sekali setelah semua channel siap. Return True jika sudah dicetak.
+    """
+    with startup_lock:
+        ready = {ch: startup_times[ch]["ready_s"] for ch in channels
+                 if "ready_s" in startup_times.get(ch, {})}
+    if len(ready) < len(channels):
+        return False
+    warm = [ready[ch] for ch in channels if ch in warm_channels]
+    cold = [ready[ch] for ch in channels if ch not in warm_channels]
+    logger.info("[EVENT] [STARTUP] semua channel siap => warm=%d (max %.2fs) cold=%d (max %.2fs)",
+                len(warm), max(warm, default=0.0), len(cold), max(cold, default=0.0))
+    return True
+
+def backfill_catalog(catalog):
+    t0 = time.monotonic()
+    try:
+        added = catalog.backfill()
+        logger.info("[EVENT] [CATALOG] backfill selesai => %d file dalam %.1fs",
+                    added, time.monotonic() - t0)
+    except Exception as e:
+        logger.error("[CATALOG] backfill gagal => %s", e)
+
+def preload_object_model():
+    from object_detection import preload_global_net
+    took = preload_global_net(MODEL_PROTOTXT, MODEL_CAFFE)
+    if took is None:
+        logger.warning("[EVENT] [STARTUP] preload model object detection gagal")
+    else:
+        logger.info("[EVENT] [STARTUP] model object detection siap dalam %.2fs", took)
+
+
+######################################################
+# 3e. Recorder watchdog (recorder_watchdog.py)
+######################################################
+def recorder_metrics_changed(ch, metrics: dict):
+    # Metrik gap recorder per channel => channel_validation.json ("recorder")
+    update_validation_status(ch, {"recorder": metrics})
+
+recorder_watchdog = RecorderWatchdog(on_metrics=recorder_metrics_changed)
 
 
 ######################################################
 # 4. Pastikan JSON resource
 ######################################################
 MONITOR_STATE_FILE = "/mnt/Data/Syslog/resource/resource_monitor_state.json"
+resource_state     = StateReader(MONITOR_STATE_FILE)
 
 def ensure_json_initialized():
     if not os.path.exists(MONITOR_STATE_FILE):
@@ -219,16 +395,17 @@ def ensure_json_initialized():
             "stream_config": scfg,
             "rtsp_config":   rcfg
         }
-        with open(MONITOR_STATE_FILE,"w") as f:
-            json.dump(init_data,f,indent=2)
+        publish_state(MONITOR_STATE_FILE, init_data)
     else:
         logger.info("[VALIDATION] File %s sudah ada, skip init.", MONITOR_STATE_FILE)
 
 def load_resource_config():
     config = {}
     try:
-        with open(MONITOR_STATE_FILE,"r") as f:
-            j = json.load(f)
+        # Versi sama => tanpa parse ulang; torn read => dokumen valid terakhir
+        j = resource_state.read()
+        if j is None:
+            raise FileNotFoundError(MONITOR_STATE_FILE)
         usage = j.get("resource_usage",{}).get("cpu",{}).get("usage_percent",0.0)
         config["cpu_usage"] = float(usage)
 
@@ -381,31 +558,51 @@ def pipeline_motion_dual(ch, config, main_url, with_object=False):
     if with_object:
         from object_detection import ObjectDetector
         obj_det = ObjectDetector(
-            "/app/backup/models/mobilenet_ssd/MobileNetSSD_deploy.prototxt",
-            "/app/backup/models/mobilenet_ssd/MobileNetSSD_deploy.caffemodel",
+            MODEL_PROTOTXT,
+            MODEL_CAFFE,
             conf_person=float(os.getenv("CONF_PERSON","0.6")),
             conf_car=float(os.getenv("CONF_CAR","0.4")),
             conf_motor=float(os.getenv("CONF_MOTOR","0.4"))
         )
 
     # Merekam main_url
-    sess = BackupSession(main_url, ch, config["stream_title"])
+    sess = BackupSession(main_url, ch, config["stream_title"], trigger="motion")
+    if RECORD_WATCHDOG_ENABLE:
+        recorder_watchdog.register(sess)
+    channel_connected(ch)
     is_recording = False
     last_motion = 0
     frame_count = 0
 
     next_recheck = time.time() + IN_PIPELINE_UPDATE_INTERVAL
+    abort = pipeline_abort.get(ch)
+    pending_first = None   # file rekaman pertama sejak boot, menunggu byte pertama
 
     while True:
-        ret, frame = cap_sub.read()
-        if not ret or frame is None:
-            time.sleep(1)
-            continue
+        # Warm start => re-validasi background gagal => pipeline dihentikan
+        if abort is not None and abort.is_set():
+            sess.stop_recording()
+            raise Exception("re-validasi warm start gagal (black/freeze)")
+
+        if pending_first and os.path.isfile(pending_first) and os.path.getsize(pending_first) > 0:
+            mark_startup(ch, "first_record_s")
+            pending_first = None
+
+        policy = channel_policy(ch)
+        skip = FRAME_SKIP * policy.fps_divisor
 
         frame_count += 1
-        if frame_count % FRAME_SKIP != 0:
+        if frame_count % skip != 0:
+            # Frame yang tidak dianalisis cukup di-grab (tanpa konversi ke BGR)
+            if not cap_sub.grab():
+                time.sleep(1)
             time.sleep(MOTION_SLEEP)
         else:
+            ret, frame = cap_sub.read()
+            if not ret or frame is None:
+                time.sleep(1)
+                continue
+
             # downscale
             if DOWNSCALE_RATIO < 1.0:
                 try:
@@ -421,7 +618,8 @@ def pipeline_motion_dual(ch, config, main_url, with_object=False):
             bboxes = motion_det.detect(frame_small)
             motion_found=False
             if bboxes:
-                if with_object and obj_det:
+                # Governor step motion_only => object detection dilewati
+                if with_object and obj_det and policy.object_detection:
                     results,_ = obj_det.detect(frame_small)
                     person_found = any(r[0]=="person" for r in results)
                     if person_found:
@@ -432,13 +630,15 @@ def pipeline_motion_dual(ch, config, main_url, with_object=False):
             if motion_found:
                 last_motion = time.time()
                 if not is_recording:
-                    sess.start_recording()
+                    detected_by_object = with_object and obj_det and policy.object_detection
+                    sess.start_recording(trigger="object" if detected_by_object else "motion")
                     is_recording=True
+                    if first_record_pending(ch):
+                        pending_first = sess.file_path
                 else:
                     # rolling
                     if not sess.still_ok(MAX_RECORD):
-                        sess.stop_recording()
-                        sess.start_recording()
+                        sess.rollover()
             else:
                 if is_recording:
                     idle_sec = time.time()-last_motion
@@ -449,9 +649,9 @@ def pipeline_motion_dual(ch, config, main_url, with_object=False):
         # Re-check freeze/black + update JSON => tapi check di sub-stream 
         # (supaya CPU lebih ringan)
         if time.time() >= next_recheck:
-            cpu_usage = config.get("cpu_usage", 0.0)
-            do_black  = ENABLE_BLACKOUT
-            do_freeze = ENABLE_FREEZE_CHECK
+            cpu_usage = current_cpu_usage(config)
+            do_black  = ENABLE_BLACKOUT and policy.health_probes
+            do_freeze = ENABLE_FREEZE_CHECK and policy.health_probes
 
             # DIUBAH => check black/freeze di sub_url
             ok_black  = check_black_frames(sub_url, do_black)
@@ -476,6 +676,7 @@ def pipeline_motion_dual(ch, config, main_url, with_object=False):
                 "error_msg": None
             })
 
+            channel_healthy(ch)
             next_recheck = time.time() + IN_PIPELINE_UPDATE_INTERVAL
 
         time.sleep(MOTION_SLEEP)
@@ -508,12 +709,14 @@ def thread_for_channel(ch, config):
     # Sama seperti versi sebelumnya, 
     # tapi hati-hati => "motion_dual" kini check sub_url di pipeline
 
+    # Nama thread OS => CPU analisis (dan thread decoder turunannya) teratribusi ke channel
+    set_os_thread_name(f"ch{ch}-analysis")
+    sup = supervisors[ch]
+    warm = ch in warm_channels
+
     while True:
-        # Mark is_active=false
-        update_validation_status(ch, {
-            "is_active": False,
-            "recording": False
-        })
+        # Backoff / breaker open => channel ini menunggu, channel lain tidak terpengaruh
+        sup.wait_turn()
 
         user = config["rtsp_user"]
         pwd  = config["rtsp_password"]
@@ -523,112 +726,172 @@ def thread_for_channel(ch, config):
         masked_url = mask_rtsp_credentials(raw_url)
         logger.info("[EVENT] [Main] ch=%s => %s", ch, masked_url)
 
-        cpu_usage = config["cpu_usage"]
-        do_black  = ENABLE_BLACKOUT
-        do_freeze = ENABLE_FREEZE_CHECK
-
-        global LAST_CHECK_TIMES
-        now = time.time()
-        last_chk = LAST_CHECK_TIMES.get(ch, 0)
-        interval = now - last_chk
-
-        # Skip freeze/black check if interval<FREEZE_BLACK_INTERVAL
-        if FREEZE_BLACK_INTERVAL>0 and interval < FREEZE_BLACK_INTERVAL:
-            ok_black  = True
-            ok_freeze = True
-            logger.info("[VALIDATION] ch=%s => skip freeze/black => interval=%.1f < %d",
-                        ch, interval, FREEZE_BLACK_INTERVAL)
+        abort = pipeline_abort[ch] = threading.Event()
+        if warm:
+            # Warm start (hanya percobaan pertama setelah boot): langsung merekam,
+            # black/freeze dicek ulang di background
+            warm = False
+            logger.info("[VALIDATION] ch=%s => warm start => re-validasi di background", ch)
+            update_validation_status(ch, {"is_active": True, "recording": False, "error_msg": None})
+            threading.Thread(target=revalidate_in_background,
+                             args=(ch, config, raw_url, masked_url, abort),
+                             daemon=True, name=f"ch{ch}-revalidate").start()
+            # Tetap lewat slot reconnect NVR => saat boot channel warm tidak membuka
+            # stream bersamaan; slot dilepas channel_connected() begitu stream terbuka
+            with sup.attempt():
+                failure = run_channel_pipeline(ch, config, raw_url)
         else:
-            LAST_CHECK_TIMES[ch] = now
-            if cpu_usage>90:
-                do_black=False
-                logger.info("[VALIDATION] ch=%s => CPU>90 => skip blackdetect", ch)
-
-            ok_black = check_black_frames(raw_url, do_black)
-            if not ok_black:
-                masked_err = f"ch={ch} => black => skip => {masked_url}"
-                logger.warning("[VALIDATION] %s", masked_err)
-                update_validation_status(ch, {
-                    "freeze_ok": None,
-                    "black_ok": False,
-                    "livestream_link": masked_url,
-                    "error_msg": masked_err,
-                    "is_active": False,
-                    "recording": False
-                })
-                # cek fail persentase
-                check_restart_if_too_many_fail(range(1, int(os.getenv("CHANNEL_COUNT","1"))+1))
-                time.sleep(RESTART_DELAY)
-                continue
+            # Mark is_active=false
+            update_validation_status(ch, {
+                "is_active": False,
+                "recording": False
+            })
 
-            if do_freeze:
-                ok_freeze = check_freeze_frames(raw_url, True, cpu_usage)
-                if not ok_freeze:
-                    masked_err = f"ch={ch} => freeze => skip => {masked_url}"
-                    logger.warning("[VALIDATION] %s", masked_err)
-                    update_validation_status(ch, {
-                        "freeze_ok": False,
-                        "black_ok":  ok_black,
-                        "livestream_link": masked_url,
-                        "error_msg": masked_err,
-                        "is_active": False,
-                        "recording": False
-                    })
-                    check_restart_if_too_many_fail(range(1, int(os.getenv("CHANNEL_COUNT","1"))+1))
-                    time.sleep(RESTART_DELAY)
-                    continue
-            else:
-                ok_freeze = True
+            # Slot reconnect NVR dipegang selama validasi + buka stream
+            with sup.attempt():
+                failure = validate_channel(ch, config, raw_url, masked_url)
+                if failure is None:
+                    failure = run_channel_pipeline(ch, config, raw_url)
 
-        # freeze/black pass => is_active=true
+        # pipeline exit => is_active false
         update_validation_status(ch, {
-            "freeze_ok": ok_freeze,
-            "black_ok":  ok_black,
-            "livestream_link": masked_url,
-            "error_msg": None,
-            "is_active": True,
+            "is_active": False,
             "recording": False
         })
+        sup.record_failure(failure)
 
-        # pipeline
-        try:
-            if   BACKUP_MODE=="full":
-                pipeline_full(ch, config, raw_url)
-            elif BACKUP_MODE=="motion":
-                pipeline_motion(ch, config, raw_url, object_detection=False)
-            elif BACKUP_MODE=="motion_obj":
-                pipeline_motion(ch, config, raw_url, object_detection=True)
-            elif BACKUP_MODE=="motion_dual":
-                # Gunakan pipeline_motion_dual yg sdh diubah => black/freeze check di sub_url
-                pipeline_motion_dual(ch, config, raw_url, with_object=False)
-            elif BACKUP_MODE=="motion_obj_dual":
-                pipeline_motion_dual(ch, config, raw_url, with_object=True)
-            else:
-                logger.warning("[VALIDATION] BACKUP_MODE=%s unknown => fallback full", BACKUP_MODE)
-                pipeline_full(ch, config, raw_url)
-        except Exception as e:
-            logger.error("[Main] pipeline error ch=%s => %s", ch, e)
+        # cek fail persentase (log saja, tanpa restart container)
+        check_fail_ratio(range(1, int(os.getenv("CHANNEL_COUNT","1"))+1))
+
+
+def revalidate_in_background(ch, config, raw_url, masked_url, abort):
+    """
+    Re-validasi channel warm start (memakai slot reconnect NVR yang sama).
+    Gagal => abort di-set => pipeline channel berhenti & masuk jalur retry supervisor.
+    """
+    set_os_thread_name(f"ch{ch}-probe")
+    with connect_slot():
+        failure = validate_channel(ch, config, raw_url, masked_url, background=True)
+    if failure is not None:
+        logger.warning("[VALIDATION] ch=%s => re-validasi warm start gagal (%s)", ch, failure)
+        abort.set()
+
+
+def validate_channel(ch, config, raw_url, masked_url, background=False):
+    """
+    Cek black/freeze sebelum pipeline. Return None jika lolos, atau alasan gagal.
+    background=True => pipeline sudah jalan (warm start), status recording tidak disentuh.
+    """
+    cpu_usage = current_cpu_usage(config)
+    do_black  = ENABLE_BLACKOUT
+    do_freeze = ENABLE_FREEZE_CHECK
+    if not channel_policy(ch).health_probes:
+        do_black = do_freeze = False
+        logger.info("[VALIDATION] ch=%s => governor pause_probes => skip black/freeze", ch)
+
+    global LAST_CHECK_TIMES
+    now = time.time()
+    last_chk = LAST_CHECK_TIMES.get(ch, 0)
+    interval = now - last_chk
+
+    # Skip freeze/black check if interval<FREEZE_BLACK_INTERVAL
+    if FREEZE_BLACK_INTERVAL>0 and interval < FREEZE_BLACK_INTERVAL:
+        ok_black  = True
+        ok_freeze = True
+        logger.info("[VALIDATION] ch=%s => skip freeze/black => interval=%.1f < %d",
+                    ch, interval, FREEZE_BLACK_INTERVAL)
+    else:
+        LAST_CHECK_TIMES[ch] = now
+        if cpu_usage>90:
+            do_black=False
+            logger.info("[VALIDATION] ch=%s => CPU>90 => skip blackdetect", ch)
+
+        ok_black = check_black_frames(raw_url, do_black)
+        if not ok_black:
+            masked_err = f"ch={ch} => black => skip => {masked_url}"
+            logger.warning("[VALIDATION] %s", masked_err)
             update_validation_status(ch, {
+                "freeze_ok": None,
+                "black_ok": False,
+                "livestream_link": masked_url,
+                "error_msg": masked_err,
                 "is_active": False,
-                "recording": False,
-                "error_msg": f"{e}"
+                "recording": False
             })
+            return "black"
 
-        # pipeline exit => is_active false
+        if do_freeze:
+            ok_freeze = check_freeze_frames(raw_url, True, cpu_usage)
+            if not ok_freeze:
+                masked_err = f"ch={ch} => freeze => skip => {masked_url}"
+                logger.warning("[VALIDATION] %s", masked_err)
+                update_validation_status(ch, {
+                    "freeze_ok": False,
+                    "black_ok":  ok_black,
+                    "livestream_link": masked_url,
+                    "error_msg": masked_err,
+                    "is_active": False,
+                    "recording": False
+                })
+                return "freeze"
+        else:
+            ok_freeze = True
+
+    # freeze/black pass => is_active=true
+    info = {
+        "freeze_ok": ok_freeze,
+        "black_ok":  ok_black,
+        "livestream_link": masked_url,
+        "error_msg": None,
+        "is_active": True,
+    }
+    if not background:
+        info["recording"] = False
+    update_validation_status(ch, info)
+    return None
+
+
+def run_channel_pipeline(ch, config, raw_url):
+    """
+    Jalankan pipeline sesuai BACKUP_MODE (blocking). Return alasan keluar.
+    """
+    try:
+        if   BACKUP_MODE=="full":
+            pipeline_full(ch, config, raw_url)
+        elif BACKUP_MODE=="motion":
+            pipeline_motion(ch, config, raw_url, object_detection=False)
+        elif BACKUP_MODE=="motion_obj":
+            pipeline_motion(ch, config, raw_url, object_detection=True)
+        elif BACKUP_MODE=="motion_dual":
+            # Gunakan pipeline_motion_dual yg sdh diubah => black/freeze check di sub_url
+            pipeline_motion_dual(ch, config, raw_url, with_object=False)
+        elif BACKUP_MODE=="motion_obj_dual":
+            pipeline_motion_dual(ch, config, raw_url, with_object=True)
+        else:
+            logger.warning("[VALIDATION] BACKUP_MODE=%s unknown => fallback full", BACKUP_MODE)
+            pipeline_full(ch, config, raw_url)
+    except Exception as e:
+        logger.error("[Main] pipeline error ch=%s => %s", ch, e)
         update_validation_status(ch, {
             "is_active": False,
-            "recording": False
+            "recording": False,
+            "error_msg": f"{e}"
         })
-        logger.info("[VALIDATION] ch=%s => pipeline exit => re-try in %ds", ch, RESTART_DELAY)
-
-        # cek fail persentase
-        check_restart_if_too_many_fail(range(1, int(os.getenv("CHANNEL_COUNT","1"))+1))
-        time.sleep(RESTART_DELAY)
+        return f"{e}"
+    logger.info("[VALIDATION] ch=%s => pipeline exit", ch)
+    return "pipeline exit"
 
 
 ######################################################
 # 9. run_pipeline_loop
 ######################################################
+def start_motion_prune():
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "motion_prune.py")
+    proc = subprocess.Popen([sys.executable, script, "daemon"])
+    logger.info("[EVENT] [Main] motion_prune daemon pid=%d", proc.pid)
+    return proc
+
+
 def run_pipeline_loop():
     test_ch    = os.getenv("TEST_CHANNEL","off").lower()
     chan_count = int(os.getenv("CHANNEL_COUNT","1"))
@@ -640,14 +903,70 @@ def run_pipeline_loop():
 
     config = load_resource_config()
 
+    # Governor => degradasi bertahap per prioritas saat CPU/memori tinggi
+    global governor
+    governor = LoadGovernor(channels)
+    if GOVERNOR_ENABLE:
+        governor.start()
+        logger.info("[EVENT] [Main] Load governor aktif => state %s", governor.state_path)
+
+    # Supervisor per channel => status breaker ikut ditulis ke channel_validation.json
+    for c in channels:
+        supervisors[c] = ChannelSupervisor(c, on_change=update_validation_status)
+
+    # Warm start => dibaca sebelum thread channel menandai is_active=false
+    warm_channels.update(load_warm_channels(channels))
+    logger.info("[EVENT] [STARTUP] warm start => %d/%d channel %s",
+                len(warm_channels), len(channels), sorted(warm_channels))
+
+    # Katalog rekaman => impor sekali rekaman lama (sebelum katalog ada) di background
+    catalog = get_catalog()
+    if catalog is not None and not catalog.backfilled:
+        threading.Thread(target=backfill_catalog, args=(catalog,), daemon=True,
+                         name="catalog-backfill").start()
+
+    # Watchdog recorder => ffmpeg mati / output macet di-restart segera
+    if RECORD_WATCHDOG_ENABLE:
+        recorder_watchdog.start()
+
+    # Spool lokal => sisa file dari run sebelumnya diantrikan dulu, lalu worker transfer jalan
+    spool = get_spool(catalog)
+    if spool is not None:
+        spool.recover()
+        spool.start()
+        logger.info("[EVENT] [Main] Spool lokal aktif => %s -> %s", spool.spool_dir, spool.backup_root)
+
+    # Tier transcode => rekaman lama di-encode ulang (nice/ionice, dalam budget CPU)
+    if TRANSCODE_ENABLE and catalog is not None:
+        TranscodeTier(catalog, monitor_cpu_percent).start()
+        logger.info("[EVENT] [Main] Transcode tier aktif => rekaman > %s hari", TRANSCODE_AFTER_DAYS)
+
+    # Pruning chunk mode full tanpa gerakan => proses terpisah (process pool sendiri)
+    prune_proc = start_motion_prune() if PRUNE_ENABLE and catalog is not None else None
+
+    # Model object detection dimuat paralel dengan koneksi channel
+    if BACKUP_MODE in ("motion_obj", "motion_obj_dual"):
+        threading.Thread(target=preload_object_model, daemon=True, name="model-preload").start()
+
     # spawn threads
     for c in channels:
         t = threading.Thread(target=thread_for_channel, args=(c,config), daemon=True)
         t.start()
 
+    startup_logged = False
     while LOOP_ENABLE:
         logger.info("[EVENT] [Main] pipeline threads running => sleep %d sec", CHECK_INTERVAL)
         time.sleep(CHECK_INTERVAL)
+        if not startup_logged:
+            startup_logged = log_startup_summary(channels)
+        if prune_proc is not None and prune_proc.poll() is not None:
+            logger.warning("[EVENT] [Main] motion_prune keluar (rc=%s) => dijalankan ulang",
+                           prune_proc.returncode)
+            prune_proc = start_motion_prune()
+        summary = summarize_supervisors(supervisors)
+        if summary["isolated_channels"]:
+            logger.info("[EVENT] [Main] breaker open=%d half_open=%d => channel %s",
+                        summary["open"], summary["half_open"], summary["isolated_channels"])
         # reload config jika diperlukan
         # config = load_resource_config()
 
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+motion_prune.py
+
+Pruning rekaman mode full berdasarkan indeks gerakan (offline).
+
+BACKUP_MODE=full menyimpan semua chunk sampai folder harinya dihapus, termasuk
+berjam-jam rekaman kosong di malam hari. Pass ini:
+
+- Menilai setiap chunk (trigger "full" di katalog rekaman) setelah PRUNE_AFTER_DAYS hari:
+  ffmpeg hanya men-decode keyframe (-skip_frame nokey), diperkecil & grayscale,
+  lalu dianalisis ala MotionDetector (MOG2 -> morph open/close -> kontur >= area).
+  Jauh lebih cepat dari real time karena frame non-key tidak pernah di-decode.
+- Penilaian berjalan di process pool (PRUNE_WORKERS, nice + ionice idle) => tidak
+  bersaing dengan GIL / thread rekaman.
+- Keputusan per chunk (urut waktu per channel):
+    activity >= PRUNE_MIN_MOTION_FRAMES            => simpan
+    tidak ada chunk tersimpan PRUNE_KEEPALIVE_MINUTES terakhir => simpan (keep-alive)
+    selain itu                                     => hapus (file + baris katalog)
+- Skor disimpan di kolom activity katalog (chunk tidak dinilai dua kali).
+- Laporan (ruang yang dibebaskan, throughput analisis "x real time") dipublikasikan
+  ke PRUNE_REPORT_PATH.
+
+Dijalankan sebagai proses terpisah (main.py menjalankan `motion_prune.py daemon` jika
+PRUNE_ENABLE=true) agar process pool tidak di-fork dari proses rekaman yang multi-thread.
+
+CLI:
+  python3 motion_prune.py run [--dry-run]   # satu putaran
+  python3 motion_prune.py score <file>      # skor satu file (debug)
+  python3 motion_prune.py daemon            # loop tiap PRUNE_INTERVAL
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.append("/app/scripts")
+from utils import publish_state
+from recording_catalog import RecordingCatalog
+from recording_index import remove_index
+from state_segment import StateSegment
+
+logger = logging.getLogger("Backup-Manager")
+
+PRUNE_ENABLE            = os.getenv("PRUNE_ENABLE", "false").lower() == "true"
+PRUNE_AFTER_DAYS        = float(os.getenv("PRUNE_AFTER_DAYS", "1"))
+PRUNE_WORKERS           = max(1, int(os.getenv("PRUNE_WORKERS", "2")))
+PRUNE_BATCH             = int(os.getenv("PRUNE_BATCH", "20"))
+PRUNE_SAMPLE_INTERVAL   = float(os.getenv("PRUNE_SAMPLE_INTERVAL", "2"))
+PRUNE_WIDTH             = int(os.getenv("PRUNE_WIDTH", "320"))
+PRUNE_HEIGHT            = int(os.getenv("PRUNE_HEIGHT", "180"))
+PRUNE_HISTORY           = int(os.getenv("PRUNE_HISTORY", "20"))
+PRUNE_WARMUP_FRAMES     = int(os.getenv("PRUNE_WARMUP_FRAMES", "3"))
+PRUNE_AREA_THRESHOLD    = int(os.getenv("PRUNE_AREA_THRESHOLD", "150"))
+PRUNE_MIN_MOTION_FRAMES = int(os.getenv("PRUNE_MIN_MOTION_FRAMES", "2"))
+PRUNE_KEEPALIVE_MINUTES = float(os.getenv("PRUNE_KEEPALIVE_MINUTES", "60"))
+PRUNE_INCLUDE_UNTAGGED  = os.getenv("PRUNE_INCLUDE_UNTAGGED", "false").lower() == "true"
+PRUNE_CPU_BUDGET        = float(os.getenv("PRUNE_CPU_BUDGET", "70"))
+PRUNE_NICE              = int(os.getenv("PRUNE_NICE", "15"))
+PRUNE_INTERVAL          = float(os.getenv("PRUNE_INTERVAL", "600"))
+PRUNE_REPORT_PATH       = os.getenv("PRUNE_REPORT_PATH", "/mnt/Data/Syslog/rtsp/motion_prune.json")
+
+MOTION_VARTH = int(os.getenv("MOTION_VARTH", "16"))
+
+SCORE_TIMEOUT = 600
+
+
+###############################################################################
+# 1. Skor gerakan (dijalankan di proses worker)
+###############################################################################
+def _init_worker():
+    try:
+        os.nice(PRUNE_NICE)
+    except OSError:
+        pass
+    if shutil.which("ionice"):
+        subprocess.run(["ionice", "-c", "3", "-p", str(os.getpid())], check=False,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Satu proses = satu core; paralelisme dari jumlah worker
+    cv2.setNumThreads(1)
+
+
+def keyframe_cmd(path: str) -> list:
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-skip_frame", "nokey", "-i", path,
+        "-an", "-vsync", "0",
+        "-vf", f"fps=1/{PRUNE_SAMPLE_INTERVAL:g},scale={PRUNE_WIDTH}:{PRUNE_HEIGHT}",
+        "-pix_fmt", "gray", "-f", "rawvideo", "pipe:1",
+    ]
+
+
+def score_recording(path: str) -> dict:
+    """
+    Return {"path", "frames", "motion_frames", "max_area", "error"}.
+    """
+    out = {"path": path, "frames": 0, "motion_frames": 0, "max_area": 0, "error": None}
+    frame_size = PRUNE_WIDTH * PRUNE_HEIGHT
+    back_sub = cv2.createBackgroundSubtractorMOG2(history=PRUNE_HISTORY,
+                                                  varThreshold=MOTION_VARTH, detectShadows=False)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    # stderr ke file sementara (bukan PIPE): ffmpeg yang banyak log (file korup) tidak
+    # tertahan pipe penuh selagi worker menunggu stdout
+    err_file = tempfile.TemporaryFile()
+    try:
+        proc = subprocess.Popen(keyframe_cmd(path), stdout=subprocess.PIPE, stderr=err_file)
+    except OSError as e:
+        err_file.close()
+        out["error"] = str(e)
+        return out
+
+    # Deadline keras: timer membunuh ffmpeg => read() di bawah selesai (EOF)
+    timed_out = threading.Event()
+    def _expire():
+        timed_out.set()
+        proc.kill()
+    timer = threading.Timer(SCORE_TIMEOUT, _expire)
+    timer.daemon = True
+    timer.start()
+    try:
+        while True:
+            buf = proc.stdout.read(frame_size)
+            if len(buf) < frame_size:
+                break
+            frame = np.frombuffer(buf, dtype=np.uint8).reshape(PRUNE_HEIGHT, PRUNE_WIDTH)
+            fg_mask = back_sub.apply(frame)
+            out["frames"] += 1
+            if out["frames"] <= PRUNE_WARMUP_FRAMES:
+                continue
+            fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN,  kernel)
+            fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
+            contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            area = max((cv2.contourArea(c) for c in contours), default=0)
+            out["max_area"] = max(out["max_area"], int(area))
+            if area >= PRUNE_AREA_THRESHOLD:
+                out["motion_frames"] += 1
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        err_file.seek(0)
+        err = err_file.read().decode(errors="replace").strip()
+        err_file.close()
+    if timed_out.is_set():
+        out["error"] = f"timeout {SCORE_TIMEOUT}s"
+    elif out["error"] is None and out["frames"] == 0:
+        out["error"] = err.splitlines()[-1] if err else "tidak ada keyframe"
+    return out
+
+
+###############################################################################
+# 2. Pruner
+###############################################################################
+def _monitor_cpu():
+    seg = StateSegment.open_reader()
+    if seg is None:
+        return None
+    try:
+        res = seg.read_resource()
+    finally:
+        seg.close()
+    if res and time.time() - res["updated_at"] < 60:
+        return res["cpu_percent"]
+    return None
+
+
+class MotionPruner:
+    def __init__(self, catalog: RecordingCatalog, report_path: str = None):
+        self.catalog     = catalog
+        self.report_path = report_path or PRUNE_REPORT_PATH
+        self._last_kept  = {}      # {channel: start_ts chunk tersimpan terakhir}
+        self.totals = {
+            "scored": 0, "kept_active": 0, "kept_keepalive": 0, "pruned": 0,
+            "errors": 0, "reclaimed_bytes": 0, "video_s": 0.0, "analysis_s": 0.0,
+        }
+
+    def _last_kept_before(self, ch: int, start_ts: float):
+        if ch not in self._last_kept:
+            self._last_kept[ch] = self.catalog.last_start_before(ch, start_ts)
+        return self._last_kept[ch]
+
+    def decide(self, item: dict, result: dict) -> str:
+        """
+        "active" / "keepalive" / "prune" / "error" (chunk gagal dinilai => disimpan).
+        """
+        ch, start = item["channel"], item["start_ts"]
+        if result["error"] is not None:
+            verdict = "error"
+        elif result["motion_frames"] >= PRUNE_MIN_MOTION_FRAMES:
+            verdict = "active"
+        else:
+            last = self._last_kept_before(ch, start)
+            keepalive = PRUNE_KEEPALIVE_MINUTES * 60
+            verdict = "keepalive" if last is None or start - last >= keepalive else "prune"
+        if verdict != "prune":
+            self._last_kept[ch] = start
+        return verdict
+
+    def _apply(self, item: dict, result: dict, verdict: str, dry_run: bool) -> int:
+        path = item["path"]
+        if dry_run:
+            return item["size"] if verdict == "prune" else 0
+        if verdict == "error":
+            # -1 => tidak bisa dinilai, tidak dicoba lagi
+            self.catalog.set_activity(path, -1)
+            return 0
+        if verdict != "prune":
+            self.catalog.set_activity(path, result["motion_frames"])
+            return 0
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            remove_index(path)
+        except FileNotFoundError:
+            size = 0
+        except OSError as e:
+            logger.warning("[PRUNE] gagal hapus %s => %s", path, e)
+            return 0
+        self.catalog.delete(path)
+        return size
+
+    def run_once(self, pool, dry_run: bool = False, limit: int = None) -> dict:
+        """
+        Satu batch kandidat. Return statistik batch.
+        """
+        before = time.time() - PRUNE_AFTER_DAYS * 86400
+        items = self.catalog.prune_candidates(before, limit or PRUNE_BATCH,
+                                              include_untagged=PRUNE_INCLUDE_UNTAGGED)
+        batch = {"items": len(items), "pruned": 0, "reclaimed_bytes": 0,
+                 "video_s": 0.0, "analysis_s": 0.0, "speed_x": None}
+        if not items:
+            return batch
+
+        t0 = time.monotonic()
+        results = list(pool.map(score_recording, [it["path"] for it in items]))
+        wall = time.monotonic() - t0
+
+        # Keputusan berurutan (urut start_ts) => keep-alive konsisten per channel
+        for item, result in zip(items, results):
+            verdict = self.decide(item, result)
+            freed = self._apply(item, result, verdict, dry_run)
+            self.totals["scored"] += 1
+            if verdict == "active":
+                self.totals["kept_active"] += 1
+            elif verdict == "keepalive":
+                self.totals["kept_keepalive"] += 1
+            elif verdict == "error":
+                self.totals["errors"] += 1
+                logger.warning("[PRUNE] %s tidak bisa dinilai => disimpan (%s)",
+                               item["path"], result["error"])
+            else:
+                batch["pruned"] += 1
+                batch["reclaimed_bytes"] += freed
+            batch["video_s"] += max(0.0, item["end_ts"] - item["start_ts"])
+
+        batch["analysis_s"] = round(wall, 2)
+        batch["speed_x"] = round(batch["video_s"] / wall, 1) if wall > 0 else None
+        self.totals["pruned"]          += batch["pruned"]
+        self.totals["reclaimed_bytes"] += batch["reclaimed_bytes"]
+        self.totals["video_s"]         += batch["video_s"]
+        self.totals["analysis_s"]      += wall
+        logger.info("[PRUNE] %s%d chunk dinilai (%.0f menit video dalam %.1fs => %sx real time), "
+                    "%d dihapus => %.1f MB", "(dry-run) " if dry_run else "", len(items),
+                    batch["video_s"] / 60.0, wall, batch["speed_x"], batch["pruned"],
+                    batch["reclaimed_bytes"] / 1048576)
+        return batch
+
+    def report(self, last_batch: dict = None, dry_run: bool = False) -> dict:
+        t = self.totals
+        doc = {
+            "dry_run": dry_run,
+            "after_days": PRUNE_AFTER_DAYS,
+            "keepalive_minutes": PRUNE_KEEPALIVE_MINUTES,
+            "workers": PRUNE_WORKERS,
+            "totals": dict(t, video_s=round(t["video_s"], 1), analysis_s=round(t["analysis_s"], 1)),
+            "speed_x": round(t["video_s"] / t["analysis_s"], 1) if t["analysis_s"] > 0 else None,
+            "last_batch": last_batch,
+            "updated_at": time.time(),
+        }
+        if not dry_run:
+            try:
+                publish_state(self.report_path, doc)
+            except Exception as e:
+                logger.warning("[PRUNE] gagal menulis laporan %s => %s", self.report_path, e)
+        return doc
+
+    def run_until_done(self, pool, dry_run: bool = False) -> dict:
+        """
+        Batch demi batch sampai kandidat habis (dry-run: satu batch besar saja).
+        """
+        while True:
+            cpu = _monitor_cpu()
+            if cpu is not None and cpu > PRUNE_CPU_BUDGET:
+                logger.info("[PRUNE] CPU %.1f%% > budget %.0f%% => tunggu", cpu, PRUNE_CPU_BUDGET)
+                time.sleep(30)
+                continue
+            batch = self.run_once(pool, dry_run=dry_run,
+                                  limit=PRUNE_BATCH * 50 if dry_run else None)
+            if batch["items"]:
+                self.report(batch, dry_run=dry_run)
+            if dry_run or batch["items"] == 0:
+                return self.report(batch, dry_run=dry_run)
+
+
+def make_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=PRUNE_WORKERS, initializer=_init_worker)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    cmd = argv[0] if argv else ""
+    if cmd == "score" and len(argv) > 1:
+        _init_worker()
+        t0 = time.monotonic()
+        res = score_recording(argv[1])
+        res["analysis_s"] = round(time.monotonic() - t0, 2)
+        print(json.dumps(res, indent=2))
+        return 0
+    if cmd not in ("run", "daemon"):
+        print("Usage: motion_prune.py run [--dry-run] | score <file> | daemon")
+        return 2
+
+    catalog = RecordingCatalog()
+    pruner = MotionPruner(catalog)
+    with make_pool() as pool:
+        if cmd == "run":
+            doc = pruner.run_until_done(pool, dry_run="--dry-run" in argv[1:])
+            print(json.dumps(doc, indent=2))
+            return 0
+        while True:
+            try:
+                pruner.run_until_done(pool)
+            except Exception as e:
+                logger.error("[PRUNE] loop error => %s", e, exc_info=True)
+            time.sleep(PRUNE_INTERVAL)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,47 @@
 import cv2
 import numpy as np
 import os
+import time
 import logging
+import threading
 
 logger = logging.getLogger("Main-Combined")
 
 GLOBAL_NET = None
+_global_net_lock = threading.Lock()
+
 def load_global_net(prototxt_path, model_path):
     global GLOBAL_NET
-    if GLOBAL_NET is None:
-        try:
-            logger.info("[INFO] loading MobileNet SSD model (GLOBAL) ...")
-            net = cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
-            GLOBAL_NET = net
-        except Exception as e:
-            logger.error(f"[ObjectDetector] load_global_net error => {e}")
-            GLOBAL_NET = None
+    # Lock => preload di background & thread channel tidak memuat model dua kali
+    with _global_net_lock:
+        if GLOBAL_NET is None:
+            try:
+                logger.info("[INFO] loading MobileNet SSD model (GLOBAL) ...")
+                net = cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
+                GLOBAL_NET = net
+            except Exception as e:
+                logger.error(f"[ObjectDetector] load_global_net error => {e}")
+                GLOBAL_NET = None
     return GLOBAL_NET
 
+def preload_global_net(prototxt_path, model_path):
+    """
+    Muat model + satu forward dummy (alokasi layer pertama kali) saat startup,
+    paralel dengan koneksi channel. Return durasi (detik) atau None jika gagal.
+    """
+    t0 = time.monotonic()
+    net = load_global_net(prototxt_path, model_path)
+    if net is None:
+        return None
+    try:
+        with _global_net_lock:
+            dummy = np.zeros((300, 300, 3), dtype=np.uint8)
+            net.setInput(cv2.dnn.blobFromImage(dummy, 0.007843, (300,300), 127.5))
+            net.forward()
+    except Exception as e:
+        logger.warning(f"[ObjectDetector] warm-up forward error => {e}")
+    return time.monotonic() - t0
+
 class ObjectDetector:
     def __init__(self,
                  prototxt_path,
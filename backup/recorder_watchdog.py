@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+recorder_watchdog.py
+
+Watchdog proses rekaman ffmpeg (BackupSession).
+
+BackupSession.still_ok() hanya membandingkan durasi dengan MAX_RECORD. Recorder yang
+keluar karena RTSP putus tetap terlihat "recording" sampai rollover berikutnya dan
+rekaman di antaranya hilang tanpa jejak. Watchdog ini (satu thread untuk semua channel):
+
+- dead    : proc.poll() != None saat sesi seharusnya merekam.
+- stalled : file output tidak bertambah RECORD_STALL_TIMEOUT detik, atau laju tulis
+            (jendela RECORD_RATE_WINDOW) < RECORD_MIN_RATE_RATIO x bitrate yang diharapkan
+            (RECORD_EXPECTED_KBPS, 0 => dipelajari dari laju sehat sesi itu sendiri / EWMA).
+- Recorder dead/stalled di-restart segera (file parsial tetap ditutup & dicatat) di
+  thread terpisah per channel => satu channel yang macet tidak menahan yang lain.
+  Restart beruntun memakai backoff (RECORD_RESTART_MIN .. RECORD_RESTART_MAX).
+- Metrik gap per channel: jumlah restart, dead/stalled, total & gap terakhir (detik
+  dari byte terakhir file lama sampai byte pertama file baru), bitrate. Dipublikasikan
+  ke RECORD_WATCHDOG_STATE_PATH dan field "recorder" di channel_validation.json.
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import deque
+
+sys.path.append("/app/scripts")
+from utils import publish_state, set_os_thread_name
+
+logger = logging.getLogger("Backup-Manager")
+
+RECORD_WATCHDOG_ENABLE     = os.getenv("RECORD_WATCHDOG_ENABLE", "true").lower() == "true"
+RECORD_WATCHDOG_INTERVAL   = float(os.getenv("RECORD_WATCHDOG_INTERVAL", "2"))
+RECORD_START_GRACE         = float(os.getenv("RECORD_START_GRACE", "10"))
+RECORD_STALL_TIMEOUT       = float(os.getenv("RECORD_STALL_TIMEOUT", "15"))
+RECORD_RATE_WINDOW         = float(os.getenv("RECORD_RATE_WINDOW", "30"))
+RECORD_MIN_RATE_RATIO      = float(os.getenv("RECORD_MIN_RATE_RATIO", "0.1"))
+RECORD_EXPECTED_KBPS       = float(os.getenv("RECORD_EXPECTED_KBPS", "0"))
+RECORD_RESTART_MIN         = float(os.getenv("RECORD_RESTART_MIN", "2"))
+RECORD_RESTART_MAX         = float(os.getenv("RECORD_RESTART_MAX", "60"))
+RECORD_WATCHDOG_STATE_PATH = os.getenv("RECORD_WATCHDOG_STATE_PATH",
+                                       "/mnt/Data/Syslog/rtsp/recorder_watchdog.json")
+RECORD_WATCHDOG_PUBLISH_EVERY = float(os.getenv("RECORD_WATCHDOG_PUBLISH_EVERY", "30"))
+
+_EWMA_ALPHA = 0.2
+
+
+class _Track:
+    """
+    State pengawasan satu sesi (satu channel).
+    """
+    def __init__(self, session):
+        self.session     = session
+        self.file_path   = None
+        self.samples     = deque()   # (ts, size) dalam RATE_WINDOW
+        self.last_size   = 0
+        self.last_growth = None      # ts terakhir file bertambah
+        self.expected_bps = RECORD_EXPECTED_KBPS * 1000 / 8 if RECORD_EXPECTED_KBPS > 0 else None
+        self.gap_start   = None      # ts byte terakhir file yang mati => gap terbuka
+        self.restarting  = False
+        self.next_restart = 0.0
+        self.backoff     = RECORD_RESTART_MIN
+        self.metrics = {
+            "state": "idle", "restarts": 0, "dead": 0, "stalled": 0,
+            "gap_total_s": 0.0, "last_gap_s": None, "last_restart_at": None,
+            "last_reason": None, "rate_kbps": None, "expected_kbps": RECORD_EXPECTED_KBPS or None,
+        }
+
+    def reset_file(self, path):
+        self.file_path   = path
+        self.samples.clear()
+        self.last_size   = 0
+        self.last_growth = None
+
+
+class RecorderWatchdog:
+    def __init__(self, on_metrics=None, state_path: str = None):
+        self.on_metrics = on_metrics          # callback(ch, metrics) saat ada kejadian
+        self.state_path = state_path or RECORD_WATCHDOG_STATE_PATH
+        self._tracks    = {}                  # {channel: _Track}
+        self._lock      = threading.Lock()
+        self._thread    = None
+
+    def register(self, session):
+        # Pipeline channel (re)start => sesi baru menggantikan sesi lama channel itu
+        with self._lock:
+            old = self._tracks.get(session.channel)
+            track = _Track(session)
+            if old is not None:
+                track.metrics = old.metrics   # metrik channel bertahan lintas pipeline
+            self._tracks[session.channel] = track
+
+    # ------------------------------------------------------------------
+    def _emit(self, ch, track):
+        if self.on_metrics is not None:
+            try:
+                self.on_metrics(ch, dict(track.metrics))
+            except Exception as e:
+                logger.warning("[WATCHDOG] ch=%s gagal update metrik => %s", ch, e)
+
+    def _observe_size(self, track, now):
+        """
+        Update sampel ukuran file. Return laju (byte/detik) dalam jendela atau None.
+        """
+        try:
+            size = os.path.getsize(track.file_path)
+        except OSError:
+            size = 0
+        if size > track.last_size:
+            if track.last_growth is None and track.gap_start is not None:
+                # Byte pertama file pengganti => gap tertutup
+                gap = max(0.0, now - track.gap_start)
+                track.metrics["last_gap_s"] = round(gap, 1)
+                track.metrics["gap_total_s"] = round(track.metrics["gap_total_s"] + gap, 1)
+                track.gap_start = None
+                logger.info("[WATCHDOG] ch=%s rekaman pulih, gap %.1fs", track.session.channel, gap)
+            track.last_growth = now
+        track.last_size = size
+        track.samples.append((now, size))
+        while track.samples and now - track.samples[0][0] > RECORD_RATE_WINDOW:
+            track.samples.popleft()
+        if len(track.samples) < 2:
+            return None
+        (t0, s0), (t1, s1) = track.samples[0], track.samples[-1]
+        if t1 - t0 < RECORD_RATE_WINDOW * 0.5:
+            return None
+        return (s1 - s0) / (t1 - t0)
+
+    def check(self, ch, track, now) -> str:
+        """
+        "ok" / "idle" / "dead" / "stalled" untuk satu sesi.
+        """
+        sess = track.session
+        proc = sess.proc if sess is not None else None
+        if proc is None:
+            return "idle"
+        if sess.file_path != track.file_path:
+            track.reset_file(sess.file_path)
+        if proc.poll() is not None:
+            return "dead"
+
+        rate = self._observe_size(track, now)
+        age = now - (sess.start_time or now)
+        if age < RECORD_START_GRACE:
+            return "ok"
+        ref = track.last_growth or sess.start_time
+        if now - ref > RECORD_STALL_TIMEOUT:
+            return "stalled"
+        if rate is not None:
+            track.metrics["rate_kbps"] = round(rate * 8 / 1000, 1)
+            if track.expected_bps and rate < RECORD_MIN_RATE_RATIO * track.expected_bps:
+                return "stalled"
+            if RECORD_EXPECTED_KBPS <= 0:
+                # Bitrate acuan dipelajari dari laju sehat
+                track.expected_bps = rate if track.expected_bps is None else (
+                    track.expected_bps + _EWMA_ALPHA * (rate - track.expected_bps))
+                track.metrics["expected_kbps"] = round(track.expected_bps * 8 / 1000, 1)
+        return "ok"
+
+    def _restart(self, ch, track):
+        sess = track.session
+        try:
+            restarted = sess is not None and sess.restart_recording()
+        except Exception as e:
+            restarted = False
+            logger.error("[WATCHDOG] ch=%s restart recorder gagal => %s", ch, e)
+        finally:
+            track.restarting = False
+        if restarted:
+            logger.info("[WATCHDOG] ch=%s recorder dijalankan ulang => %s", ch, sess.file_path)
+
+    def _tick(self):
+        now = time.time()
+        with self._lock:
+            items = list(self._tracks.items())
+        for ch, track in items:
+            if track.restarting or track.session is None:
+                continue
+            state = self.check(ch, track, now)
+            prev = track.metrics["state"]
+            track.metrics["state"] = state
+            if state == "idle" and track.gap_start is not None:
+                # Rekaman dihentikan pipeline sebelum pulih => gap ditutup saat berhenti
+                gap = max(0.0, now - track.gap_start)
+                track.metrics["last_gap_s"] = round(gap, 1)
+                track.metrics["gap_total_s"] = round(track.metrics["gap_total_s"] + gap, 1)
+                track.gap_start = None
+            if state in ("ok", "idle"):
+                if state == "ok" and track.last_growth and now - track.last_growth < RECORD_STALL_TIMEOUT:
+                    track.backoff = RECORD_RESTART_MIN
+                if state != prev:
+                    self._emit(ch, track)
+                continue
+            if now < track.next_restart:
+                continue
+
+            # dead / stalled => restart segera, thread sendiri per channel
+            if track.gap_start is None:
+                track.gap_start = track.last_growth or (track.session.start_time or now)
+            track.metrics[state] += 1
+            track.metrics["restarts"] += 1
+            track.metrics["last_reason"] = state
+            track.metrics["last_restart_at"] = now
+            track.next_restart = now + track.backoff
+            track.backoff = min(RECORD_RESTART_MAX, track.backoff * 2)
+            track.restarting = True
+            logger.warning("[WATCHDOG] ch=%s recorder %s (file %s, tumbuh terakhir %s) => restart",
+                           ch, state, track.file_path,
+                           f"{now - track.last_growth:.0f}s lalu" if track.last_growth else "belum pernah")
+            self._emit(ch, track)
+            threading.Thread(target=self._restart, args=(ch, track), daemon=True,
+                             name=f"ch{ch}-rec-restart").start()
+
+    # ------------------------------------------------------------------
+    def snapshot(self) -> dict:
+        with self._lock:
+            tracks = list(self._tracks.items())
+        now = time.time()
+        out = {}
+        for ch, track in tracks:
+            m = dict(track.metrics)
+            m["open_gap_s"] = round(now - track.gap_start, 1) if track.gap_start else None
+            out[str(ch)] = m
+        return {"channels": out, "updated_at": now}
+
+    def publish(self):
+        try:
+            publish_state(self.state_path, self.snapshot())
+        except Exception as e:
+            logger.warning("[WATCHDOG] gagal menulis state %s => %s", self.state_path, e)
+
+    def _run(self):
+        set_os_thread_name("rec-watchdog")
+        last_publish = 0.0
+        while True:
+            try:
+                self._tick()
+            except Exception as e:
+                logger.error("[WATCHDOG] tick error => %s", e, exc_info=True)
+            if time.monotonic() - last_publish >= RECORD_WATCHDOG_PUBLISH_EVERY:
+                self.publish()
+                last_publish = time.monotonic()
+            time.sleep(RECORD_WATCHDOG_INTERVAL)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="rec-watchdog")
+            self._thread.start()
+        return self
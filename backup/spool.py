@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+spool.py
+
+Spool lokal untuk rekaman + transfer asinkron ke share NAS (/mnt/Data/Backup).
+
+Masalah: ffmpeg menulis langsung ke mount NFS/TrueNAS. Saat NAS lambat / putus
+sebentar, write ffmpeg blocking, thread channel macet, rekaman hilang.
+
+- Rekaman ditulis ke SPOOL_DIR (SSD/tmpfs lokal) dengan struktur relatif yang sama
+  (dd-mm-YYYY/Channel-N/CHn-HH-MM-SS.mkv).
+- File yang selesai direkam masuk antrian (FIFO, terlama dulu). Worker transfer
+  memindahkan file ke NAS per batch (SPOOL_BATCH):
+    salin ke ".<nama>.part" di NAS sambil menghitung checksum -> fsync ->
+    baca ulang & bandingkan checksum -> os.replace ke nama final (+ sidecar indeks)
+    -> catat ke katalog -> hapus file lokal.
+- Gagal (NAS tidak terjangkau, checksum beda) => batch berhenti, retry dengan
+  backoff eksponensial (SPOOL_RETRY_BASE .. SPOOL_RETRY_MAX). File tetap di spool.
+- Spool penuh (> SPOOL_MAX_GB atau free disk < SPOOL_MIN_FREE_PCT) => file antrian
+  terlama dibuang (eviction) supaya rekaman baru tetap bisa ditulis. Rekaman yang
+  sedang berjalan tidak pernah dibuang.
+- Metrik backpressure (kedalaman antrian, umur file tertua, laju transfer, retry,
+  eviction) dipublikasikan ke SPOOL_STATE_PATH.
+- Restart container => file yang tertinggal di spool diantrikan ulang (recover()).
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import deque
+
+sys.path.append("/app/scripts")
+from utils import publish_state, set_os_thread_name
+from recording_catalog import parse_recording_path
+from recording_index import index_path_for
+
+logger = logging.getLogger("Backup-Manager")
+
+SPOOL_ENABLE        = os.getenv("SPOOL_ENABLE", "false").lower() == "true"
+SPOOL_DIR           = os.getenv("SPOOL_DIR", "/mnt/Data/Spool")
+SPOOL_MAX_GB        = float(os.getenv("SPOOL_MAX_GB", "50"))
+SPOOL_MIN_FREE_PCT  = float(os.getenv("SPOOL_MIN_FREE_PCT", "10"))
+SPOOL_BATCH         = int(os.getenv("SPOOL_BATCH", "20"))
+SPOOL_RETRY_BASE    = float(os.getenv("SPOOL_RETRY_BASE", "10"))
+SPOOL_RETRY_MAX     = float(os.getenv("SPOOL_RETRY_MAX", "600"))
+SPOOL_CHUNK_MB      = float(os.getenv("SPOOL_CHUNK_MB", "4"))
+SPOOL_STATE_PATH    = os.getenv("SPOOL_STATE_PATH", "/mnt/Data/Syslog/rtsp/spool.json")
+SPOOL_PUBLISH_EVERY = float(os.getenv("SPOOL_PUBLISH_EVERY", "30"))
+
+BACKUP_ROOT = "/mnt/Data/Backup"
+
+_IDLE_WAIT = 5.0
+
+
+###############################################################################
+# 1. Salin + checksum
+###############################################################################
+class ChecksumMismatch(OSError):
+    pass
+
+
+def _file_digest(path: str, chunk: int) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        try:
+            # Buang cache halaman => checksum dibaca dari server, bukan cache klien NFS
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        except (AttributeError, OSError):
+            pass
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def copy_verified(src: str, dst: str, chunk: int = None) -> int:
+    """
+    Salin src -> dst (via file .part + os.replace) dengan verifikasi checksum.
+    Return jumlah byte. Gagal => OSError (file .part dibersihkan).
+    """
+    chunk = chunk or int(SPOOL_CHUNK_MB * 1024 * 1024)
+    d, name = os.path.split(dst)
+    os.makedirs(d, exist_ok=True)
+    part = os.path.join(d, f".{name}.part")
+    h = hashlib.blake2b(digest_size=20)
+    size = 0
+    try:
+        with open(src, "rb") as fin, open(part, "wb") as fout:
+            for block in iter(lambda: fin.read(chunk), b""):
+                h.update(block)
+                fout.write(block)
+                size += len(block)
+            fout.flush()
+            os.fsync(fout.fileno())
+        if _file_digest(part, chunk) != h.hexdigest():
+            raise ChecksumMismatch(f"checksum {dst} tidak cocok")
+        shutil.copystat(src, part)
+        os.replace(part, dst)
+    except OSError:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+    return size
+
+
+###############################################################################
+# 2. Spool
+###############################################################################
+class RecordingSpool:
+    def __init__(self, spool_dir: str = None, backup_root: str = None, catalog=None,
+                 state_path: str = None):
+        self.spool_dir   = spool_dir or SPOOL_DIR
+        self.backup_root = backup_root or BACKUP_ROOT
+        self.catalog     = catalog
+        self.state_path  = state_path or SPOOL_STATE_PATH
+        self.max_bytes   = int(SPOOL_MAX_GB * 1024 ** 3)
+
+        self._queue      = deque()     # item dict, FIFO
+        self._queued_bytes = 0
+        self._cond       = threading.Condition()
+        self._thread     = None
+        self._active     = None        # item yang sedang ditransfer worker
+        self._failures   = 0           # gagal beruntun (backoff)
+        self.stats = {
+            "enqueued": 0, "transferred": 0, "transferred_bytes": 0,
+            "retries": 0, "checksum_errors": 0, "evicted": 0, "evicted_bytes": 0,
+            "last_error": None, "last_error_at": None, "last_transfer_at": None,
+            "rate_mb_s": None,
+        }
+
+    # ------------------------------------------------------------------
+    # Path
+    # ------------------------------------------------------------------
+    def local_path_for(self, date_str: str, channel: int, name: str) -> str:
+        d = os.path.join(self.spool_dir, date_str, f"Channel-{channel}")
+        os.makedirs(d, exist_ok=True)
+        return os.path.join(d, name)
+
+    def final_path_for(self, local_path: str) -> str:
+        rel = os.path.relpath(local_path, self.spool_dir)
+        return os.path.join(self.backup_root, rel)
+
+    def owns(self, path: str) -> bool:
+        return bool(path) and os.path.abspath(path).startswith(os.path.abspath(self.spool_dir) + os.sep)
+
+    # ------------------------------------------------------------------
+    # Antrian
+    # ------------------------------------------------------------------
+    def enqueue(self, local_path: str, channel: int, start_ts: float, end_ts: float,
+                codec: str = None, trigger: str = None):
+        try:
+            size = os.path.getsize(local_path)
+        except OSError:
+            return
+        if size <= 0:
+            try:
+                os.remove(local_path)
+            except OSError:
+                pass
+            return
+        item = {
+            "local": local_path, "final": self.final_path_for(local_path),
+            "channel": channel, "start_ts": start_ts, "end_ts": end_ts, "size": size,
+            "codec": codec, "trigger": trigger, "attempts": 0, "enqueued_at": time.time(),
+        }
+        with self._cond:
+            self._queue.append(item)
+            self._queued_bytes += size
+            self.stats["enqueued"] += 1
+            self._cond.notify()
+        self.evict_if_full()
+
+    def recover(self) -> int:
+        """
+        Antrikan ulang file yang tertinggal di spool (restart saat NAS down / crash).
+        Dipanggil sebelum thread channel mulai merekam.
+        """
+        found = []
+        for dirpath, _, files in os.walk(self.spool_dir):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(dirpath, name)
+                parsed = parse_recording_path(path)
+                if parsed is None:
+                    continue
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                ch, start = parsed
+                found.append((start, path, ch, max(start, mtime)))
+        for start, path, ch, end in sorted(found):
+            self.enqueue(path, ch, start, end)
+        if found:
+            logger.info("[SPOOL] %d file tertinggal di spool diantrikan ulang", len(found))
+        return len(found)
+
+    # ------------------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------------------
+    def _spool_pressure(self) -> bool:
+        if self._queued_bytes > self.max_bytes:
+            return True
+        try:
+            du = shutil.disk_usage(self.spool_dir)
+        except OSError:
+            return False
+        return du.total > 0 and (du.free / du.total) * 100.0 < SPOOL_MIN_FREE_PCT
+
+    def evict_if_full(self) -> int:
+        evicted = 0
+        while True:
+            with self._cond:
+                if not self._queue or not self._spool_pressure():
+                    break
+                # Item yang sedang ditransfer dilewati
+                idx = 1 if self._queue[0] is self._active else 0
+                if idx >= len(self._queue):
+                    break
+                item = self._queue[idx]
+                del self._queue[idx]
+                self._queued_bytes -= item["size"]
+            for path in (item["local"], index_path_for(item["local"])):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            evicted += 1
+            self.stats["evicted"] += 1
+            self.stats["evicted_bytes"] += item["size"]
+            logger.error("[SPOOL] spool penuh => rekaman terlama dibuang: %s (%.1f MB)",
+                         item["local"], item["size"] / 1048576)
+        return evicted
+
+    # ------------------------------------------------------------------
+    # Worker transfer
+    # ------------------------------------------------------------------
+    def _backoff(self) -> float:
+        return min(SPOOL_RETRY_MAX, SPOOL_RETRY_BASE * (2 ** max(0, self._failures - 1)))
+
+    def _transfer(self, item: dict):
+        if not os.path.isfile(item["local"]):
+            return False
+        size = copy_verified(item["local"], item["final"])
+        # Sidecar indeks keyframe ikut pindah (mtime dipertahankan => tetap valid)
+        side = index_path_for(item["local"])
+        if os.path.isfile(side):
+            copy_verified(side, index_path_for(item["final"]))
+            os.remove(side)
+        if self.catalog is not None:
+            try:
+                self.catalog.add(item["final"], item["channel"], item["start_ts"], item["end_ts"],
+                                 size, item["codec"], item["trigger"])
+            except Exception as e:
+                logger.warning("[CATALOG] ch=%s gagal mencatat %s => %s",
+                               item["channel"], item["final"], e)
+        os.remove(item["local"])
+        return True
+
+    def _run_batch(self) -> bool:
+        """
+        Transfer maks SPOOL_BATCH item terdepan. Return False jika batch terhenti karena gagal.
+        """
+        t0, moved_bytes, moved = time.monotonic(), 0, 0
+        for _ in range(SPOOL_BATCH):
+            with self._cond:
+                if not self._queue:
+                    break
+                item = self._active = self._queue[0]
+            try:
+                done = self._transfer(item)
+            except OSError as e:
+                self._active = None
+                item["attempts"] += 1
+                self._failures += 1
+                self.stats["retries"] += 1
+                if isinstance(e, ChecksumMismatch):
+                    self.stats["checksum_errors"] += 1
+                self.stats["last_error"] = str(e)
+                self.stats["last_error_at"] = time.time()
+                logger.warning("[SPOOL] transfer %s gagal (percobaan %d) => %s; retry %.0fs",
+                               item["final"], item["attempts"], e, self._backoff())
+                return False
+            with self._cond:
+                self._active = None
+                if self._queue and self._queue[0] is item:
+                    self._queue.popleft()
+                    self._queued_bytes -= item["size"]
+            if done:
+                moved += 1
+                moved_bytes += item["size"]
+                self.stats["transferred"] += 1
+                self.stats["transferred_bytes"] += item["size"]
+        if moved:
+            took = time.monotonic() - t0
+            self.stats["last_transfer_at"] = time.time()
+            self.stats["rate_mb_s"] = round(moved_bytes / 1048576 / took, 1) if took > 0 else None
+            if self._failures:
+                logger.info("[SPOOL] NAS kembali => transfer normal")
+            logger.debug("[SPOOL] %d file (%.1f MB) dipindah ke NAS dalam %.1fs",
+                         moved, moved_bytes / 1048576, took)
+        self._failures = 0
+        return True
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            depth, queued = len(self._queue), self._queued_bytes
+            oldest = self._queue[0]["enqueued_at"] if self._queue else None
+        try:
+            du = shutil.disk_usage(self.spool_dir)
+            disk = {"total": du.total, "used": du.used, "free": du.free,
+                    "percent": round(du.used / du.total * 100.0, 1) if du.total else None}
+        except OSError:
+            disk = None
+        return {
+            "spool_dir": self.spool_dir,
+            "queue_files": depth,
+            "queue_bytes": queued,
+            "queue_percent": round(queued / self.max_bytes * 100.0, 1) if self.max_bytes else None,
+            "oldest_pending_s": round(time.time() - oldest, 1) if oldest else 0.0,
+            "nas_failures": self._failures,
+            "retry_in_s": round(self._backoff(), 1) if self._failures else 0.0,
+            "disk": disk,
+            "stats": dict(self.stats),
+        }
+
+    def publish(self):
+        try:
+            publish_state(self.state_path, self.snapshot())
+        except Exception as e:
+            logger.warning("[SPOOL] gagal menulis state %s => %s", self.state_path, e)
+
+    def _run(self):
+        set_os_thread_name("spool-transfer")
+        last_publish = 0.0
+        while True:
+            with self._cond:
+                if not self._queue:
+                    self._cond.wait(_IDLE_WAIT)
+            ok = self._run_batch()
+            self.evict_if_full()
+            if time.monotonic() - last_publish >= SPOOL_PUBLISH_EVERY:
+                self.publish()
+                last_publish = time.monotonic()
+            if not ok:
+                time.sleep(self._backoff())
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="spool-transfer")
+            self._thread.start()
+        return self
+
+
+_spool = None
+
+def get_spool(catalog=None):
+    """
+    Spool per proses; None jika SPOOL_ENABLE=false atau direktori spool tidak bisa dipakai.
+    """
+    global _spool
+    if _spool is None and SPOOL_ENABLE:
+        try:
+            os.makedirs(SPOOL_DIR, exist_ok=True)
+            _spool = RecordingSpool(catalog=catalog)
+        except OSError as e:
+            logger.warning("[SPOOL] spool %s tidak tersedia => tulis langsung ke NAS (%s)", SPOOL_DIR, e)
+    return _spool
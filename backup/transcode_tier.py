@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+transcode_tier.py
+
+Tier penyimpanan bertingkat untuk rekaman backup.
+
+Rekaman selalu ditulis sebagai main-stream `-c copy` (.mkv / fMP4). Setelah
+TRANSCODE_AFTER_DAYS hari, rekaman di-encode ulang ke bitrate/resolusi lebih rendah
+=> retensi beberapa kali lebih panjang di disk yang sama.
+
+- Kandidat diambil dari katalog rekaman (tier "original", terlama dulu).
+- Pool worker (TRANSCODE_WORKERS) masing-masing menjalankan satu proses ffmpeg
+  dengan `nice` + `ionice -c3` (idle I/O) dan jumlah thread terbatas.
+- Budget CPU: job baru hanya dimulai jika CPU sistem (dari resource monitor)
+  < TRANSCODE_CPU_BUDGET. Jika CPU melewati budget saat job berjalan, proses ffmpeg
+  di-SIGSTOP dan dilanjutkan (SIGCONT) setelah CPU turun di bawah budget - hysteresis
+  => throughput rekaman live tidak terganggu.
+- Verifikasi hasil (ffprobe: stream video ada, durasi cocok) sebelum original diganti
+  secara atomic (os.replace di direktori yang sama, mtime dipertahankan).
+- Sidecar indeks keyframe (scripts/recording_index.py) dibangun ulang setelah diganti.
+- Hasil tidak cukup hemat (>= TRANSCODE_MIN_SAVING x ukuran asli) => original dipertahankan,
+  tier "keep" (tidak dicoba lagi).
+
+State ringkas dipublikasikan ke TRANSCODE_STATE_PATH.
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append("/app/scripts")
+from utils import publish_state, set_os_thread_name
+from recording_index import write_index, remove_index
+
+logger = logging.getLogger("Backup-Manager")
+
+TRANSCODE_ENABLE        = os.getenv("TRANSCODE_ENABLE", "false").lower() == "true"
+TRANSCODE_AFTER_DAYS    = float(os.getenv("TRANSCODE_AFTER_DAYS", "3"))
+TRANSCODE_WORKERS       = max(1, int(os.getenv("TRANSCODE_WORKERS", "1")))
+TRANSCODE_THREADS       = int(os.getenv("TRANSCODE_THREADS", "2"))
+TRANSCODE_CPU_BUDGET    = float(os.getenv("TRANSCODE_CPU_BUDGET", "60"))
+TRANSCODE_CPU_HYSTERESIS = float(os.getenv("TRANSCODE_CPU_HYSTERESIS", "15"))
+TRANSCODE_CODEC         = os.getenv("TRANSCODE_CODEC", "libx264")
+TRANSCODE_PRESET        = os.getenv("TRANSCODE_PRESET", "veryfast")
+TRANSCODE_CRF           = os.getenv("TRANSCODE_CRF", "30")
+TRANSCODE_MAX_HEIGHT    = int(os.getenv("TRANSCODE_MAX_HEIGHT", "720"))
+TRANSCODE_FPS           = int(os.getenv("TRANSCODE_FPS", "0"))
+TRANSCODE_MIN_SAVING    = float(os.getenv("TRANSCODE_MIN_SAVING", "0.8"))
+TRANSCODE_NICE          = int(os.getenv("TRANSCODE_NICE", "19"))
+TRANSCODE_INTERVAL      = float(os.getenv("TRANSCODE_INTERVAL", "300"))
+TRANSCODE_TIMEOUT       = float(os.getenv("TRANSCODE_TIMEOUT", "3600"))
+TRANSCODE_MAX_ATTEMPTS  = int(os.getenv("TRANSCODE_MAX_ATTEMPTS", "2"))
+TRANSCODE_STATE_PATH    = os.getenv("TRANSCODE_STATE_PATH", "/mnt/Data/Syslog/rtsp/transcode_tier.json")
+
+DURATION_TOLERANCE_S   = 2.0
+DURATION_TOLERANCE_PCT = 0.02
+_THROTTLE_INTERVAL     = 2.0
+
+
+###############################################################################
+# 1. ffmpeg / ffprobe
+###############################################################################
+def low_priority_prefix() -> list:
+    prefix = []
+    if shutil.which("nice"):
+        prefix += ["nice", "-n", str(TRANSCODE_NICE)]
+    if shutil.which("ionice"):
+        prefix += ["ionice", "-c", "3"]
+    return prefix
+
+
+def build_transcode_cmd(src: str, dst: str) -> list:
+    vf = []
+    if TRANSCODE_MAX_HEIGHT > 0:
+        vf.append(f"scale=-2:'min({TRANSCODE_MAX_HEIGHT},ih)'")
+    if TRANSCODE_FPS > 0:
+        vf.append(f"fps={TRANSCODE_FPS}")
+    cmd = low_priority_prefix() + [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-i", src,
+        "-map", "0:v:0", "-map", "0:a?",
+        "-c:v", TRANSCODE_CODEC, "-preset", TRANSCODE_PRESET, "-crf", str(TRANSCODE_CRF),
+    ]
+    if vf:
+        cmd += ["-vf", ",".join(vf)]
+    if TRANSCODE_THREADS > 0:
+        cmd += ["-threads", str(TRANSCODE_THREADS)]
+    if src.lower().endswith(".mp4"):
+        # Rekaman fMP4 (RECORD_FORMAT=fmp4) tetap fMP4 => tetap bisa di-seek / diputar via HLS
+        cmd += ["-c:a", "copy", "-f", "mp4",
+                "-movflags", "+frag_keyframe+empty_moov+default_base_moof", dst]
+    else:
+        cmd += ["-c:a", "copy", "-f", "matroska", dst]
+    return cmd
+
+
+def probe_media(path: str) -> dict:
+    """
+    {"duration": detik|None, "video_codec": str|None} atau None jika ffprobe gagal.
+    """
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries",
+             "format=duration:stream=codec_type,codec_name", "-of", "json", path],
+            capture_output=True, text=True, timeout=30)
+        if out.returncode != 0:
+            return None
+        doc = json.loads(out.stdout or "{}")
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return None
+    try:
+        duration = float(doc.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    video = [s.get("codec_name") for s in doc.get("streams", []) if s.get("codec_type") == "video"]
+    return {"duration": duration, "video_codec": video[0] if video else None}
+
+
+def verify_output(src_duration, out_info) -> str:
+    """
+    Return None jika hasil valid, atau alasan penolakan.
+    """
+    if out_info is None:
+        return "ffprobe hasil gagal"
+    if not out_info["video_codec"]:
+        return "tidak ada stream video"
+    if src_duration is None or out_info["duration"] is None:
+        return "durasi tidak diketahui"
+    tol = max(DURATION_TOLERANCE_S, src_duration * DURATION_TOLERANCE_PCT)
+    if abs(out_info["duration"] - src_duration) > tol:
+        return f"durasi {out_info['duration']:.1f}s != {src_duration:.1f}s"
+    return None
+
+
+def temp_path_for(src: str) -> str:
+    # Nama tersembunyi di direktori yang sama => os.replace atomic & tidak terbaca
+    # sebagai rekaman oleh katalog/scanner
+    d, name = os.path.split(src)
+    return os.path.join(d, f".{name}.transcode")
+
+
+###############################################################################
+# 2. Tier worker
+###############################################################################
+class TranscodeTier:
+    """
+    cpu_fn() => CPU sistem (%) dari resource monitor; None => tidak diketahui (tidak throttle).
+    """
+    def __init__(self, catalog, cpu_fn, state_path: str = None):
+        self.catalog    = catalog
+        self.cpu_fn     = cpu_fn
+        self.state_path = state_path or TRANSCODE_STATE_PATH
+
+        self._lock      = threading.Lock()
+        self._procs     = {}       # {src: Popen} job yang sedang berjalan
+        self._suspended = False
+        self._attempts  = {}       # {src: jumlah gagal}
+        self._thread    = None
+        self.stats = {
+            "transcoded": 0, "kept": 0, "failed": 0,
+            "bytes_before": 0, "bytes_after": 0, "suspends": 0,
+            "last_job": None,
+        }
+
+    # ------------------------------------------------------------------
+    # Budget CPU
+    # ------------------------------------------------------------------
+    def _cpu(self):
+        try:
+            return self.cpu_fn()
+        except Exception:
+            return None
+
+    def _signal_all(self, sig):
+        for proc in list(self._procs.values()):
+            try:
+                # Prefix nice/ionice memakai exec => pid = ffmpeg
+                os.kill(proc.pid, sig)
+            except OSError:
+                pass
+
+    def _throttle_loop(self):
+        set_os_thread_name("transcode-cpu")
+        while True:
+            cpu = self._cpu()
+            with self._lock:
+                if cpu is not None and self._procs:
+                    if not self._suspended and cpu > TRANSCODE_CPU_BUDGET:
+                        self._suspended = True
+                        self.stats["suspends"] += 1
+                        self._signal_all(signal.SIGSTOP)
+                        logger.info("[TRANSCODE] CPU %.1f%% > budget %.0f%% => %d job dijeda",
+                                    cpu, TRANSCODE_CPU_BUDGET, len(self._procs))
+                    elif self._suspended and cpu < TRANSCODE_CPU_BUDGET - TRANSCODE_CPU_HYSTERESIS:
+                        self._suspended = False
+                        self._signal_all(signal.SIGCONT)
+                        logger.info("[TRANSCODE] CPU %.1f%% => job dilanjutkan", cpu)
+            time.sleep(_THROTTLE_INTERVAL)
+
+    def _wait_budget(self):
+        while True:
+            cpu = self._cpu()
+            with self._lock:
+                if not self._suspended and (cpu is None or cpu < TRANSCODE_CPU_BUDGET):
+                    return
+            time.sleep(_THROTTLE_INTERVAL * 5)
+
+    # ------------------------------------------------------------------
+    # Satu file
+    # ------------------------------------------------------------------
+    def _run_ffmpeg(self, src: str, tmp: str) -> str:
+        """
+        Return None jika ffmpeg sukses, atau alasan gagal. Waktu dijeda tidak dihitung timeout.
+        """
+        # stderr ke file sementara: pipe yang tidak dibaca selama job berjalan bisa penuh
+        # (decode banyak error) dan menahan ffmpeg sampai timeout
+        with tempfile.TemporaryFile() as err_file:
+            proc = subprocess.Popen(build_transcode_cmd(src, tmp),
+                                    stdout=subprocess.DEVNULL, stderr=err_file)
+            reason = self._wait_ffmpeg(src, proc)
+            if reason is None and proc.returncode != 0:
+                err_file.seek(0, os.SEEK_END)
+                err_file.seek(max(0, err_file.tell() - 4096))
+                err = err_file.read().decode(errors="replace").strip().splitlines()
+                reason = f"ffmpeg rc={proc.returncode} {err[-1] if err else ''}".strip()
+        return reason
+
+    def _wait_ffmpeg(self, src: str, proc) -> str:
+        # Tunggu ffmpeg selesai (bisa dijeda throttle); alasan gagal hanya untuk timeout
+        with self._lock:
+            self._procs[src] = proc
+            if self._suspended:
+                os.kill(proc.pid, signal.SIGSTOP)
+        active = 0.0
+        try:
+            while proc.poll() is None:
+                time.sleep(1.0)
+                if not self._suspended:
+                    active += 1.0
+                if active > TRANSCODE_TIMEOUT:
+                    proc.kill()
+                    proc.wait()
+                    return f"timeout {TRANSCODE_TIMEOUT:.0f}s"
+        finally:
+            with self._lock:
+                self._procs.pop(src, None)
+        return None
+
+    def _fail(self, src: str, reason: str):
+        n = self._attempts.get(src, 0) + 1
+        self._attempts[src] = n
+        self.stats["failed"] += 1
+        logger.warning("[TRANSCODE] %s gagal (%d/%d) => %s", src, n, TRANSCODE_MAX_ATTEMPTS, reason)
+        if n >= TRANSCODE_MAX_ATTEMPTS:
+            # Jangan dicoba terus => original dipertahankan
+            self.catalog.set_tier(src, "keep")
+            self._attempts.pop(src, None)
+
+    def transcode_one(self, item: dict):
+        src = item["path"]
+        if not os.path.isfile(src):
+            # Sudah dihapus (retensi) di luar katalog
+            self.catalog.delete(src)
+            return
+        self._wait_budget()
+        set_os_thread_name("transcode")
+        tmp = temp_path_for(src)
+        t0 = time.monotonic()
+        try:
+            src_info = probe_media(src)
+            src_duration = src_info["duration"] if src_info else None
+            if src_duration is None:
+                src_duration = max(0.0, item["end_ts"] - item["start_ts"]) or None
+
+            reason = self._run_ffmpeg(src, tmp)
+            if reason is None:
+                reason = verify_output(src_duration, probe_media(tmp))
+            if reason is not None:
+                self._fail(src, reason)
+                return
+
+            st = os.stat(src)
+            new_size = os.path.getsize(tmp)
+            if new_size >= st.st_size * TRANSCODE_MIN_SAVING:
+                self.catalog.set_tier(src, "keep")
+                self.stats["kept"] += 1
+                logger.info("[TRANSCODE] %s => %.1f MB -> %.1f MB (tidak cukup hemat), original dipertahankan",
+                            src, st.st_size / 1048576, new_size / 1048576)
+                return
+
+            if not os.path.isfile(src):
+                return
+            os.replace(tmp, src)
+            os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns))
+            # Posisi byte keyframe berubah => sidecar indeks dibangun ulang
+            try:
+                write_index(src, item["start_ts"])
+            except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+                remove_index(src)
+                logger.warning("[TRANSCODE] indeks %s gagal => %s", src, e)
+            codec = "h264" if TRANSCODE_CODEC == "libx264" else (
+                "hevc" if TRANSCODE_CODEC == "libx265" else TRANSCODE_CODEC)
+            self.catalog.set_tier(src, "low", size=new_size, codec=codec)
+            self._attempts.pop(src, None)
+
+            took = time.monotonic() - t0
+            self.stats["transcoded"]   += 1
+            self.stats["bytes_before"] += st.st_size
+            self.stats["bytes_after"]  += new_size
+            self.stats["last_job"] = {
+                "path": src, "before": st.st_size, "after": new_size,
+                "ratio": round(new_size / st.st_size, 3) if st.st_size else None,
+                "duration_s": round(took, 1), "at": time.time(),
+            }
+            logger.info("[TRANSCODE] %s => %.1f MB -> %.1f MB (%.0f%%) dalam %.0fs",
+                        src, st.st_size / 1048576, new_size / 1048576,
+                        100.0 * new_size / max(1, st.st_size), took)
+        except OSError as e:
+            self._fail(src, str(e))
+        finally:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------
+    # Loop utama
+    # ------------------------------------------------------------------
+    def snapshot(self) -> dict:
+        saved = self.stats["bytes_before"] - self.stats["bytes_after"]
+        return {
+            "enabled": True,
+            "after_days": TRANSCODE_AFTER_DAYS,
+            "workers": TRANSCODE_WORKERS,
+            "cpu_budget": TRANSCODE_CPU_BUDGET,
+            "running": len(self._procs),
+            "suspended": self._suspended,
+            "saved_bytes": saved,
+            "stats": dict(self.stats),
+            "tiers": self.catalog.tier_summary(),
+        }
+
+    def publish(self):
+        try:
+            publish_state(self.state_path, self.snapshot())
+        except Exception as e:
+            logger.warning("[TRANSCODE] gagal menulis state %s => %s", self.state_path, e)
+
+    def run_once(self, pool) -> int:
+        before = time.time() - TRANSCODE_AFTER_DAYS * 86400
+        items = self.catalog.transcode_candidates(before, limit=TRANSCODE_WORKERS * 4)
+        if items:
+            list(pool.map(self.transcode_one, items))
+            self.publish()
+        return len(items)
+
+    def _run(self):
+        set_os_thread_name("transcode-tier")
+        with ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS,
+                                thread_name_prefix="transcode") as pool:
+            while True:
+                try:
+                    n = self.run_once(pool)
+                except Exception as e:
+                    logger.error("[TRANSCODE] loop error => %s", e, exc_info=True)
+                    n = 0
+                if n == 0:
+                    time.sleep(TRANSCODE_INTERVAL)
+
+    def start(self):
+        if self._thread is None:
+            threading.Thread(target=self._throttle_loop, daemon=True, name="transcode-cpu").start()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="transcode-tier")
+            self._thread.start()
+        return self
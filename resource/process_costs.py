@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+process_costs.py
+
+Akuntansi biaya proses per channel & peran untuk resource_monitor.py.
+
+Peran (role):
+- hls      : ffmpeg RTSP -> HLS (streamserver/ffmpeg_manager.py)
+- record   : ffmpeg rekaman ke /mnt/Data/Backup (backup/backup_manager.py)
+- probe    : ffmpeg blackdetect/freezedetect, ffprobe
+- snapshot : ffmpeg snapshot/thumbnail (streamserver/snapshot_cctv.py)
+- transcode: ffmpeg re-encode rekaman lama (backup/transcode_tier.py)
+- archive  : ffmpeg remux segmen arsip ke MPEG-TS (streamserver/archive_vod.py)
+- analysis : thread analisis (motion/object) di backup/main.py. Thread diberi nama OS
+             "ch<N>-analysis" (utils.set_os_thread_name); thread decoder yang dibuatnya
+             mewarisi nama itu => CPU ikut teratribusi. Juga ffmpeg pembaca rekaman
+             arsip ke rawvideo (skor keyframe backup/motion_prune.py).
+
+Proses ffmpeg diklasifikasi dari cmdline (sekali per proses, di-cache per pid+create_time).
+Metrik per channel/role: cpu_percent (interval terakhir), cpu_percent_avg (EWMA),
+rss_mb, io_read_bps, io_write_bps, open_fds, procs. Thread analysis hanya CPU
+(RSS/fd milik proses induk bersama).
+
+Catatan: container monitor butuh `pid: host` agar proses container lain terlihat
+(dan SYS_PTRACE untuk membaca /proc/<pid>/io milik proses lain).
+
+Author: (Anda)
+"""
+
+import os
+import re
+import time
+import psutil
+
+PROCESS_COST_WINDOW = float(os.getenv("PROCESS_COST_WINDOW", "60"))
+
+ROLES = ("hls", "record", "probe", "snapshot", "analysis", "transcode", "archive")
+
+_CHANNEL_PATTERNS = (
+    re.compile(r"[?&]channel=(\d+)"),
+    re.compile(r"Channel-(\d+)"),
+    re.compile(r"\bch_(\d+)"),
+)
+_THREAD_NAME_RE = re.compile(r"^ch(\d+)-(\w+)$")
+_PYTHON_NAMES   = ("python", "python3", "gunicorn")
+
+
+def classify_cmdline(name: str, cmdline: list):
+    """
+    Return (channel_str, role) atau None jika bukan proses media yang dikenal.
+    """
+    if name not in ("ffmpeg", "ffprobe") or not cmdline:
+        return None
+    text = " ".join(cmdline)
+
+    channel = None
+    for pat in _CHANNEL_PATTERNS:
+        m = pat.search(text)
+        if m:
+            channel = m.group(1)
+            break
+    if channel is None:
+        return None
+
+    if name == "ffprobe" or "blackdetect" in text or "freezedetect" in text or " -f null" in text:
+        role = "probe"
+    elif ".jpg" in text or ".webp" in text or "image2" in text:
+        role = "snapshot"
+    elif ".m3u8" in text or " -f hls" in text:
+        role = "hls"
+    elif ".transcode" in text:
+        role = "transcode"
+    elif " -f rawvideo" in text:
+        # Membaca rekaman arsip (mis. skor motion keyframe), bukan merekam
+        role = "analysis"
+    elif " -f mpegts pipe:1" in text:
+        role = "archive"
+    elif ".mkv" in text or ".mp4" in text or "/Backup/" in text:
+        role = "record"
+    else:
+        return None
+    return channel, role
+
+
+def _read_thread_comm(pid: int, tid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/task/{tid}/comm", "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+class ProcessCostAccountant:
+    """
+    sample() dipanggil tiap siklus resource_monitor => dict siap dipublikasikan.
+    """
+    def __init__(self, window: float = None):
+        self.window     = window or PROCESS_COST_WINDOW
+        self._classes   = {}   # {(pid, create_time): (ch, role) | None}
+        self._prev_cpu  = {}   # {key: cpu_seconds}
+        self._prev_io   = {}   # {key: (read_bytes, write_bytes)}
+        self._avg       = {}   # {(ch, role): cpu_percent EWMA}
+        self._last_t    = None
+
+    def _classify(self, proc: psutil.Process):
+        try:
+            key = (proc.pid, proc.create_time())
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None, None
+        if key not in self._classes:
+            try:
+                self._classes[key] = classify_cmdline(proc.name(), proc.cmdline())
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                self._classes[key] = None
+        return key, self._classes[key]
+
+    @staticmethod
+    def _bucket(acc: dict, ch: str, role: str) -> dict:
+        return acc.setdefault(ch, {}).setdefault(role, {
+            "cpu_percent": 0.0, "rss_mb": 0.0, "io_read_bps": 0.0,
+            "io_write_bps": 0.0, "open_fds": 0, "procs": 0, "threads": 0
+        })
+
+    def _account_process(self, proc, key, ch, role, dt, acc, seen_cpu, seen_io):
+        with proc.oneshot():
+            t = proc.cpu_times()
+            cpu = t.user + t.system
+            rss = proc.memory_info().rss
+            try:
+                fds = proc.num_fds()
+            except psutil.AccessDenied:
+                fds = 0
+            try:
+                io = proc.io_counters()
+                io = (io.read_bytes, io.write_bytes)
+            except (psutil.AccessDenied, AttributeError):
+                io = None
+        b = self._bucket(acc, ch, role)
+        seen_cpu[key] = cpu
+        if dt and key in self._prev_cpu:
+            b["cpu_percent"] += max(0.0, cpu - self._prev_cpu[key]) / dt * 100.0
+        if io is not None:
+            seen_io[key] = io
+            if dt and key in self._prev_io:
+                prev = self._prev_io[key]
+                b["io_read_bps"]  += max(0, io[0] - prev[0]) / dt
+                b["io_write_bps"] += max(0, io[1] - prev[1]) / dt
+        b["rss_mb"]   += rss / (1024 * 1024)
+        b["open_fds"] += fds
+        b["procs"]    += 1
+
+    def _account_threads(self, proc, dt, acc, seen_cpu):
+        try:
+            threads = proc.threads()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return
+        for th in threads:
+            m = _THREAD_NAME_RE.match(_read_thread_comm(proc.pid, th.id))
+            if not m or m.group(2) not in ROLES:
+                continue
+            ch, role = m.group(1), m.group(2)
+            key = ("tid", th.id, proc.pid)
+            cpu = th.user_time + th.system_time
+            b = self._bucket(acc, ch, role)
+            seen_cpu[key] = cpu
+            if dt and key in self._prev_cpu:
+                b["cpu_percent"] += max(0.0, cpu - self._prev_cpu[key]) / dt * 100.0
+            b["threads"] += 1
+
+    def sample(self) -> dict:
+        now = time.monotonic()
+        dt = (now - self._last_t) if self._last_t else None
+        acc, seen_cpu, seen_io, alive = {}, {}, {}, set()
+
+        for proc in psutil.process_iter(["name"]):
+            name = proc.info.get("name") or ""
+            try:
+                if name in ("ffmpeg", "ffprobe"):
+                    key, cls = self._classify(proc)
+                    if key is None:
+                        continue
+                    alive.add(key)
+                    if cls:
+                        self._account_process(proc, key, cls[0], cls[1], dt, acc, seen_cpu, seen_io)
+                elif name.startswith(_PYTHON_NAMES):
+                    self._account_threads(proc, dt, acc, seen_cpu)
+            except (psutil.NoSuchProcess, psutil.ZombieProcess, psutil.AccessDenied):
+                continue
+
+        # Buang state proses yang sudah berakhir => memori tetap terbatas
+        self._classes  = {k: v for k, v in self._classes.items() if k in alive}
+        self._prev_cpu = seen_cpu
+        self._prev_io  = seen_io
+        self._last_t   = now
+
+        alpha = min(1.0, (dt or self.window) / self.window)
+        channels = {}
+        for ch, roles in acc.items():
+            total = {"cpu_percent": 0.0, "cpu_percent_avg": 0.0, "rss_mb": 0.0,
+                     "io_read_bps": 0.0, "io_write_bps": 0.0, "open_fds": 0}
+            out_roles = {}
+            for role, b in roles.items():
+                prev = self._avg.get((ch, role))
+                if dt is None:
+                    avg = prev   # sample pertama => belum ada delta CPU
+                elif prev is None:
+                    avg = b["cpu_percent"]
+                else:
+                    avg = prev + alpha * (b["cpu_percent"] - prev)
+                if avg is not None:
+                    self._avg[(ch, role)] = avg
+                entry = {k: (round(v, 2) if isinstance(v, float) else v) for k, v in b.items()}
+                entry["cpu_percent_avg"] = round(avg, 2) if avg is not None else None
+                out_roles[role] = entry
+                for k in total:
+                    total[k] += entry.get(k) or 0
+            channels[ch] = {
+                "roles": out_roles,
+                "total": {k: (round(v, 2) if isinstance(v, float) else v) for k, v in total.items()},
+            }
+
+        # Role yang tidak muncul lagi => EWMA dibuang
+        for k in [k for k in self._avg if k[0] not in acc or k[1] not in acc[k[0]]]:
+            del self._avg[k]
+
+        return {
+            "sampled_at": time.time(),
+            "interval_s": round(dt, 2) if dt else None,
+            "window_s": self.window,
+            "channels": dict(sorted(channels.items(), key=lambda kv: int(kv[0]))),
+        }
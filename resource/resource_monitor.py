@@ -8,9 +8,12 @@ Hasil dicatat ke MONITOR_STATE_FILE (JSON).
 Fitur Utama:
 1) Baca interval & param dari environment (RESOURCE_MONITOR_INTERVAL, dsb.).
 2) Kumpulkan data resource (psutil).
-3) Ping RTSP_IP, ping keluar (google.com) untuk cek internet.
-4) Simpan data final ke MONITOR_STATE_FILE secara terjadwal.
+3) Probe asyncio (rtsp_prober.py): TCP + RTSP OPTIONS ke NVR, DESCRIBE per channel,
+   TCP connect keluar (google.com:443) untuk cek internet. Tanpa subprocess ping.
+4) Simpan data final ke MONITOR_STATE_FILE secara terjadwal (utils.publish_state =>
+   atomic replace + nomor versi _meta.seq).
 5) Logging menggunakan kategori "Resource-Monitor" (syslog-ng).
+6) Biaya proses per channel & role (process_costs.py) => "process_costs" di state file.
 
 Author: YourName
 """
@@ -20,14 +23,17 @@ import sys
 import time
 import json
 import psutil
-import subprocess
-import re
+import threading
 from datetime import datetime
 
 # Pastikan folder scripts ada di PATH (untuk import utils, dsb.)
 sys.path.append("/app/scripts")
 
-from utils import setup_category_logger
+from utils import setup_category_logger, publish_state, decode_credentials
+from state_segment import StateSegment
+from rtsp_prober import RtspProber
+from metric_history import MetricHistory
+from process_costs import ProcessCostAccountant
 
 ###############################################################################
 # 1. Kategori Log
@@ -41,7 +47,15 @@ MONITOR_STATE_FILE = os.getenv("MONITOR_STATE_FILE",
                                "/mnt/Data/Syslog/resource/resource_monitor_state.json")
 RESOURCE_MONITOR_INTERVAL = int(os.getenv("RESOURCE_MONITOR_INTERVAL", "5"))
 
-# Host luar untuk ping test (cek internet)
+# Riwayat metrik (scripts/metric_history.py) => sampling 1 detik di thread terpisah
+METRIC_HISTORY_ENABLE   = os.getenv("METRIC_HISTORY_ENABLE", "true").lower() == "true"
+METRIC_HISTORY_INTERVAL = float(os.getenv("METRIC_HISTORY_INTERVAL", "1"))
+METRIC_HISTORY_CHANNELS = int(os.getenv("METRIC_HISTORY_CHANNELS", "16"))
+
+# Biaya proses per channel/role (process_costs.py)
+PROCESS_COST_ENABLE = os.getenv("PROCESS_COST_ENABLE", "true").lower() == "true"
+
+# Host luar untuk cek internet (TCP connect ke PING_OUTSIDE_PORT, lihat rtsp_prober.py)
 PING_OUTSIDE_HOST = os.getenv("PING_OUTSIDE_HOST", "google.com")
 
 # Param freeze (disimpan di JSON juga, jika pipeline butuh info)
@@ -65,26 +79,6 @@ def get_local_time() -> str:
         logger.exception("[Resource-Monitor] Gagal mendapatkan waktu lokal.")
         return "unknown"
 
-def ping_host_with_rtt(host: str, count=1, timeout=2) -> (bool, float):
-    """
-    Melakukan ping ke <host> menggunakan 'ping -c <count> -W <timeout>'.
-    Returns:
-        (reachable: bool, rtt_ms: float|None)
-    """
-    try:
-        cmd = ["ping", "-c", str(count), "-W", str(timeout), host]
-        output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
-        match = re.search(r"time=([\d\.]+)\s*ms", output)
-        if match:
-            return True, float(match.group(1))
-        else:
-            return True, None
-    except subprocess.CalledProcessError:
-        return False, None
-    except Exception:
-        logger.exception(f"[Resource-Monitor] Ping error ke {host}")
-        return False, None
-
 ###############################################################################
 # 4. Kumpulkan Data Resource
 ###############################################################################
@@ -143,11 +137,24 @@ def collect_resource_data() -> dict:
     }
 
 ###############################################################################
-# 5. Kumpulkan Info Streaming (RTSP) + Ping Internet
+# 5. Kumpulkan Info Streaming (RTSP) + Probe NVR/Internet
 ###############################################################################
-def collect_stream_info() -> dict:
+def create_prober() -> RtspProber:
+    try:
+        user, pwd = decode_credentials()
+    except RuntimeError:
+        # Tanpa kredensial => DESCRIBE berhenti di 401 (channel dicatat auth_failed)
+        user, pwd = None, None
+    return RtspProber(
+        rtsp_ip=os.getenv("RTSP_IP", "127.0.0.1"),
+        outside_host=PING_OUTSIDE_HOST,
+        user=user, pwd=pwd,
+        subtype=os.getenv("RTSP_SUBTYPE", "0")
+    )
+
+def collect_stream_info(prober: RtspProber) -> tuple:
     """
-    Kumpulkan info streaming/IP dari environment & ping.
+    Kumpulkan info streaming/IP dari environment & hasil probe.
     Disimpan di "stream_config" agar terbaca di main.py.
     
     Format field yang dibutuhkan main.py (jika ENABLE_JSON_LOOK=true):
@@ -175,15 +182,7 @@ def collect_stream_info() -> dict:
     ENABLE_RTSP_VALIDATION = (os.getenv("ENABLE_RTSP_VALIDATION", "true").lower() == "true")
     SKIP_ABDULLAH_CHECK    = (os.getenv("SKIP_ABDULLAH_CHECK", "false").lower() == "true")
 
-    # 1) Ping RTSP_IP
-    reachable, rtt_ms = ping_host_with_rtt(RTSP_IP, count=1, timeout=2)
-    final_ips = [{
-        "ip": RTSP_IP,
-        "reachable": reachable,
-        "ping_time_ms": rtt_ms
-    }]
-
-    # 2) Channel list => if "off", range(1..CHANNEL_COUNT)
+    # 1) Channel list => if "off", range(1..CHANNEL_COUNT)
     if TEST_CHANNEL.lower() == "off":
         channel_list = list(range(1, CHANNEL_COUNT + 1))
     else:
@@ -193,8 +192,18 @@ def collect_stream_info() -> dict:
             if c.isdigit():
                 channel_list.append(int(c))
 
-    # 3) Ping keluar => cek internet
-    outside_ok, outside_rtt = ping_host_with_rtt(PING_OUTSIDE_HOST, count=1, timeout=2)
+    # 2) Probe NVR, channel & internet (konkuren, dengan timeout)
+    probe = prober.probe_cycle(channel_list)
+    nvr, outside = probe["nvr"], probe["outside"]
+
+    # Field lama tetap ada: ping_time_ms kini = latency TCP connect ke port RTSP
+    final_ips = [{
+        "ip": RTSP_IP,
+        "reachable": nvr["tcp_ok"],
+        "ping_time_ms": nvr["connect_ms"],
+        "rtsp_ok": nvr["rtsp_ok"],
+        "rtsp_options_ms": nvr["options_ms"]
+    }]
 
     stream_data = {
         # Bagian "stream_config" => script main.py memakainya
@@ -207,8 +216,8 @@ def collect_stream_info() -> dict:
 
         "final_ips": final_ips,
         "ping_outside_host": PING_OUTSIDE_HOST,
-        "ping_outside_ok": outside_ok,
-        "ping_outside_ms": outside_rtt,
+        "ping_outside_ok": outside["ok"],
+        "ping_outside_ms": outside["connect_ms"],
         "channel_list": channel_list,
     }
 
@@ -216,7 +225,96 @@ def collect_stream_info() -> dict:
         "rtsp_subtype": RTSP_SUBTYPE
     }
 
-    return (stream_data, rtsp_config)
+    return (stream_data, rtsp_config, probe)
+
+###############################################################################
+# 5b. Riwayat Metrik (ring buffer mmap)
+###############################################################################
+HISTORY_BASE_METRICS = [
+    "cpu_percent", "ram_percent", "disk_percent", "swap_percent", "load_1",
+    "net_sent_bps", "net_recv_bps",
+    "nvr_connect_ms", "nvr_options_ms", "outside_connect_ms",
+]
+
+def history_metric_names() -> list:
+    names = list(HISTORY_BASE_METRICS)
+    for ch in range(1, METRIC_HISTORY_CHANNELS + 1):
+        names += [f"ch{ch}_active", f"ch{ch}_recording", f"ch{ch}_describe_ms",
+                  f"ch{ch}_cpu_percent"]
+    return names
+
+class HistorySampler(threading.Thread):
+    """
+    Sample resource + status channel (dari state segment) tiap METRIC_HISTORY_INTERVAL.
+    CPU & network dihitung dari delta counter sendiri agar tidak mengganggu
+    psutil.cpu_percent() milik loop utama.
+    """
+    def __init__(self, history: MetricHistory, segment=None):
+        super().__init__(daemon=True, name="history-sampler")
+        self.history = history
+        self.segment = segment
+        self._cpu    = psutil.cpu_times()
+        self._net    = psutil.net_io_counters()
+        self._t      = time.monotonic()
+
+    def sample(self) -> dict:
+        now  = time.monotonic()
+        dt   = max(now - self._t, 1e-3)
+        cpu  = psutil.cpu_times()
+        net  = psutil.net_io_counters()
+
+        busy  = (sum(cpu) - cpu.idle - getattr(cpu, "iowait", 0.0)) - \
+                (sum(self._cpu) - self._cpu.idle - getattr(self._cpu, "iowait", 0.0))
+        total = sum(cpu) - sum(self._cpu)
+        try:
+            load_1 = os.getloadavg()[0]
+        except OSError:
+            load_1 = None
+
+        values = {
+            "cpu_percent":  (busy / total * 100.0) if total > 0 else None,
+            "ram_percent":  psutil.virtual_memory().percent,
+            "disk_percent": psutil.disk_usage('/').percent,
+            "swap_percent": psutil.swap_memory().percent,
+            "load_1":       load_1,
+            "net_sent_bps": (net.bytes_sent - self._net.bytes_sent) / dt,
+            "net_recv_bps": (net.bytes_recv - self._net.bytes_recv) / dt,
+        }
+        self._cpu, self._net, self._t = cpu, net, now
+
+        if self.segment is not None:
+            for ch_str, info in self.segment.read_channels().items():
+                values[f"ch{ch_str}_active"]    = 1.0 if info["is_active"] else 0.0
+                values[f"ch{ch_str}_recording"] = 1.0 if info["recording"] else 0.0
+        return values
+
+    def run(self):
+        next_t = time.monotonic()
+        while True:
+            next_t += METRIC_HISTORY_INTERVAL
+            try:
+                self.history.record(self.sample())
+            except Exception:
+                logger.exception("[Resource-Monitor] Gagal mencatat history.")
+            time.sleep(max(0.0, next_t - time.monotonic()))
+
+def record_cycle_history(history: MetricHistory, probe: dict, since: float, costs: dict = None):
+    """
+    Latency probe siklus ini (channel hanya yang diprobe sejak 'since') +
+    total CPU proses per channel => history.
+    """
+    values = {
+        "nvr_connect_ms":     probe["nvr"]["connect_ms"],
+        "nvr_options_ms":     probe["nvr"]["options_ms"],
+        "outside_connect_ms": probe["outside"]["connect_ms"],
+    }
+    for ch_str, res in probe["channels"].items():
+        if res["checked_at"] >= since:
+            values[f"ch{ch_str}_describe_ms"] = res["describe_ms"]
+    if costs and costs.get("interval_s"):
+        for ch_str, cost in costs["channels"].items():
+            values[f"ch{ch_str}_cpu_percent"] = cost["total"]["cpu_percent"]
+    history.record(values)
 
 ###############################################################################
 # 6. Main Loop Pemantauan
@@ -226,23 +324,54 @@ def main():
     logger.info(f"[Resource-Monitor] Hasil disimpan di => {MONITOR_STATE_FILE}")
     logger.info(f"[Resource-Monitor] Interval => {RESOURCE_MONITOR_INTERVAL} detik")
 
+    # Segmen state biner (tmpfs bersama) => pembaca lain tanpa parse JSON
+    try:
+        segment = StateSegment(writer=True)
+        logger.info(f"[Resource-Monitor] State segment => {segment.path}")
+    except OSError as e:
+        segment = None
+        logger.warning(f"[Resource-Monitor] State segment tidak tersedia => {e}")
+
+    prober = create_prober()
+
+    accountant = ProcessCostAccountant() if PROCESS_COST_ENABLE else None
+
+    history = None
+    if METRIC_HISTORY_ENABLE:
+        try:
+            history = MetricHistory(history_metric_names(), writer=True)
+            HistorySampler(history, segment).start()
+            logger.info(f"[Resource-Monitor] Metric history => {history.path} "
+                        f"({history.total_size // 1024} KiB)")
+        except OSError as e:
+            logger.warning(f"[Resource-Monitor] Metric history tidak tersedia => {e}")
+
     while True:
         try:
+            cycle_start = time.time()
             # 1) Kumpulkan resource => dict
             resource_data = collect_resource_data()
             # 2) Kumpulkan stream_data & rtsp_config
-            stream_data, rtsp_cfg = collect_stream_info()
+            stream_data, rtsp_cfg, probe = collect_stream_info(prober)
+            # 2b) Biaya proses per channel & role (hls/record/probe/snapshot/analysis/transcode)
+            costs = accountant.sample() if accountant else None
 
             # 3) Gabungkan
             combined_data = {
                 "resource_usage": resource_data,
                 "stream_config":  stream_data,
-                "rtsp_config":    rtsp_cfg
+                "rtsp_config":    rtsp_cfg,
+                "rtsp_probe":     probe,
+                "process_costs":  costs
             }
 
-            # 4) Tulis ke JSON
-            with open(MONITOR_STATE_FILE, "w") as f:
-                json.dump(combined_data, f, indent=2)
+            # 4) Publikasi ke JSON (atomic replace + _meta.seq) => pembaca tidak
+            #    pernah melihat file setengah tertulis
+            seq = publish_state(MONITOR_STATE_FILE, combined_data)
+            if segment is not None:
+                segment.write_resource(combined_data, seq)
+            if history is not None:
+                record_cycle_history(history, probe, cycle_start, costs)
 
             # 5) Log ringkas CPU & RAM
             cpu_short = resource_data["cpu"]["usage_percent"]
@@ -250,7 +379,7 @@ def main():
             ts_local  = resource_data["timestamp_local"]
             logger.info(
                 f"[Resource-Monitor] CPU={cpu_short:.1f}% RAM={ram_short:.1f}% => "
-                f"Data diperbarui (LocalTime={ts_local})."
+                f"Data diperbarui (seq={seq}, LocalTime={ts_local})."
             )
 
         except Exception:
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+rtsp_prober.py
+
+Prober kesehatan NVR/RTSP berbasis asyncio untuk resource_monitor.py.
+Menggantikan 'ping' (subprocess ICMP) yang tidak membuktikan layanan RTSP hidup.
+
+Per siklus (semua konkuren, masing-masing dengan timeout):
+- NVR     : TCP connect ke RTSP_IP:RTSP_PORT + RTSP OPTIONS.
+- Internet: TCP connect ke PING_OUTSIDE_HOST:PING_OUTSIDE_PORT.
+- Channel : RTSP DESCRIBE per channel (Digest/Basic auth jika kredensial ada),
+            dijalankan tiap PROBE_CHANNEL_INTERVAL detik agar NVR tidak dibanjiri.
+
+Latency dicatat ke histogram bucket tetap (kumulatif sejak start) + estimasi p50/p95.
+
+Author: (Anda)
+"""
+
+import os
+import time
+import base64
+import asyncio
+import hashlib
+import re
+
+RTSP_PORT                = int(os.getenv("RTSP_PORT", "554"))
+PING_OUTSIDE_PORT        = int(os.getenv("PING_OUTSIDE_PORT", "443"))
+PROBE_TIMEOUT            = float(os.getenv("PROBE_TIMEOUT", "2.0"))
+PROBE_CHANNELS           = os.getenv("PROBE_CHANNELS", "true").lower() == "true"
+PROBE_CHANNEL_INTERVAL   = float(os.getenv("PROBE_CHANNEL_INTERVAL", "30"))
+PROBE_MAX_CONCURRENCY    = int(os.getenv("PROBE_MAX_CONCURRENCY", "4"))
+
+# Batas atas bucket histogram (ms); bucket terakhir = +inf
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_USER_AGENT = "cctv-resource-monitor"
+
+
+###############################################################################
+# 1. Histogram latency
+###############################################################################
+class LatencyHistogram:
+    def __init__(self):
+        self.counts   = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.failures = 0
+        self.total    = 0
+        self.sum_ms   = 0.0
+        self.last_ms  = None
+
+    def observe(self, ms):
+        self.total += 1
+        if ms is None:
+            self.failures += 1
+            self.last_ms = None
+            return
+        self.sum_ms += ms
+        self.last_ms = round(ms, 2)
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def _quantile(self, q: float):
+        ok = self.total - self.failures
+        if ok <= 0:
+            return None
+        target = q * ok
+        acc = 0
+        for i, cnt in enumerate(self.counts):
+            acc += cnt
+            if acc >= target:
+                return HISTOGRAM_BUCKETS_MS[i] if i < len(HISTOGRAM_BUCKETS_MS) else None
+        return None
+
+    def to_dict(self) -> dict:
+        ok = self.total - self.failures
+        labels = [f"le_{b}" for b in HISTOGRAM_BUCKETS_MS] + ["le_inf"]
+        return {
+            "buckets_ms": dict(zip(labels, self.counts)),
+            "count": self.total,
+            "failures": self.failures,
+            "avg_ms": round(self.sum_ms / ok, 2) if ok else None,
+            "p50_ms": self._quantile(0.50),
+            "p95_ms": self._quantile(0.95),
+            "last_ms": self.last_ms,
+        }
+
+
+###############################################################################
+# 2. RTSP client minimal
+###############################################################################
+def _parse_auth_params(header: str) -> dict:
+    return {k.lower(): v for k, v in re.findall(r'(\w+)="?([^",]*)"?', header)}
+
+def build_authorization(method: str, uri: str, challenge: str, user: str, pwd: str):
+    """
+    Header Authorization untuk tantangan WWW-Authenticate (Digest atau Basic).
+    """
+    if challenge.lower().startswith("basic"):
+        token = base64.b64encode(f"{user}:{pwd}".encode()).decode()
+        return f"Basic {token}"
+
+    params = _parse_auth_params(challenge[len("digest"):])
+    realm, nonce = params.get("realm", ""), params.get("nonce", "")
+    md5 = lambda s: hashlib.md5(s.encode()).hexdigest()
+    ha1 = md5(f"{user}:{realm}:{pwd}")
+    ha2 = md5(f"{method}:{uri}")
+    qop = params.get("qop", "")
+    if "auth" in qop.split(","):
+        nc, cnonce = "00000001", os.urandom(8).hex()
+        response = md5(f"{ha1}:{nonce}:{nc}:{cnonce}:auth:{ha2}")
+        extra = f', qop=auth, nc={nc}, cnonce="{cnonce}"'
+    else:
+        response = md5(f"{ha1}:{nonce}:{ha2}")
+        extra = ""
+    value = (f'Digest username="{user}", realm="{realm}", nonce="{nonce}", '
+             f'uri="{uri}", response="{response}"{extra}')
+    if params.get("opaque"):
+        value += f', opaque="{params["opaque"]}"'
+    return value
+
+
+async def _rtsp_request(reader, writer, method: str, url: str, cseq: int, extra_headers=None):
+    lines = [f"{method} {url} RTSP/1.0", f"CSeq: {cseq}", f"User-Agent: {_USER_AGENT}"]
+    if method == "DESCRIBE":
+        lines.append("Accept: application/sdp")
+    for k, v in (extra_headers or {}).items():
+        lines.append(f"{k}: {v}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+    await writer.drain()
+
+    head = await reader.readuntil(b"\r\n\r\n")
+    head_lines = head.decode(errors="ignore").split("\r\n")
+    parts = head_lines[0].split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("RTSP/"):
+        raise ValueError(f"respons bukan RTSP: {head_lines[0][:40]!r}")
+    status = int(parts[1])
+    headers = {}
+    for line in head_lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers.setdefault(k.strip().lower(), v.strip())
+    length = int(headers.get("content-length", "0") or 0)
+    if length:
+        await reader.readexactly(length)
+    return status, headers
+
+
+async def rtsp_check(host: str, port: int, method: str, url: str,
+                     user: str = None, pwd: str = None, timeout: float = PROBE_TIMEOUT) -> dict:
+    """
+    Return dict: connect_ms, rtsp_ms (waktu respons akhir), status, ok, error.
+    OPTIONS => ok jika status 200 (401 juga berarti layanan hidup).
+    DESCRIBE => ok hanya jika 200 setelah auth.
+    """
+    out = {"connect_ms": None, "rtsp_ms": None, "status": None, "ok": False, "error": None}
+    writer = None
+    try:
+        t0 = time.perf_counter()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        out["connect_ms"] = (time.perf_counter() - t0) * 1000.0
+
+        t1 = time.perf_counter()
+        status, headers = await asyncio.wait_for(
+            _rtsp_request(reader, writer, method, url, 1), timeout)
+        challenge = headers.get("www-authenticate")
+        if status == 401 and challenge and user:
+            auth = build_authorization(method, url, challenge, user, pwd or "")
+            t1 = time.perf_counter()
+            status, _ = await asyncio.wait_for(
+                _rtsp_request(reader, writer, method, url, 2, {"Authorization": auth}), timeout)
+        out["rtsp_ms"] = (time.perf_counter() - t1) * 1000.0
+        out["status"] = status
+        out["ok"] = status == 200 or (method == "OPTIONS" and status == 401)
+        if not out["ok"]:
+            out["error"] = "auth_failed" if status == 401 else f"rtsp_status_{status}"
+    except asyncio.TimeoutError:
+        out["error"] = "timeout"
+    except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+        out["error"] = type(e).__name__
+    finally:
+        if writer is not None:
+            writer.close()
+    return out
+
+
+async def tcp_check(host: str, port: int, timeout: float = PROBE_TIMEOUT):
+    """
+    Return latency TCP connect (ms) atau None jika gagal.
+    """
+    try:
+        t0 = time.perf_counter()
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        ms = (time.perf_counter() - t0) * 1000.0
+        writer.close()
+        return ms
+    except (OSError, asyncio.TimeoutError):
+        return None
+
+
+###############################################################################
+# 3. Prober
+###############################################################################
+class RtspProber:
+    """
+    Dipanggil sekali per siklus resource_monitor: probe_cycle() => dict hasil.
+    Histogram & hasil channel terakhir disimpan antar siklus.
+    """
+    def __init__(self, rtsp_ip: str, outside_host: str, user: str = None, pwd: str = None,
+                 subtype: str = "0"):
+        self.rtsp_ip      = rtsp_ip
+        self.outside_host = outside_host
+        self.user         = user
+        self.pwd          = pwd
+        self.subtype      = subtype
+
+        self.histograms   = {}      # {nama: LatencyHistogram}
+        self.channels     = {}      # {ch_str: hasil DESCRIBE terakhir}
+        self._next_channel_probe = 0.0
+
+    def _hist(self, name: str) -> LatencyHistogram:
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histograms[name] = LatencyHistogram()
+        return h
+
+    def channel_url(self, ch: int) -> str:
+        return (f"rtsp://{self.rtsp_ip}:{RTSP_PORT}/cam/realmonitor"
+                f"?channel={ch}&subtype={self.subtype}")
+
+    async def _probe_channel(self, sem, ch: int):
+        url = self.channel_url(ch)
+        async with sem:
+            res = await rtsp_check(self.rtsp_ip, RTSP_PORT, "DESCRIBE", url, self.user, self.pwd)
+        self._hist(f"ch{ch}_describe").observe(res["rtsp_ms"] if res["ok"] else None)
+        self.channels[str(ch)] = {
+            "ok": res["ok"],
+            "status": res["status"],
+            "error": res["error"],
+            "describe_ms": round(res["rtsp_ms"], 2) if res["rtsp_ms"] is not None else None,
+            "checked_at": time.time(),
+        }
+
+    async def _cycle(self, channel_list):
+        nvr_url = f"rtsp://{self.rtsp_ip}:{RTSP_PORT}/"
+        tasks = [
+            rtsp_check(self.rtsp_ip, RTSP_PORT, "OPTIONS", nvr_url),
+            tcp_check(self.outside_host, PING_OUTSIDE_PORT),
+        ]
+        now = time.monotonic()
+        if PROBE_CHANNELS and channel_list and now >= self._next_channel_probe:
+            self._next_channel_probe = now + PROBE_CHANNEL_INTERVAL
+            sem = asyncio.Semaphore(PROBE_MAX_CONCURRENCY)
+            tasks.extend(self._probe_channel(sem, ch) for ch in channel_list)
+        results = await asyncio.gather(*tasks)
+        return results[0], results[1]
+
+    def probe_cycle(self, channel_list) -> dict:
+        nvr, outside_ms = asyncio.run(self._cycle(channel_list))
+
+        self._hist("nvr_tcp_connect").observe(nvr["connect_ms"])
+        self._hist("nvr_rtsp_options").observe(nvr["rtsp_ms"] if nvr["ok"] else None)
+        self._hist("outside_tcp_connect").observe(outside_ms)
+
+        return {
+            "nvr": {
+                "tcp_ok": nvr["connect_ms"] is not None,
+                "rtsp_ok": nvr["ok"],
+                "status": nvr["status"],
+                "error": nvr["error"],
+                "connect_ms": round(nvr["connect_ms"], 2) if nvr["connect_ms"] is not None else None,
+                "options_ms": round(nvr["rtsp_ms"], 2) if nvr["rtsp_ms"] is not None else None,
+            },
+            "outside": {
+                "host": self.outside_host,
+                "port": PING_OUTSIDE_PORT,
+                "ok": outside_ms is not None,
+                "connect_ms": round(outside_ms, 2) if outside_ms is not None else None,
+            },
+            "channels": dict(self.channels),
+            "histograms": {k: h.to_dict() for k, h in sorted(self.histograms.items())},
+        }
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+metric_history.py
+
+Riwayat time-series metrik resource & channel dalam file ring buffer (mmap).
+
+- Ukuran tetap, ditentukan saat file dibuat => footprint memori & disk terbatas
+  berapa pun lamanya uptime. Karena di disk (mmap), riwayat bertahan saat restart.
+- Tiga tier downsampling (default):
+    1s  x 3600 slot  => 1 jam terakhir
+    1m  x 1440 slot  => 1 hari terakhir
+    1h  x 720  slot  => 30 hari terakhir
+- Setiap sample langsung diagregasi ke semua tier (min/max/sum/count per metrik),
+  sehingga avg = sum/count tetap akurat tanpa job downsampling terpisah.
+- Slot dipilih dengan (ts // resolusi) % kapasitas; slot menyimpan ts bucket-nya
+  sendiri. Slot dengan ts berbeda = basi => di-reset saat ditulis, diabaikan saat dibaca.
+- Satu proses writer (resource_monitor.py). Pembaca (backend_api.py) memakai
+  seqlock di header: salinan dibuang & diulang jika writer sedang menulis.
+- Layout berubah => file baru dibuat di samping lalu os.replace (tidak pernah
+  truncate file yang mungkin masih di-mmap pembaca); pembaca membuka ulang saat
+  inode file berubah.
+
+Author: (Anda)
+"""
+
+import os
+import math
+import mmap
+import time
+import fcntl
+import struct
+import tempfile
+import threading
+
+METRIC_HISTORY_PATH = os.getenv("METRIC_HISTORY_PATH", "/mnt/Data/Syslog/resource/metric_history.bin")
+# "resolusi_detik:jumlah_slot,..."
+METRIC_HISTORY_TIERS = os.getenv("METRIC_HISTORY_TIERS", "1:3600,60:1440,3600:720")
+
+_MAGIC       = b"CCTVHIS1"
+_HEADER      = struct.Struct("<8sIIII")   # magic, versi, seq, n_metric, n_tier
+_HEADER_SIZE = 64
+_SEQ_OFFSET  = 12
+_SEQ         = struct.Struct("<I")
+_NAME_SIZE   = 32
+_TIER        = struct.Struct("<II")       # resolusi, kapasitas
+_SLOT_TS     = struct.Struct("<q")
+_STATS       = 4                          # min, max, sum, count
+_MAX_SPIN    = 1000
+
+
+def _open_locked(path: str) -> int:
+    """
+    Buka + flock file yang saat ini ada di 'path'. Writer lain bisa mengganti file
+    (os.replace) selagi kita menunggu lock => ulang jika inode sudah berbeda.
+    """
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def parse_tiers(spec: str) -> list:
+    tiers = []
+    for part in spec.split(","):
+        res, cap = part.strip().split(":")
+        tiers.append((int(res), int(cap)))
+    return sorted(tiers)
+
+
+class MetricHistory:
+    """
+    MetricHistory(names, writer=True) => buat/buka file untuk menulis.
+    MetricHistory.open_reader()       => None jika file belum ada.
+
+    Daftar metrik dibekukan di file; jika writer meminta daftar/tier berbeda,
+    file dibuat ulang (riwayat lama dibuang).
+    """
+    def __init__(self, names=None, path: str = None, tiers=None, writer: bool = False):
+        self.path   = path or METRIC_HISTORY_PATH
+        self.writer = writer
+        self._lock  = threading.Lock()
+
+        if writer:
+            self._open_writer(list(names), tiers or parse_tiers(METRIC_HISTORY_TIERS))
+        else:
+            self._open_reader()
+
+    @classmethod
+    def open_reader(cls, path: str = None):
+        try:
+            return cls(path=path)
+        except (OSError, ValueError):
+            return None
+
+    # ------------------------------------------------------------------
+    # Layout
+    # ------------------------------------------------------------------
+    def _compute_layout(self, names, tiers):
+        self.names      = names
+        self.index      = {n: i for i, n in enumerate(names)}
+        self.tiers      = tiers
+        self._slot_vals = struct.Struct("<" + "d" * (len(names) * _STATS))
+        self.slot_size  = _SLOT_TS.size + self._slot_vals.size
+
+        offset = _HEADER_SIZE + len(names) * _NAME_SIZE + len(tiers) * _TIER.size
+        offset = (offset + 63) // 64 * 64
+        self.tier_offsets = []
+        for _, cap in tiers:
+            self.tier_offsets.append(offset)
+            offset += cap * self.slot_size
+        self.total_size = offset
+
+    def _header_bytes(self) -> bytes:
+        out = bytearray(_HEADER.pack(_MAGIC, 1, 0, len(self.names), len(self.tiers)))
+        out += b"\0" * (_HEADER_SIZE - len(out))
+        for n in self.names:
+            out += n.encode()[:_NAME_SIZE].ljust(_NAME_SIZE, b"\0")
+        for res, cap in self.tiers:
+            out += _TIER.pack(res, cap)
+        return bytes(out)
+
+    @staticmethod
+    def _read_layout(fd):
+        head = os.pread(fd, _HEADER.size, 0)
+        if len(head) != _HEADER.size:
+            raise ValueError("header history tidak lengkap")
+        magic, _, _, n_metric, n_tier = _HEADER.unpack(head)
+        if magic != _MAGIC:
+            raise ValueError("magic history tidak dikenal")
+        raw = os.pread(fd, n_metric * _NAME_SIZE + n_tier * _TIER.size, _HEADER_SIZE)
+        names = [raw[i * _NAME_SIZE:(i + 1) * _NAME_SIZE].rstrip(b"\0").decode()
+                 for i in range(n_metric)]
+        base = n_metric * _NAME_SIZE
+        tiers = [_TIER.unpack_from(raw, base + i * _TIER.size) for i in range(n_tier)]
+        return names, tiers
+
+    def _open_writer(self, names, tiers):
+        tiers = [tuple(t) for t in tiers]
+        self._compute_layout(names, tiers)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = _open_locked(self.path)
+        try:
+            try:
+                same = self._read_layout(fd) == (names, tiers)
+            except ValueError:
+                same = False
+            if not same or os.fstat(fd).st_size != self.total_size:
+                fd = self._replace_file(fd)
+            self._mm = mmap.mmap(fd, self.total_size, mmap.MAP_SHARED,
+                                 mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            # mmap memegang dup fd => lock dilepas eksplisit, bukan lewat close
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _replace_file(self, old_fd: int) -> int:
+        """
+        Layout baru dibangun di file temp lalu os.replace. File lama tidak pernah
+        di-truncate => reader yang masih memetakannya (backend) tidak kena SIGBUS,
+        dan membuka ulang karena st_ino berubah. Return fd file baru (terkunci).
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                        prefix="." + os.path.basename(self.path) + ".",
+                                        suffix=".tmp")
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.fchmod(fd, 0o644)
+            os.ftruncate(fd, self.total_size)
+            os.pwrite(fd, self._header_bytes(), 0)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.close(fd)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        os.close(old_fd)
+        return fd
+
+    def _open_reader(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            names, tiers = self._read_layout(fd)
+            self._compute_layout(names, tiers)
+            if os.fstat(fd).st_size < self.total_size:
+                raise ValueError("file history terpotong")
+            self._mm = mmap.mmap(fd, self.total_size, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self._mm.close()
+
+    # ------------------------------------------------------------------
+    # Tulis
+    # ------------------------------------------------------------------
+    def record(self, values: dict, ts: float = None):
+        """
+        Tambahkan satu sample. values => {nama_metrik: angka}; metrik lain tidak disentuh.
+        None / NaN / nama tidak dikenal diabaikan.
+        """
+        ts = int(ts if ts is not None else time.time())
+        items = []
+        for name, v in values.items():
+            idx = self.index.get(name)
+            if idx is None or v is None:
+                continue
+            v = float(v)
+            if math.isnan(v):
+                continue
+            items.append((idx, v))
+        if not items:
+            return
+
+        mm = self._mm
+        with self._lock:
+            seq = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            _SEQ.pack_into(mm, _SEQ_OFFSET, (seq + 1) & 0xFFFFFFFF)
+            try:
+                for (res, cap), base in zip(self.tiers, self.tier_offsets):
+                    bucket = ts - ts % res
+                    off = base + ((bucket // res) % cap) * self.slot_size
+                    if _SLOT_TS.unpack_from(mm, off)[0] != bucket:
+                        vals = [math.inf, -math.inf, 0.0, 0.0] * len(self.names)
+                    else:
+                        vals = list(self._slot_vals.unpack_from(mm, off + _SLOT_TS.size))
+                    for idx, v in items:
+                        j = idx * _STATS
+                        if v < vals[j]:
+                            vals[j] = v
+                        if v > vals[j + 1]:
+                            vals[j + 1] = v
+                        vals[j + 2] += v
+                        vals[j + 3] += 1.0
+                    self._slot_vals.pack_into(mm, off + _SLOT_TS.size, *vals)
+                    _SLOT_TS.pack_into(mm, off, bucket)
+            finally:
+                _SEQ.pack_into(mm, _SEQ_OFFSET, (seq + 2) & 0xFFFFFFFF)
+
+    # ------------------------------------------------------------------
+    # Baca
+    # ------------------------------------------------------------------
+    def pick_resolution(self, start: float, end: float, max_points: int) -> int:
+        """
+        Tier terhalus yang masih mencakup 'start' dan jumlah titiknya <= max_points.
+        """
+        now = time.time()
+        for res, cap in self.tiers:
+            if now - start <= res * cap and (end - start) / res <= max_points:
+                return res
+        return self.tiers[-1][0]
+
+    def _copy_tier(self, tier_idx: int) -> bytes:
+        res, cap = self.tiers[tier_idx]
+        base = self.tier_offsets[tier_idx]
+        mm = self._mm
+        for _ in range(_MAX_SPIN):
+            s1 = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            if s1 & 1:
+                time.sleep(0.001)
+                continue
+            data = mm[base:base + cap * self.slot_size]
+            if _SEQ.unpack_from(mm, _SEQ_OFFSET)[0] == s1:
+                return data
+        raise TimeoutError("history sedang ditulis terus-menerus")
+
+    def query(self, names, start: float, end: float, resolution: int,
+              stats=("avg", "min", "max")) -> dict:
+        """
+        Return format kolom ringkas:
+        {"resolution": r, "start": t0, "points": n,
+         "metrics": {nama: {"avg": [...], "min": [...], "max": [...]}}}
+        Slot kosong => null.
+        """
+        tier_idx = next(i for i, (res, _) in enumerate(self.tiers) if res == resolution)
+        res, cap = self.tiers[tier_idx]
+        t0 = int(start) - int(start) % res
+        t1 = int(end) - int(end) % res
+        n = max(0, min((t1 - t0) // res + 1, cap))
+        t0 = t1 - (n - 1) * res if n else t0
+
+        data = self._copy_tier(tier_idx)
+        names = [nm for nm in names if nm in self.index]
+        out = {nm: {st: [None] * n for st in stats} for nm in names}
+        for k in range(n):
+            bucket = t0 + k * res
+            off = ((bucket // res) % cap) * self.slot_size
+            if _SLOT_TS.unpack_from(data, off)[0] != bucket:
+                continue
+            for nm in names:
+                j = off + _SLOT_TS.size + self.index[nm] * _STATS * 8
+                mn, mx, total, cnt = struct.unpack_from("<dddd", data, j)
+                if cnt <= 0:
+                    continue
+                col = out[nm]
+                if "avg" in col:
+                    col["avg"][k] = round(total / cnt, 3)
+                if "min" in col:
+                    col["min"][k] = round(mn, 3)
+                if "max" in col:
+                    col["max"][k] = round(mx, 3)
+        return {"resolution": res, "start": t0, "points": n, "metrics": out}
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+recording_catalog.py
+
+Katalog rekaman (SQLite) => pengganti glob + stat rekursif di /mnt/Data/Backup.
+
+- Satu baris per file rekaman: path, channel, start_ts, end_ts, duration, size,
+  codec, trigger (full / motion / object).
+- Writer utama: BackupSession (backup/backup_manager.py) saat file ditutup.
+  cleanup.py menghapus baris bersama file/folder-nya.
+- Pembaca: backend_api.py (/status) => COUNT/MIN/MAX ter-index, hitungan milidetik.
+- DB disimpan di disk Syslog (lokal), BUKAN di share NAS: SQLite + NFS tidak aman
+  untuk locking. Mode WAL => pembaca tidak memblok writer.
+- Rekaman lama (sebelum katalog ada) diimpor sekali lewat backfill(); selama
+  backfill belum selesai, pembaca sebaiknya fallback ke scan direktori.
+- Kolom tier: "original" (copy main-stream), "low" (sudah di-transcode oleh
+  backup/transcode_tier.py), "keep" (transcode tidak menghemat => dibiarkan).
+- Kolom activity: jumlah sampel keyframe bergerak hasil backup/motion_prune.py
+  (NULL = belum dinilai).
+
+CLI:
+  python3 recording_catalog.py summary          # ringkasan JSON
+  python3 recording_catalog.py backfill [root]  # impor file yang belum tercatat
+
+Author: (Anda)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+
+RECORDING_CATALOG_PATH = os.getenv("RECORDING_CATALOG_PATH", "/mnt/Data/Syslog/rtsp/recordings.db")
+RECORDING_ROOT         = os.getenv("BACKUP_DIR", "/mnt/Data/Backup")
+
+TRIGGERS = ("full", "motion", "object")
+TIERS    = ("original", "low", "keep")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    path     TEXT PRIMARY KEY,
+    channel  INTEGER NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts   REAL NOT NULL,
+    duration REAL NOT NULL,
+    size     INTEGER NOT NULL,
+    codec    TEXT,
+    trigger  TEXT,
+    tier     TEXT NOT NULL DEFAULT 'original',
+    activity INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_start ON recordings(start_ts);
+CREATE INDEX IF NOT EXISTS idx_recordings_end ON recordings(end_ts);
+CREATE INDEX IF NOT EXISTS idx_recordings_channel ON recordings(channel, start_ts);
+CREATE INDEX IF NOT EXISTS idx_recordings_tier ON recordings(tier, end_ts);
+CREATE INDEX IF NOT EXISTS idx_recordings_activity ON recordings(activity, start_ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Kolom yang ditambahkan setelah versi pertama => (nama, deklarasi) untuk ALTER TABLE
+_ADDED_COLUMNS = (
+    ("tier",     "TEXT NOT NULL DEFAULT 'original'"),
+    ("activity", "INTEGER"),
+)
+
+# .../dd-MM-yyyy/Channel-N/CH<N>-HH-MM-SS.mkv (lihat BackupSession._make_filename)
+_FILE_RE = re.compile(r"(\d{2}-\d{2}-\d{4})[/\\]Channel-(\d+)[/\\]CH\d+-(\d{2}-\d{2}-\d{2})\.\w+$")
+
+
+def _prefix_range(prefix: str):
+    # path di bawah folder 'prefix' => range [prefix/, prefix0) ('0' = '/' + 1) => pakai PK index
+    prefix = prefix.rstrip("/")
+    return prefix + "/", prefix + "0"
+
+
+def parse_recording_path(path: str):
+    """
+    Return (channel, start_ts) dari nama file standar, atau None.
+    """
+    m = _FILE_RE.search(path)
+    if not m:
+        return None
+    try:
+        start = datetime.strptime(f"{m.group(1)} {m.group(3)}", "%d-%m-%Y %H-%M-%S")
+    except ValueError:
+        return None
+    return int(m.group(2)), start.timestamp()
+
+
+class RecordingCatalog:
+    """
+    Satu koneksi SQLite per thread (thread channel di backup/main.py menulis bersamaan;
+    serialisasi tulis ditangani SQLite + busy_timeout).
+    """
+    def __init__(self, path: str = None, readonly: bool = False):
+        self.path     = path or RECORDING_CATALOG_PATH
+        self.readonly = readonly
+        self._local   = threading.local()
+        if not readonly:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = self._conn()
+            self._migrate(conn)
+            conn.executescript(_SCHEMA)
+            conn.commit()
+
+    @staticmethod
+    def _migrate(conn):
+        # DB versi lama => tambah kolom yang belum ada (sebelum index dibuat)
+        cols = [r[1] for r in conn.execute("PRAGMA table_info(recordings)")]
+        if not cols:
+            return
+        for name, decl in _ADDED_COLUMNS:
+            if name not in cols:
+                conn.execute(f"ALTER TABLE recordings ADD COLUMN {name} {decl}")
+
+    @classmethod
+    def open_reader(cls, path: str = None):
+        """
+        None jika DB belum dibuat writer.
+        """
+        path = path or RECORDING_CATALOG_PATH
+        if not os.path.isfile(path):
+            return None
+        try:
+            return cls(path, readonly=True)
+        except sqlite3.Error:
+            return None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Pembaca tetap koneksi biasa: mode WAL butuh akses tulis ke file -shm
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            if not self.readonly:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------
+    # Tulis
+    # ------------------------------------------------------------------
+    def add(self, path: str, channel: int, start_ts: float, end_ts: float,
+            size: int, codec: str = None, trigger: str = None, tier: str = "original"):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recordings "
+                "(path, channel, start_ts, end_ts, duration, size, codec, trigger, tier) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, int(channel), start_ts, end_ts, max(0.0, end_ts - start_ts),
+                 int(size), codec, trigger, tier))
+
+    def set_tier(self, path: str, tier: str, size: int = None, codec: str = None):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE recordings SET tier = ?, size = COALESCE(?, size), "
+                "codec = COALESCE(?, codec) WHERE path = ?",
+                (tier, size, codec, path))
+
+    def delete(self, path: str) -> int:
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM recordings WHERE path = ?", (path,)).rowcount
+
+    def delete_under(self, folder: str) -> int:
+        """
+        Hapus semua baris di bawah folder (mis. folder harian yang di-rmtree).
+        """
+        lo, hi = _prefix_range(folder)
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM recordings WHERE path >= ? AND path < ?",
+                                (lo, hi)).rowcount
+
+    def set_meta(self, key: str, value):
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                         (key, json.dumps(value)))
+
+    def get_meta(self, key: str, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    # ------------------------------------------------------------------
+    # Baca
+    # ------------------------------------------------------------------
+    @property
+    def backfilled(self) -> bool:
+        try:
+            return bool(self.get_meta("backfill_done", False))
+        except sqlite3.Error:
+            return False
+
+    def summary(self, channel: int = None) -> dict:
+        sql = "SELECT COUNT(*), MIN(start_ts), MAX(end_ts), COALESCE(SUM(size), 0) FROM recordings"
+        args = ()
+        if channel is not None:
+            sql += " WHERE channel = ?"
+            args = (int(channel),)
+        count, start, end, total = self._conn().execute(sql, args).fetchone()
+        return {"file_count": count, "start_ts": start, "end_ts": end, "total_bytes": total}
+
+    def channel_summary(self) -> dict:
+        rows = self._conn().execute(
+            "SELECT channel, COUNT(*), MIN(start_ts), MAX(end_ts), SUM(size) "
+            "FROM recordings GROUP BY channel ORDER BY channel").fetchall()
+        return {str(ch): {"file_count": n, "start_ts": s, "end_ts": e, "total_bytes": b}
+                for ch, n, s, e, b in rows}
+
+    def transcode_candidates(self, before_ts: float, limit: int = 20) -> list:
+        """
+        Rekaman tier original yang selesai sebelum before_ts, terlama dulu.
+        """
+        rows = self._conn().execute(
+            "SELECT path, channel, start_ts, end_ts, size FROM recordings "
+            "WHERE tier = 'original' AND end_ts < ? ORDER BY end_ts LIMIT ?",
+            (before_ts, int(limit))).fetchall()
+        keys = ("path", "channel", "start_ts", "end_ts", "size")
+        return [dict(zip(keys, r)) for r in rows]
+
+    def set_activity(self, path: str, activity: int):
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE recordings SET activity = ? WHERE path = ?", (int(activity), path))
+
+    def prune_candidates(self, before_ts: float, limit: int = 50,
+                         include_untagged: bool = False) -> list:
+        """
+        Rekaman mode full (trigger "full"; opsional juga hasil backfill tanpa trigger)
+        yang belum dinilai & mulai sebelum before_ts, urut start_ts.
+        """
+        where = "trigger = 'full'"
+        if include_untagged:
+            where = "(trigger = 'full' OR trigger IS NULL)"
+        rows = self._conn().execute(
+            "SELECT path, channel, start_ts, end_ts, size FROM recordings "
+            f"WHERE {where} AND activity IS NULL AND start_ts < ? ORDER BY start_ts LIMIT ?",
+            (before_ts, int(limit))).fetchall()
+        keys = ("path", "channel", "start_ts", "end_ts", "size")
+        return [dict(zip(keys, r)) for r in rows]
+
+    def last_start_before(self, channel: int, ts: float):
+        # start_ts rekaman channel terakhir yang mulai sebelum ts (None jika tidak ada)
+        row = self._conn().execute(
+            "SELECT MAX(start_ts) FROM recordings WHERE channel = ? AND start_ts < ?",
+            (int(channel), ts)).fetchone()
+        return row[0] if row else None
+
+    def tier_summary(self) -> dict:
+        rows = self._conn().execute(
+            "SELECT tier, COUNT(*), COALESCE(SUM(size), 0) FROM recordings GROUP BY tier").fetchall()
+        return {tier: {"file_count": n, "total_bytes": b} for tier, n, b in rows}
+
+    def usage_by_day(self) -> list:
+        """
+        [(channel, "dd-mm-YYYY", bytes, files)] => tanggal lokal dari start_ts,
+        sama dengan nama folder harian BackupSession.
+        """
+        return self._conn().execute(
+            "SELECT channel, strftime('%d-%m-%Y', start_ts, 'unixepoch', 'localtime') AS day, "
+            "SUM(size), COUNT(*) FROM recordings GROUP BY channel, day").fetchall()
+
+    def query(self, channel: int, start_ts: float, end_ts: float) -> list:
+        """
+        Rekaman channel yang beririsan dengan [start_ts, end_ts], urut waktu.
+        """
+        rows = self._conn().execute(
+            "SELECT path, start_ts, end_ts, duration, size, codec, trigger FROM recordings "
+            "WHERE channel = ? AND start_ts <= ? AND end_ts >= ? ORDER BY start_ts",
+            (int(channel), end_ts, start_ts)).fetchall()
+        keys = ("path", "start_ts", "end_ts", "duration", "size", "codec", "trigger")
+        return [dict(zip(keys, r)) for r in rows]
+
+    # ------------------------------------------------------------------
+    # Impor rekaman lama
+    # ------------------------------------------------------------------
+    def backfill(self, root: str = None, batch: int = 500) -> int:
+        """
+        Scan sekali (os.scandir) & catat file rekaman yang belum ada di katalog.
+        start dari nama file, end dari mtime. Return jumlah baris baru.
+        """
+        root = root or RECORDING_ROOT
+        conn = self._conn()
+        pending, added = [], 0
+
+        def flush():
+            nonlocal added
+            if pending:
+                # total_changes => hanya baris yang benar-benar masuk (IGNORE tidak dihitung)
+                before = conn.total_changes
+                with conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO recordings "
+                        "(path, channel, start_ts, end_ts, duration, size, codec, trigger) "
+                        "VALUES (?, ?, ?, ?, ?, ?, NULL, NULL)", pending)
+                added += conn.total_changes - before
+                pending.clear()
+
+        stack = [root]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    parsed = parse_recording_path(entry.path)
+                    if parsed is None:
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                ch, start = parsed
+                end = max(start, st.st_mtime)
+                pending.append((entry.path, ch, start, end, end - start, st.st_size))
+                if len(pending) >= batch:
+                    flush()
+        flush()
+        self.set_meta("backfill_done", time.time())
+        return added
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("summary", "backfill"):
+        print("Usage: recording_catalog.py summary | backfill [root]")
+        return 2
+    if argv[0] == "backfill":
+        cat = RecordingCatalog()
+        t0 = time.monotonic()
+        n = cat.backfill(argv[1] if len(argv) > 1 else None)
+        print(f"[CATALOG] {n} file diimpor dalam {time.monotonic() - t0:.1f}s")
+        return 0
+    cat = RecordingCatalog.open_reader()
+    if cat is None:
+        print(f"[ERROR] Katalog {RECORDING_CATALOG_PATH} belum tersedia.")
+        return 1
+    print(json.dumps({"total": cat.summary(), "channels": cat.channel_summary(),
+                      "tiers": cat.tier_summary()}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+recording_index.py
+
+Indeks keyframe sidecar per file rekaman => seek ke waktu wall-clock mana pun di arsip
+tanpa decode linear.
+
+- Sidecar: ".<nama file>.idx" (JSON, tersembunyi) di direktori yang sama dengan rekaman.
+  Berisi format, start_ts (wall clock), durasi, ukuran/mtime file (validasi basi),
+  init segment (fMP4) dan daftar keyframe [offset_detik, byte_pos, panjang].
+- fMP4 (RECORD_FORMAT=fmp4): box MP4 di-parse langsung (hanya header moof/tfdt, tanpa
+  membaca mdat) => satu entri per fragmen; -movflags frag_keyframe => tiap fragmen
+  dimulai keyframe. panjang = moof + mdat => siap dipakai sebagai byte-range HLS.
+- Matroska: ffprobe packet keyframe video (pts_time, pos); panjang None.
+- Seek: katalog (index SQLite channel,start_ts) => file; bisect di keyframe => O(log n).
+- File terpotong (crash) => fragmen terakhir yang tidak lengkap diabaikan.
+
+CLI:
+  python3 recording_index.py build <file>...          # tulis / perbarui sidecar
+  python3 recording_index.py seek <channel> <waktu>   # waktu: "YYYY-mm-dd HH:MM:SS" / epoch
+  python3 recording_index.py reindex [root]           # sidecar untuk file yang belum punya
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import bisect
+import subprocess
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from recording_catalog import RecordingCatalog, parse_recording_path, RECORDING_ROOT
+
+INDEX_VERSION = 1
+INDEX_SUFFIX  = ".idx"
+
+
+def index_path_for(path: str) -> str:
+    d, name = os.path.split(path)
+    return os.path.join(d, f".{name}{INDEX_SUFFIX}")
+
+
+###############################################################################
+# 1. Parser fMP4
+###############################################################################
+def _iter_boxes(f, start: int, end: int):
+    """
+    Yield (type, pos, size, header_len) untuk box di [start, end). Box terpotong
+    (size melewati end) tetap di-yield; pemanggil yang memutuskan.
+    """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            return
+        size, typ = struct.unpack(">I4s", hdr)
+        hlen = 8
+        if size == 1:
+            ext = f.read(8)
+            if len(ext) < 8:
+                return
+            size, hlen = struct.unpack(">Q", ext)[0], 16
+        elif size == 0:
+            size = end - pos
+        if size < hlen:
+            return
+        yield typ.decode("latin-1"), pos, size, hlen
+        pos += size
+
+
+def _child(f, pos, size, hlen, name):
+    for typ, p, s, h in _iter_boxes(f, pos + hlen, pos + size):
+        if typ == name:
+            return p, s, h
+    return None
+
+
+def _video_track(f, moov) -> tuple:
+    """
+    (track_id, timescale) track video pertama di moov.
+    """
+    for typ, p, s, h in _iter_boxes(f, moov[0] + moov[2], moov[0] + moov[1]):
+        if typ != "trak":
+            continue
+        mdia = _child(f, p, s, h, "mdia")
+        tkhd = _child(f, p, s, h, "tkhd")
+        if mdia is None or tkhd is None:
+            continue
+        hdlr = _child(f, *mdia, "hdlr")
+        mdhd = _child(f, *mdia, "mdhd")
+        if hdlr is None or mdhd is None:
+            continue
+        f.seek(hdlr[0] + hdlr[2] + 8)
+        if f.read(4) != b"vide":
+            continue
+        f.seek(tkhd[0] + tkhd[2])
+        version = f.read(1)[0]
+        f.seek(tkhd[0] + tkhd[2] + (20 if version == 1 else 12))
+        track_id = struct.unpack(">I", f.read(4))[0]
+        f.seek(mdhd[0] + mdhd[2])
+        version = f.read(1)[0]
+        f.seek(mdhd[0] + mdhd[2] + (20 if version == 1 else 12))
+        timescale = struct.unpack(">I", f.read(4))[0]
+        return track_id, timescale
+    return None, None
+
+
+def _fragment_time(f, moof, track_id):
+    # baseMediaDecodeTime (tfdt) traf milik track video
+    for typ, p, s, h in _iter_boxes(f, moof[0] + moof[2], moof[0] + moof[1]):
+        if typ != "traf":
+            continue
+        tfhd = _child(f, p, s, h, "tfhd")
+        if tfhd is None:
+            continue
+        f.seek(tfhd[0] + tfhd[2] + 4)
+        if struct.unpack(">I", f.read(4))[0] != track_id:
+            continue
+        tfdt = _child(f, p, s, h, "tfdt")
+        if tfdt is None:
+            return None
+        f.seek(tfdt[0] + tfdt[2])
+        version = f.read(1)[0]
+        f.seek(tfdt[0] + tfdt[2] + 4)
+        if version == 1:
+            return struct.unpack(">Q", f.read(8))[0]
+        return struct.unpack(">I", f.read(4))[0]
+    return None
+
+
+def index_fmp4(path: str) -> dict:
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        boxes = list(_iter_boxes(f, 0, size))
+        moov = next(((p, s, h) for t, p, s, h in boxes if t == "moov"), None)
+        if moov is None:
+            raise ValueError("moov tidak ditemukan (bukan fMP4?)")
+        track_id, timescale = _video_track(f, moov)
+        if not timescale:
+            raise ValueError("track video tidak ditemukan")
+
+        frags, base = [], None
+        for i, (typ, p, s, h) in enumerate(boxes):
+            if typ != "moof":
+                continue
+            nxt = boxes[i + 1] if i + 1 < len(boxes) else None
+            if nxt is None or nxt[0] != "mdat" or nxt[1] + nxt[2] > size:
+                break   # fragmen terakhir terpotong (crash / masih ditulis)
+            t = _fragment_time(f, (p, s, h), track_id)
+            if t is None:
+                continue
+            if base is None:
+                base = t
+            frags.append([round((t - base) / timescale, 3), p, s + nxt[2]])
+
+    if not frags:
+        raise ValueError("tidak ada fragmen lengkap")
+    gaps = [b[0] - a[0] for a, b in zip(frags, frags[1:])]
+    last = sum(gaps) / len(gaps) if gaps else 0.0
+    return {
+        "format": "fmp4",
+        "init": [0, frags[0][1]],
+        "duration": round(frags[-1][0] + last, 3),
+        "keyframes": frags,
+    }
+
+
+###############################################################################
+# 2. Matroska (ffprobe)
+###############################################################################
+def index_ffprobe(path: str) -> dict:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,pos,flags:format=duration",
+         "-of", "compact=p=0:nk=1", path],
+        capture_output=True, text=True, timeout=300)
+    if out.returncode != 0:
+        raise ValueError(out.stderr.strip() or f"ffprobe rc={out.returncode}")
+    frames, base, duration = [], None, None
+    for line in out.stdout.splitlines():
+        parts = line.split("|")
+        if len(parts) == 1:
+            try:
+                duration = float(parts[0])
+            except ValueError:
+                pass
+            continue
+        if len(parts) < 3 or "K" not in parts[2]:
+            continue
+        try:
+            t, pos = float(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        if base is None:
+            base = t
+        frames.append([round(t - base, 3), pos, None])
+    if not frames:
+        raise ValueError("tidak ada keyframe")
+    return {"format": "mkv", "init": None, "duration": duration, "keyframes": frames}
+
+
+###############################################################################
+# 3. Sidecar
+###############################################################################
+def build_index(path: str, start_ts: float = None) -> dict:
+    st = os.stat(path)
+    if path.lower().endswith(".mp4"):
+        doc = index_fmp4(path)
+    else:
+        doc = index_ffprobe(path)
+    if start_ts is None:
+        parsed = parse_recording_path(path)
+        start_ts = parsed[1] if parsed else st.st_mtime - (doc["duration"] or 0.0)
+    doc.update({
+        "version": INDEX_VERSION,
+        "file": os.path.basename(path),
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "start_ts": start_ts,
+        "built_at": time.time(),
+    })
+    return doc
+
+
+def save_index(path: str, doc: dict):
+    side = index_path_for(path)
+    tmp = side + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(doc, f, separators=(",", ":"))
+    os.replace(tmp, side)
+
+
+def write_index(path: str, start_ts: float = None) -> dict:
+    doc = build_index(path, start_ts)
+    save_index(path, doc)
+    return doc
+
+
+def index_is_current(doc: dict, path: str) -> bool:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return (doc.get("version") == INDEX_VERSION and doc.get("size") == st.st_size
+            and abs(doc.get("mtime", 0) - st.st_mtime) < 1e-3)
+
+
+def load_index(path: str, build: bool = True):
+    """
+    Sidecar valid => dibaca; basi / tidak ada => dibangun ulang (build=True) atau None.
+    Build hanya sekali; sidecar tidak bisa ditulis => dokumen di memori tetap dikembalikan.
+    File hilang / tidak bisa diindeks => OSError / ValueError dari build_index.
+    """
+    try:
+        with open(index_path_for(path)) as f:
+            doc = json.load(f)
+        if index_is_current(doc, path):
+            return doc
+    except (OSError, ValueError):
+        pass
+    if not build:
+        return None
+    doc = build_index(path)
+    try:
+        save_index(path, doc)
+    except OSError:
+        # Direktori read-only (mis. container stream) => indeks di memori saja
+        pass
+    return doc
+
+
+def remove_index(path: str):
+    try:
+        os.remove(index_path_for(path))
+    except OSError:
+        pass
+
+
+###############################################################################
+# 4. Seek
+###############################################################################
+def seek(doc: dict, wall_ts: float):
+    """
+    Keyframe terakhir <= wall_ts. Return dict (offset_s, pos, length, keyframe_ts, i)
+    atau None jika wall_ts di luar file.
+    """
+    frames = doc["keyframes"]
+    rel = wall_ts - doc["start_ts"]
+    duration = doc.get("duration")
+    if rel < 0 or (duration is not None and rel > duration):
+        return None
+    times = doc.get("_times")
+    if times is None:
+        times = doc["_times"] = [k[0] for k in frames]
+    i = max(0, bisect.bisect_right(times, rel) - 1)
+    t, pos, length = frames[i]
+    return {"i": i, "offset_s": t, "pos": pos, "length": length,
+            "keyframe_ts": doc["start_ts"] + t}
+
+
+def locate(catalog: RecordingCatalog, channel: int, wall_ts: float):
+    """
+    File + keyframe untuk waktu wall-clock di channel. None jika tidak ada rekaman.
+    """
+    rows = [r for r in catalog.query(channel, wall_ts, wall_ts) if r["start_ts"] <= wall_ts]
+    for row in reversed(rows):
+        try:
+            doc = load_index(row["path"])
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            continue
+        hit = seek(doc, wall_ts)
+        if hit is not None:
+            hit["path"] = row["path"]
+            return hit
+    return None
+
+
+###############################################################################
+# 5. CLI
+###############################################################################
+def _parse_time(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    cmd = argv[0] if argv else ""
+    if cmd == "build" and len(argv) > 1:
+        for path in argv[1:]:
+            t0 = time.monotonic()
+            doc = write_index(path)
+            print(f"[INDEX] {path} => {doc['format']} {len(doc['keyframes'])} keyframe, "
+                  f"{doc['duration']}s ({(time.monotonic() - t0) * 1000:.0f} ms)")
+        return 0
+    if cmd == "seek" and len(argv) > 2:
+        cat = RecordingCatalog.open_reader()
+        if cat is None:
+            print("[ERROR] Katalog rekaman belum tersedia.")
+            return 1
+        hit = locate(cat, int(argv[1]), _parse_time(argv[2]))
+        print(json.dumps(hit, indent=2))
+        return 0 if hit else 1
+    if cmd == "reindex":
+        root = argv[1] if len(argv) > 1 else RECORDING_ROOT
+        built = failed = 0
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                if name.startswith(".") or parse_recording_path(path) is None:
+                    continue
+                if load_index(path, build=False) is not None:
+                    continue
+                try:
+                    write_index(path)
+                    built += 1
+                except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+                    failed += 1
+                    print(f"[INDEX] {path} gagal => {e}")
+        print(f"[INDEX] {built} sidecar dibuat, {failed} gagal")
+        return 0
+    print("Usage: recording_index.py build <file>... | seek <channel> <waktu> | reindex [root]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+retention_engine.py
+
+Retensi rekaman /mnt/Data/Backup (pengganti rmtree folder harian di cleanup.py).
+
+Akuntansi ukuran per channel & hari (katalog rekaman jika backfill selesai,
+fallback scan dd-mm-YYYY/Channel-N). Rencana penghapusan disusun berurutan:
+  1. max_age => hari lebih tua dari RETENTION_MAX_DAYS (per channel)
+  2. quota   => channel di atas kuotanya dipangkas dari hari tertua
+  3. disk    => usage > RETENTION_HIGH_USAGE: hapus hari tertua milik channel
+               dengan pemakaian terbesar sampai < RETENTION_TARGET_USAGE
+               (channel sibuk tidak lagi menghabiskan riwayat channel lain)
+Hari yang lebih muda dari minimum retensi (RETENTION_MIN_DAYS / per channel)
+tidak pernah dihapus. Folder hari ini (masih direkam) tidak pernah masuk rencana,
+termasuk saat RETENTION_MIN_DAYS=0.
+
+Eksekusi: file per file di thread worker dengan nice + ionice idle dan batas
+RETENTION_DELETE_RATE file/detik => recorder yang menulis ke share yang sama
+tidak tersendat. Baris katalog ikut dihapus. Rencana & forecast (hari sampai
+penuh) dipublikasikan ke RETENTION_REPORT_PATH.
+
+CLI:
+  python3 retention_engine.py plan       # dry-run: rencana + forecast (JSON)
+  python3 retention_engine.py run        # satu putaran (hapus)
+  python3 retention_engine.py daemon     # putaran tiap RETENTION_INTERVAL detik
+
+Author: (Anda)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from datetime import datetime, date
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from utils import publish_state, set_os_thread_name
+try:
+    from recording_catalog import RecordingCatalog
+except ImportError:
+    RecordingCatalog = None
+
+RETENTION_ROOT          = os.getenv("RETENTION_ROOT", "/mnt/Data/Backup")
+RETENTION_HIGH_USAGE    = float(os.getenv("RETENTION_HIGH_USAGE", "90"))
+RETENTION_TARGET_USAGE  = float(os.getenv("RETENTION_TARGET_USAGE", "80"))
+RETENTION_MIN_DAYS      = float(os.getenv("RETENTION_MIN_DAYS", "3"))
+RETENTION_MIN_DAYS_CH   = os.getenv("RETENTION_MIN_DAYS_CH", "")     # "1:14,5:30"
+RETENTION_MAX_DAYS      = float(os.getenv("RETENTION_MAX_DAYS", "0"))  # 0 => tanpa batas umur
+RETENTION_MAX_DAYS_CH   = os.getenv("RETENTION_MAX_DAYS_CH", "")
+RETENTION_QUOTA_GB      = float(os.getenv("RETENTION_QUOTA_GB", "0"))  # 0 => tanpa kuota
+RETENTION_QUOTA_CH      = os.getenv("RETENTION_QUOTA_CH", "")         # "1:500,2:200" (GB)
+RETENTION_DELETE_RATE   = float(os.getenv("RETENTION_DELETE_RATE", "5"))
+RETENTION_NICE          = int(os.getenv("RETENTION_NICE", "10"))
+RETENTION_IONICE        = os.getenv("RETENTION_IONICE", "true").lower() == "true"
+RETENTION_INTERVAL      = float(os.getenv("RETENTION_INTERVAL", "600"))
+RETENTION_FORECAST_DAYS = int(os.getenv("RETENTION_FORECAST_DAYS", "7"))
+RETENTION_REPORT_PATH   = os.getenv("RETENTION_REPORT_PATH", "/mnt/Data/Syslog/rtsp/retention.json")
+
+DATE_FORMAT  = "%d-%m-%Y"
+DATE_PATTERN = re.compile(r"^\d{2}-\d{2}-\d{4}$")
+CHANNEL_DIR  = re.compile(r"^Channel-(\d+)$")
+_GB          = 1024 ** 3
+
+logger = logging.getLogger("Retention")
+
+
+def parse_channel_map(spec: str) -> dict:
+    """
+    "1:14,5:30" => {1: 14.0, 5: 30.0}
+    """
+    out = {}
+    for part in (spec or "").split(","):
+        if ":" not in part:
+            continue
+        ch, val = part.split(":", 1)
+        try:
+            out[int(ch.strip())] = float(val.strip())
+        except ValueError:
+            continue
+    return out
+
+
+def get_disk_usage(path: str) -> dict:
+    usage = shutil.disk_usage(path)
+    return {"total": usage.total, "used": usage.used, "free": usage.free,
+            "percent": round(usage.used / usage.total * 100.0, 2) if usage.total else 0.0}
+
+
+###############################################################################
+# 1. Akuntansi per channel & hari
+###############################################################################
+def _scan_usage(root: str) -> dict:
+    usage = {}
+    try:
+        day_entries = list(os.scandir(root))
+    except OSError:
+        return usage
+    for day_entry in day_entries:
+        if not DATE_PATTERN.match(day_entry.name) or not day_entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            day = datetime.strptime(day_entry.name, DATE_FORMAT).date()
+            ch_entries = list(os.scandir(day_entry.path))
+        except (ValueError, OSError):
+            continue
+        for ch_entry in ch_entries:
+            m = CHANNEL_DIR.match(ch_entry.name)
+            if not m or not ch_entry.is_dir(follow_symlinks=False):
+                continue
+            total = files = 0
+            try:
+                with os.scandir(ch_entry.path) as it:
+                    for f in it:
+                        if f.is_file(follow_symlinks=False):
+                            total += f.stat(follow_symlinks=False).st_size
+                            files += 1
+            except OSError:
+                continue
+            usage.setdefault(int(m.group(1)), {})[day] = {"bytes": total, "files": files}
+    return usage
+
+
+def _catalog_usage(catalog) -> dict:
+    usage = {}
+    for ch, day_str, total, files in catalog.usage_by_day():
+        try:
+            day = datetime.strptime(day_str, DATE_FORMAT).date()
+        except (TypeError, ValueError):
+            continue
+        usage.setdefault(int(ch), {})[day] = {"bytes": int(total or 0), "files": files}
+    return usage
+
+
+def collect_usage(root: str, catalog=None):
+    """
+    Return ({channel: {date: {"bytes", "files"}}}, sumber).
+    """
+    if catalog is not None and catalog.backfilled:
+        try:
+            return _catalog_usage(catalog), "catalog"
+        except Exception as e:
+            logger.warning("[RETENTION] katalog tidak bisa dibaca => scan (%s)", e)
+    return _scan_usage(root), "scan"
+
+
+###############################################################################
+# 2. Rencana & forecast
+###############################################################################
+class RetentionPolicy:
+    def __init__(self):
+        self.min_days    = RETENTION_MIN_DAYS
+        self.min_days_ch = parse_channel_map(RETENTION_MIN_DAYS_CH)
+        self.max_days    = RETENTION_MAX_DAYS
+        self.max_days_ch = parse_channel_map(RETENTION_MAX_DAYS_CH)
+        self.quota_gb    = RETENTION_QUOTA_GB
+        self.quota_ch    = parse_channel_map(RETENTION_QUOTA_CH)
+        self.high        = RETENTION_HIGH_USAGE
+        self.target      = RETENTION_TARGET_USAGE
+
+    def min_days_for(self, ch) -> float:
+        return self.min_days_ch.get(ch, self.min_days)
+
+    def max_days_for(self, ch) -> float:
+        return self.max_days_ch.get(ch, self.max_days)
+
+    def quota_bytes(self, ch):
+        gb = self.quota_ch.get(ch, self.quota_gb)
+        return int(gb * _GB) if gb > 0 else None
+
+    def to_dict(self) -> dict:
+        return {
+            "min_days": self.min_days, "min_days_ch": self.min_days_ch,
+            "max_days": self.max_days, "max_days_ch": self.max_days_ch,
+            "quota_gb": self.quota_gb, "quota_ch_gb": self.quota_ch,
+            "high_usage": self.high, "target_usage": self.target,
+        }
+
+
+def build_plan(usage: dict, disk: dict, policy: RetentionPolicy, today: date = None):
+    """
+    Return (plan, blocked). plan => list item berurutan:
+    {"channel", "day", "bytes", "files", "reason"}; blocked => alasan yang tidak
+    bisa dipenuhi karena minimum retensi.
+    """
+    today = today or date.today()
+    remaining = {ch: dict(days) for ch, days in usage.items()}
+    plan, blocked = [], []
+
+    def take(ch, day, reason):
+        info = remaining[ch].pop(day)
+        plan.append({"channel": ch, "day": day.strftime(DATE_FORMAT),
+                     "bytes": info["bytes"], "files": info["files"], "reason": reason})
+        return info["bytes"]
+
+    def oldest_eligible(ch):
+        # min 1 hari => folder hari ini (file yang sedang direkam) tidak pernah dihapus
+        min_days = max(1, policy.min_days_for(ch))
+        for day in sorted(remaining[ch]):
+            if (today - day).days >= min_days:
+                return day
+        return None
+
+    # 1) Umur maksimal
+    for ch in sorted(remaining):
+        max_days = policy.max_days_for(ch)
+        if max_days <= 0:
+            continue
+        for day in sorted(remaining[ch]):
+            if (today - day).days > max(max_days, policy.min_days_for(ch), 1):
+                take(ch, day, "max_age")
+
+    # 2) Kuota per channel
+    for ch in sorted(remaining):
+        quota = policy.quota_bytes(ch)
+        if quota is None:
+            continue
+        total = sum(v["bytes"] for v in remaining[ch].values())
+        while total > quota:
+            day = oldest_eligible(ch)
+            if day is None:
+                blocked.append({"channel": ch, "reason": "quota", "over_bytes": total - quota})
+                break
+            total -= take(ch, day, "quota")
+
+    # 3) Tekanan disk => channel dengan pemakaian terbesar dikurangi lebih dulu
+    if disk["total"] and disk["percent"] > policy.high:
+        need = disk["used"] - sum(p["bytes"] for p in plan) - disk["total"] * policy.target / 100.0
+        while need > 0:
+            candidates = [(sum(v["bytes"] for v in remaining[ch].values()), ch)
+                          for ch in remaining if oldest_eligible(ch) is not None]
+            if not candidates:
+                blocked.append({"channel": None, "reason": "disk", "over_bytes": int(need)})
+                break
+            _, ch = max(candidates)
+            need -= take(ch, oldest_eligible(ch), "disk")
+    return plan, blocked
+
+
+def forecast(usage: dict, disk: dict, policy: RetentionPolicy, today: date = None) -> dict:
+    """
+    Pertumbuhan harian = rata-rata RETENTION_FORECAST_DAYS hari lengkap terakhir.
+    """
+    today = today or date.today()
+    per_day, per_channel = {}, {}
+    for ch, days in usage.items():
+        for day, info in days.items():
+            age = (today - day).days
+            if 1 <= age <= RETENTION_FORECAST_DAYS:
+                per_day[day] = per_day.get(day, 0) + info["bytes"]
+                per_channel[ch] = per_channel.get(ch, 0) + info["bytes"]
+    n = len(per_day)
+    growth = sum(per_day.values()) / n if n else 0.0
+
+    out = {
+        "sample_days": n,
+        "daily_growth_bytes": int(growth),
+        "channel_daily_growth_bytes": {str(ch): int(v / n) for ch, v in sorted(per_channel.items())} if n else {},
+        "days_until_high": None,
+        "days_until_full": None,
+        "retention_days": {
+            str(ch): (today - min(days)).days + 1 for ch, days in sorted(usage.items()) if days
+        },
+    }
+    if growth > 0 and disk["total"]:
+        to_high = disk["total"] * policy.high / 100.0 - disk["used"]
+        out["days_until_high"] = round(max(0.0, to_high) / growth, 1)
+        out["days_until_full"] = round(disk["free"] / growth, 1)
+    return out
+
+
+###############################################################################
+# 3. Worker penghapusan
+###############################################################################
+def lower_thread_priority(nice: int = RETENTION_NICE, idle_io: bool = RETENTION_IONICE):
+    """
+    nice + ionice kelas idle untuk thread pemanggil saja (Linux: prioritas per-thread).
+    """
+    tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, nice)
+    except (OSError, AttributeError) as e:
+        logger.warning("[RETENTION] gagal set nice => %s", e)
+    if idle_io and shutil.which("ionice"):
+        try:
+            subprocess.run(["ionice", "-c", "3", "-p", str(tid)], check=False, timeout=5,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+
+class DeletionWorker(threading.Thread):
+    """
+    Menghapus item rencana file per file (terlama dulu) dengan batas laju.
+    Item 'disk' berhenti begitu usage <= target (item max_age/quota tetap jalan).
+    """
+    def __init__(self, plan, root: str, policy: RetentionPolicy, catalog=None,
+                 rate: float = RETENTION_DELETE_RATE):
+        super().__init__(daemon=True, name="retention-delete")
+        self.plan    = plan
+        self.root    = root
+        self.policy  = policy
+        self.catalog = catalog
+        self.delay   = 1.0 / rate if rate > 0 else 0.0
+        self.stats   = {"deleted_files": 0, "freed_bytes": 0, "items_done": 0,
+                        "errors": 0, "stopped_early": False, "duration_s": None}
+
+    def _delete_dir(self, ch_dir: str):
+        try:
+            with os.scandir(ch_dir) as it:
+                files = sorted((e.path for e in it if e.is_file(follow_symlinks=False)))
+        except OSError:
+            return
+        for path in files:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                self.stats["errors"] += 1
+                logger.warning("[RETENTION] gagal hapus %s => %s", path, e)
+                continue
+            self.stats["deleted_files"] += 1
+            self.stats["freed_bytes"]   += size
+            if self.catalog is not None:
+                try:
+                    self.catalog.delete(path)
+                except Exception as e:
+                    logger.warning("[RETENTION] katalog %s => %s", path, e)
+            if self.delay:
+                time.sleep(self.delay)
+        for d in (ch_dir, os.path.dirname(ch_dir)):
+            try:
+                os.rmdir(d)   # hanya berhasil jika kosong
+            except OSError:
+                break
+
+    def run(self):
+        set_os_thread_name("retention-del")
+        lower_thread_priority()
+        t0 = time.monotonic()
+        for item in self.plan:
+            if item["day"] == date.today().strftime(DATE_FORMAT):
+                # Pengaman terakhir: folder hari ini (recorder aktif) tidak pernah dihapus
+                logger.warning("[RETENTION] ch%s %s = hari ini => dilewati", item["channel"], item["day"])
+                continue
+            if item["reason"] == "disk":
+                if get_disk_usage(self.root)["percent"] <= self.policy.target:
+                    self.stats["stopped_early"] = True
+                    logger.info("[RETENTION] usage <= target => sisa item disk dilewati")
+                    break
+            ch_dir = os.path.join(self.root, item["day"], f"Channel-{item['channel']}")
+            logger.info("[RETENTION] hapus ch%s %s (%s, %.1f MB)", item["channel"], item["day"],
+                        item["reason"], item["bytes"] / (1024 * 1024))
+            self._delete_dir(ch_dir)
+            self.stats["items_done"] += 1
+        self.stats["duration_s"] = round(time.monotonic() - t0, 1)
+
+
+###############################################################################
+# 4. Engine
+###############################################################################
+class RetentionEngine:
+    def __init__(self, root: str = None, report_path: str = None):
+        self.root        = root or RETENTION_ROOT
+        self.report_path = report_path or RETENTION_REPORT_PATH
+        self.policy      = RetentionPolicy()
+        self.catalog     = None
+        if RecordingCatalog is not None:
+            try:
+                self.catalog = RecordingCatalog()
+            except Exception as e:
+                logger.warning("[RETENTION] katalog rekaman tidak tersedia => %s", e)
+        self.worker = None
+
+    def evaluate(self) -> dict:
+        usage, source = collect_usage(self.root, self.catalog)
+        disk = get_disk_usage(self.root)
+        plan, blocked = build_plan(usage, disk, self.policy)
+        return {
+            "generated_at": time.time(),
+            "root": self.root,
+            "usage_source": source,
+            "disk": disk,
+            "policy": self.policy.to_dict(),
+            "channels": {
+                str(ch): {"bytes": sum(v["bytes"] for v in days.values()),
+                          "days": len(days),
+                          "oldest": min(days).strftime(DATE_FORMAT) if days else None}
+                for ch, days in sorted(usage.items())
+            },
+            "plan": plan,
+            "plan_bytes": sum(p["bytes"] for p in plan),
+            "blocked": blocked,
+            "forecast": forecast(usage, disk, self.policy),
+        }
+
+    def _publish(self, report: dict):
+        try:
+            publish_state(self.report_path, report)
+        except Exception as e:
+            logger.warning("[RETENTION] gagal publish %s => %s", self.report_path, e)
+
+    def run_once(self, dry_run: bool = False, wait: bool = True) -> dict:
+        """
+        Evaluasi + (jika bukan dry-run) jalankan worker. Putaran baru tidak dimulai
+        selama worker sebelumnya masih berjalan.
+        """
+        if self.worker is not None and self.worker.is_alive():
+            logger.info("[RETENTION] worker sebelumnya masih berjalan => lewati")
+            return {}
+        report = self.evaluate()
+        report["dry_run"] = dry_run
+        fc = report["forecast"]
+        logger.info("[RETENTION] disk %.1f%% | rencana %d item (%.1f GB) | tumbuh %.1f GB/hari | "
+                    "penuh dalam %s hari", report["disk"]["percent"], len(report["plan"]),
+                    report["plan_bytes"] / _GB, fc["daily_growth_bytes"] / _GB, fc["days_until_full"])
+        for b in report["blocked"]:
+            logger.warning("[RETENTION] tertahan minimum retensi => %s", b)
+
+        if not dry_run and report["plan"]:
+            self.worker = DeletionWorker(report["plan"], self.root, self.policy, self.catalog)
+            self.worker.start()
+            if wait:
+                self.worker.join()
+                report["last_run"] = dict(self.worker.stats)
+                report["disk_after"] = get_disk_usage(self.root)
+        self._publish(report)
+        return report
+
+    def run_forever(self, interval: float = RETENTION_INTERVAL):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("[RETENTION] putaran gagal => %s", e)
+            time.sleep(interval)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("plan", "run", "daemon"):
+        print("Usage: retention_engine.py plan | run | daemon")
+        return 2
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s",
+                        datefmt="%d-%m-%Y %H:%M:%S")
+    engine = RetentionEngine()
+    if argv[0] == "daemon":
+        engine.run_forever()
+        return 0
+    report = engine.run_once(dry_run=(argv[0] == "plan"))
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+state_segment.py
+
+Segmen state biner (mmap) di tmpfs bersama untuk telemetry lintas container.
+Melengkapi file JSON di /mnt/Data/Syslog (tetap ditulis untuk manusia & pembaca lama).
+
+Layout (little-endian, ukuran tetap):
+- Header 64 byte  : magic, versi layout, kapasitas channel, ukuran record.
+- Record resource : 1 record (ditulis resource_monitor.py).
+- Record channel  : STATE_SEGMENT_CHANNELS record, index = channel - 1
+                    (ditulis backup/main.py lewat update_validation_status).
+
+Setiap record diawali seq (u32) => seqlock:
+- Writer : seq ganjil -> tulis payload -> seq genap. Satu proses writer per region,
+           thread dalam proses yang sama diserialisasi dengan threading.Lock.
+- Reader : baca seq, salin payload, baca seq lagi; ulang jika ganjil / berubah.
+           Tanpa lock & tanpa syscall => beberapa mikrodetik per baca.
+
+Inisialisasi ulang (layout baru / header rusak) membuat file baru lalu os.replace,
+tidak pernah truncate file yang sedang di-mmap container lain. Reader & writer
+mengecek inode path paling sering tiap _RECHECK_INTERVAL detik dan membuka ulang
+jika file sudah diganti.
+
+CLI:
+  python3 state_segment.py dump             # JSON ke stdout
+  python3 state_segment.py export <file>    # JSON ke file (atomic)
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import json
+import math
+import mmap
+import time
+import fcntl
+import struct
+import tempfile
+import threading
+
+STATE_SEGMENT_PATH     = os.getenv("STATE_SEGMENT_PATH", "/run/cctv-state/state.seg")
+STATE_SEGMENT_CHANNELS = int(os.getenv("STATE_SEGMENT_CHANNELS", "64"))
+
+_MAGIC          = b"CCTVSEG1"
+_LAYOUT_VERSION = 1
+_HEADER         = struct.Struct("<8sIIIId")   # magic, versi, kapasitas, size resource, size channel, created_at
+_HEADER_SIZE    = 64
+_SEQ            = struct.Struct("<I")
+_SEQ_SIZE       = 8                          # seq + padding => payload rata 8 byte
+_MAX_SPIN       = 10000
+_RECHECK_INTERVAL = 1.0
+
+ERROR_MSG_MAX   = 120
+
+# (nama, kode struct) => schema tetap; urutan = urutan di memori
+RESOURCE_FIELDS = [
+    ("updated_at",      "d"),
+    ("publish_seq",     "Q"),
+    ("cpu_percent",     "f"),
+    ("cpu_count",       "H"),
+    ("ram_total",       "Q"),
+    ("ram_used",        "Q"),
+    ("ram_free",        "Q"),
+    ("ram_percent",     "f"),
+    ("disk_total",      "Q"),
+    ("disk_used",       "Q"),
+    ("disk_free",       "Q"),
+    ("disk_percent",    "f"),
+    ("swap_percent",    "f"),
+    ("load_1",          "f"),
+    ("load_5",          "f"),
+    ("load_15",         "f"),
+    ("net_sent",        "Q"),
+    ("net_recv",        "Q"),
+    ("rtsp_reachable",  "?"),
+    ("rtsp_ping_ms",    "f"),
+    ("outside_ok",      "?"),
+    ("outside_ping_ms", "f"),
+]
+
+CHANNEL_FIELDS = [
+    ("updated_at",  "d"),
+    ("is_active",   "?"),
+    ("recording",   "?"),
+    ("freeze_ok",   "b"),   # -1 = None, 0 = False, 1 = True
+    ("black_ok",    "b"),
+    ("error_msg",   f"{ERROR_MSG_MAX}s"),
+]
+
+_TRISTATE_FIELDS = ("freeze_ok", "black_ok")
+
+
+def _open_locked(path: str) -> int:
+    """
+    open + flock pada file yang (masih) ada di 'path'. Writer lain mengganti file
+    selagi kita menunggu lock => inode beda => buka ulang.
+    """
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def _record_struct(fields) -> struct.Struct:
+    return struct.Struct("<" + "".join(code for _, code in fields))
+
+def _record_size(payload: struct.Struct) -> int:
+    # Dibulatkan ke 64 byte => record berbeda tidak berbagi cache line
+    return ((_SEQ_SIZE + payload.size + 63) // 64) * 64
+
+_RESOURCE_STRUCT = _record_struct(RESOURCE_FIELDS)
+_CHANNEL_STRUCT  = _record_struct(CHANNEL_FIELDS)
+_RESOURCE_SIZE   = _record_size(_RESOURCE_STRUCT)
+_CHANNEL_SIZE    = _record_size(_CHANNEL_STRUCT)
+
+
+def _num(value, default=0.0):
+    # None (mis. ping gagal) => NaN di segmen, dikembalikan None saat dibaca
+    return default if value is None else value
+
+def _tristate(value) -> int:
+    if value is None:
+        return -1
+    return 1 if value else 0
+
+
+class StateSegment:
+    """
+    Akses ke segmen state.
+
+    Writer : StateSegment(writer=True) => file dibuat/diinisialisasi jika belum ada.
+    Reader : StateSegment.open_reader() => None jika segmen belum tersedia.
+    """
+    def __init__(self, path: str = None, channels: int = None, writer: bool = False):
+        self.path     = path or STATE_SEGMENT_PATH
+        self.writer   = writer
+        self._lock    = threading.Lock()
+        self._mm      = None
+        self._ino     = None
+        self._next_check = 0.0
+
+        if writer:
+            self._open_writer(channels or STATE_SEGMENT_CHANNELS)
+        else:
+            self._open_reader()
+        self._next_check = time.monotonic() + _RECHECK_INTERVAL
+
+        self.resource_offset = _HEADER_SIZE
+        self.channel_offset  = _HEADER_SIZE + _RESOURCE_SIZE
+
+    @classmethod
+    def open_reader(cls, path: str = None):
+        try:
+            return cls(path)
+        except (OSError, ValueError):
+            return None
+
+    # ------------------------------------------------------------------
+    # Open / init
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _total_size(channels: int) -> int:
+        return _HEADER_SIZE + _RESOURCE_SIZE + channels * _CHANNEL_SIZE
+
+    def _open_writer(self, channels: int):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # flock => dua writer (monitor & backup) yang start bersamaan tidak init ganda
+        fd = _open_locked(self.path)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            valid = False
+            if len(header) == _HEADER.size:
+                magic, ver, cap, rsize, csize, _ = _HEADER.unpack(header)
+                valid = (magic == _MAGIC and ver == _LAYOUT_VERSION and
+                         rsize == _RESOURCE_SIZE and csize == _CHANNEL_SIZE)
+                if valid:
+                    channels = cap
+            size = self._total_size(channels)
+            if valid and os.fstat(fd).st_size < size:
+                valid = False
+            if not valid:
+                fd = self._replace_file(fd, channels, size)
+            self.capacity = channels
+            self._ino = os.fstat(fd).st_ino
+            self._mm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            # mmap memegang dup fd => lock harus dilepas eksplisit
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _replace_file(self, old_fd: int, channels: int, size: int) -> int:
+        """
+        Segmen baru di file temp (folder sama) => os.replace. Container yang masih
+        memetakan file lama tetap aman (tanpa SIGBUS) sampai membuka ulang.
+        Return fd file baru, sudah di-flock.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                        prefix="." + os.path.basename(self.path) + ".",
+                                        suffix=".tmp")
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.fchmod(fd, 0o644)
+            os.ftruncate(fd, size)
+            os.pwrite(fd, _HEADER.pack(_MAGIC, _LAYOUT_VERSION, channels,
+                                       _RESOURCE_SIZE, _CHANNEL_SIZE, time.time()), 0)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.close(fd)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        os.close(old_fd)
+        return fd
+
+    def _open_reader(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            if len(header) != _HEADER.size:
+                raise ValueError(f"{self.path} belum diinisialisasi")
+            magic, ver, cap, rsize, csize, _ = _HEADER.unpack(header)
+            if (magic != _MAGIC or ver != _LAYOUT_VERSION or
+                    rsize != _RESOURCE_SIZE or csize != _CHANNEL_SIZE):
+                raise ValueError(f"{self.path} => layout tidak dikenal (versi={ver})")
+            self.capacity = cap
+            self._ino = os.fstat(fd).st_ino
+            self._mm = mmap.mmap(fd, self._total_size(cap), mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+    def _check_replaced(self):
+        """
+        File segmen diganti (os.replace oleh writer lain) => buka ulang. Mapping lama
+        tidak di-close: thread lain yang masih memegangnya tetap valid sampai selesai.
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + _RECHECK_INTERVAL
+        try:
+            if os.stat(self.path).st_ino == self._ino:
+                return
+        except FileNotFoundError:
+            if not self.writer:
+                return
+        try:
+            if self.writer:
+                with self._lock:
+                    self._open_writer(self.capacity)
+            else:
+                self._open_reader()
+        except (OSError, ValueError):
+            return
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    # ------------------------------------------------------------------
+    # Seqlock primitif
+    # ------------------------------------------------------------------
+    def _write_record(self, offset: int, payload: bytes):
+        mm = self._mm
+        seq = _SEQ.unpack_from(mm, offset)[0]
+        if seq & 1:
+            # Writer sebelumnya mati di tengah tulis => pulihkan ke genap
+            seq += 1
+        _SEQ.pack_into(mm, offset, (seq + 1) & 0xFFFFFFFF)
+        start = offset + _SEQ_SIZE
+        mm[start:start + len(payload)] = payload
+        _SEQ.pack_into(mm, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def _read_record(self, offset: int, size: int):
+        """
+        Return (seq, payload_bytes) atau None jika record belum pernah ditulis /
+        writer macet di tengah tulis.
+        """
+        mm = self._mm
+        start = offset + _SEQ_SIZE
+        for spin in range(_MAX_SPIN):
+            s1 = _SEQ.unpack_from(mm, offset)[0]
+            if s1 & 1:
+                if spin & 63 == 63:
+                    os.sched_yield()
+                continue
+            payload = mm[start:start + size]
+            if _SEQ.unpack_from(mm, offset)[0] == s1:
+                return (s1, payload) if s1 else None
+        return None
+
+    def _channel_offset(self, channel: int) -> int:
+        idx = int(channel) - 1
+        if idx < 0 or idx >= self.capacity:
+            raise IndexError(f"channel {channel} di luar kapasitas segmen ({self.capacity})")
+        return self.channel_offset + idx * _CHANNEL_SIZE
+
+    # ------------------------------------------------------------------
+    # Resource
+    # ------------------------------------------------------------------
+    def write_resource(self, doc: dict, publish_seq: int = 0):
+        """
+        doc => dokumen resource_monitor_state.json (resource_usage + stream_config).
+        """
+        usage = doc.get("resource_usage", {})
+        scfg  = doc.get("stream_config", {})
+        cpu, ram   = usage.get("cpu", {}), usage.get("ram", {})
+        disk, swap = usage.get("disk", {}), usage.get("swap", {})
+        load, net  = usage.get("load_average", {}), usage.get("network", {})
+        ips  = scfg.get("final_ips") or [{}]
+        nan  = float("nan")
+
+        payload = _RESOURCE_STRUCT.pack(
+            time.time(), publish_seq or 0,
+            _num(cpu.get("usage_percent")), int(_num(cpu.get("core_count_logical"), 0)),
+            int(_num(ram.get("total"), 0)), int(_num(ram.get("used"), 0)),
+            int(_num(ram.get("free"), 0)), _num(ram.get("usage_percent")),
+            int(_num(disk.get("total"), 0)), int(_num(disk.get("used"), 0)),
+            int(_num(disk.get("free"), 0)), _num(disk.get("usage_percent")),
+            _num(swap.get("usage_percent")),
+            _num(load.get("1min")), _num(load.get("5min")), _num(load.get("15min")),
+            int(_num(net.get("bytes_sent"), 0)), int(_num(net.get("bytes_received"), 0)),
+            bool(ips[0].get("reachable")), _num(ips[0].get("ping_time_ms"), nan),
+            bool(scfg.get("ping_outside_ok")), _num(scfg.get("ping_outside_ms"), nan),
+        )
+        self._check_replaced()
+        with self._lock:
+            self._write_record(self.resource_offset, payload)
+
+    def read_resource(self):
+        self._check_replaced()
+        rec = self._read_record(self.resource_offset, _RESOURCE_STRUCT.size)
+        if rec is None:
+            return None
+        out = dict(zip((n for n, _ in RESOURCE_FIELDS), _RESOURCE_STRUCT.unpack(rec[1])))
+        for key in ("rtsp_ping_ms", "outside_ping_ms"):
+            if math.isnan(out[key]):
+                out[key] = None
+        return out
+
+    # ------------------------------------------------------------------
+    # Channel
+    # ------------------------------------------------------------------
+    def _decode_channel(self, payload: bytes) -> dict:
+        out = dict(zip((n for n, _ in CHANNEL_FIELDS), _CHANNEL_STRUCT.unpack(payload)))
+        for key in _TRISTATE_FIELDS:
+            out[key] = None if out[key] < 0 else bool(out[key])
+        msg = out["error_msg"].rstrip(b"\0").decode("utf-8", "ignore")
+        out["error_msg"] = msg or None
+        return out
+
+    def write_channel(self, channel: int, info: dict):
+        """
+        Update parsial (semantik sama dengan update_validation_status):
+        field yang tidak ada di 'info' mempertahankan nilai sebelumnya.
+        """
+        self._check_replaced()
+        offset = self._channel_offset(channel)
+        with self._lock:
+            rec = self._read_record(offset, _CHANNEL_STRUCT.size)
+            cur = self._decode_channel(rec[1]) if rec else {
+                "is_active": False, "recording": False,
+                "freeze_ok": None, "black_ok": None, "error_msg": None
+            }
+            for key in ("is_active", "recording", "freeze_ok", "black_ok", "error_msg"):
+                if key in info:
+                    cur[key] = info[key]
+            msg = (cur["error_msg"] or "").encode("utf-8")[:ERROR_MSG_MAX]
+            payload = _CHANNEL_STRUCT.pack(
+                time.time(), bool(cur["is_active"]), bool(cur["recording"]),
+                _tristate(cur["freeze_ok"]), _tristate(cur["black_ok"]), msg
+            )
+            self._write_record(offset, payload)
+
+    def _read_channel(self, channel: int):
+        rec = self._read_record(self._channel_offset(channel), _CHANNEL_STRUCT.size)
+        return self._decode_channel(rec[1]) if rec else None
+
+    def read_channel(self, channel: int):
+        self._check_replaced()
+        return self._read_channel(channel)
+
+    def read_channels(self) -> dict:
+        """
+        {ch_str: dict} untuk channel yang pernah ditulis.
+        """
+        # Cek file diganti sekali di awal => kapasitas tidak berubah di tengah loop
+        self._check_replaced()
+        out = {}
+        for ch in range(1, self.capacity + 1):
+            info = self._read_channel(ch)
+            if info is not None:
+                out[str(ch)] = info
+        return out
+
+    # ------------------------------------------------------------------
+    # Export JSON (manusia / pembaca lama)
+    # ------------------------------------------------------------------
+    def export(self) -> dict:
+        return {
+            "path": self.path,
+            "capacity": self.capacity,
+            "resource": self.read_resource(),
+            "channels": self.read_channels(),
+        }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("dump", "export") or (argv[0] == "export" and len(argv) < 2):
+        print("Usage: state_segment.py dump | export <file.json>")
+        return 2
+    seg = StateSegment.open_reader()
+    if seg is None:
+        print(f"[ERROR] Segmen {STATE_SEGMENT_PATH} belum tersedia.")
+        return 1
+    data = seg.export()
+    if argv[0] == "dump":
+        print(json.dumps(data, indent=2))
+    else:
+        sys.path.append("/app/scripts")
+        from utils import save_json_file
+        save_json_file(argv[1], data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,7 @@ Modul utilitas yang menyediakan:
 1) Fungsi logger (opsional RotatingFileHandler, SysLogHandler, opsional StreamHandler).
 2) Fungsi-fungsi umum (get_local_time, decode_credentials, dsb.).
 3) Kemudahan penggunaan log kategori (LOG_CATEGORIES).
+4) FileWatcher: pemantau file config/state (inotify + fallback polling).
 
 Untuk produksi (bukan dummy), disesuaikan dengan syslog-ng config dan environment .env.
 
@@ -13,9 +14,15 @@ Author: YourName
 
 import os
 import json
+import time
 import logging
+import tempfile
 import base64
+import select
+import struct
 import threading
+import ctypes
+import ctypes.util
 from logging.handlers import SysLogHandler, RotatingFileHandler
 from datetime import datetime
 import pytz
@@ -314,6 +321,63 @@ def generate_channels() -> list:
         return list(range(1, ch + 1))
 
 
+def get_hls_output_dir() -> str:
+    """
+    Menentukan folder output HLS yang dipakai bersama oleh ffmpeg_manager.py,
+    main.py (Flask) dan snapshot_cctv.py.
+
+    HLS_RAM_STORE=true => segmen live disimpan di HLS_RAM_DIR (tmpfs / shared memory),
+    agar churn file kecil tidak menyentuh disk rekaman.
+    Jika tidak => HLS_OUTPUT_DIR di disk (perilaku lama).
+    """
+    if os.getenv("HLS_RAM_STORE", "false").lower() == "true":
+        return os.getenv("HLS_RAM_DIR", "/app/streamserver/hls-ram")
+    return os.getenv("HLS_OUTPUT_DIR", "/app/streamserver/hls")
+
+
+# Penanda viewer HLS: <hls_dir>/.viewers/ch_<N> (mtime = request terakhir).
+# Dipakai bersama oleh semua worker main.py/async_server.py (lintas proses) dan
+# dibaca ffmpeg_manager.py untuk menjeda HLS channel tanpa viewer saat overload.
+HLS_VIEWER_TOUCH_INTERVAL = float(os.getenv("HLS_VIEWER_TOUCH_INTERVAL", "5"))
+_viewer_touched = {}
+
+
+def _hls_viewer_marker(channel) -> str:
+    return os.path.join(get_hls_output_dir(), ".viewers", f"ch_{channel}")
+
+
+def touch_hls_viewer(channel):
+    """
+    Catat bahwa channel sedang ditonton. Di-throttle per proses
+    (paling sering tiap HLS_VIEWER_TOUCH_INTERVAL detik) => hampir tanpa I/O.
+    """
+    now = time.monotonic()
+    if now - _viewer_touched.get(channel, -1e9) < HLS_VIEWER_TOUCH_INTERVAL:
+        return
+    _viewer_touched[channel] = now
+    path = _hls_viewer_marker(channel)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "a").close()
+        except OSError:
+            pass
+    except OSError:
+        pass
+
+
+def last_hls_viewer(channel) -> float:
+    """
+    Epoch request viewer terakhir untuk channel (0.0 jika belum pernah).
+    """
+    try:
+        return os.stat(_hls_viewer_marker(channel)).st_mtime
+    except OSError:
+        return 0.0
+
+
 def load_json_file(file_path: str) -> dict:
     """
     Membaca file JSON dan mengembalikan dict.
@@ -333,19 +397,379 @@ def load_json_file(file_path: str) -> dict:
         return {}
 
 
+def write_json_atomic(file_path: str, data: dict, durable: bool = False):
+    """
+    Tulis JSON lewat file temp unik -> replace (writer bersamaan tidak saling menimpa
+    file .tmp). durable=True => + fsync file & direktori (lihat publish_state).
+    Error dilempar ke pemanggil.
+    """
+    _atomic_write_bytes(file_path, json.dumps(data, indent=2).encode(), durable=durable)
+
+
 def save_json_file(file_path: str, data: dict):
     """
-    Menyimpan data dict ke file JSON secara 'atomic' (memakai .tmp -> replace).
+    Menyimpan data dict ke file JSON secara 'atomic' (file temp unik -> replace, tanpa fsync).
     """
     try:
-        tmp_file = file_path + ".tmp"
-        with open(tmp_file, "w") as f:
-            json.dump(data, f, indent=2)
-        os.replace(tmp_file, file_path)
+        write_json_atomic(file_path, data)
     except Exception as e:
         print(f"[ERROR] Gagal menulis file {file_path}: {e}")
 
 
+###############################################################################
+# 6b) FILE WATCHER (inotify + fallback polling)
+###############################################################################
+WATCHER_MODE          = os.getenv("WATCHER_MODE", "auto").lower()   # auto | inotify | poll
+WATCHER_POLL_INTERVAL = float(os.getenv("WATCHER_POLL_INTERVAL", "2.0"))
+
+# Filesystem jaringan => inotify tidak melihat perubahan dari host lain
+_REMOTE_FS_TYPES = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p")
+
+_IN_MODIFY      = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO    = 0x00000080
+_IN_CREATE      = 0x00000100
+_IN_DELETE      = 0x00000200
+_IN_CLOEXEC     = 0o2000000
+_IN_EVENT_HDR   = struct.Struct("iIII")
+
+_libc = None
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+def set_os_thread_name(name: str):
+    """
+    Set nama thread di level OS (/proc/<pid>/task/<tid>/comm, maks 15 karakter).
+    Dipakai resource_monitor (process_costs.py) untuk atribusi CPU per channel,
+    mis. "ch3-analysis". Thread anak (decoder) mewarisi nama ini. Gagal => diam.
+    """
+    try:
+        _get_libc().prctl(15, name.encode()[:15], 0, 0, 0)   # PR_SET_NAME
+    except (OSError, AttributeError):
+        pass
+
+
+def get_fs_type(path: str) -> str:
+    """
+    Tipe filesystem untuk 'path' (mountpoint terpanjang di /proc/self/mounts).
+    Return "" jika tidak diketahui.
+    """
+    path = os.path.realpath(path)
+    best, fstype = "", ""
+    try:
+        with open("/proc/self/mounts", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mnt = parts[1].replace("\\040", " ")
+                if (path == mnt or path.startswith(mnt.rstrip("/") + "/")) and len(mnt) > len(best):
+                    best, fstype = mnt, parts[2]
+    except OSError:
+        pass
+    return fstype
+
+
+def _load_json_strict(file_path: str):
+    # Berbeda dengan load_json_file: error dilempar, agar torn read tidak dianggap "{}"
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+class FileWatcher:
+    """
+    Memantau satu file config/state dan memanggil callback(snapshot) hanya jika
+    isinya benar-benar berubah.
+
+    - inotify (via ctypes, tanpa dependensi) dipasang di folder induk, sehingga
+      penulisan langsung maupun atomic replace (.tmp -> rename) tertangkap.
+      Saat idle thread hanya blok di select() => tidak ada I/O.
+    - Fallback polling (inode, mtime, size) tiap WATCHER_POLL_INTERVAL detik untuk
+      NFS/CIFS (inotify tidak melihat tulisan dari host lain) atau jika inotify gagal.
+    - File hanya dibaca jika (inode, mtime, size) berubah; hasil parse dilewatkan ke
+      'parse' (opsional, mis. ambil subset field yang relevan / validasi, boleh raise
+      ValueError untuk menolak). Callback dipanggil jika hasilnya != snapshot sebelumnya.
+
+    Contoh:
+        w = FileWatcher("/mnt/Data/Syslog/rtsp/channel_validation.json", on_change)
+        w.start()
+    """
+    def __init__(self, path, callback, parse=None, loader=None,
+                 mode=None, poll_interval=None, debounce=0.05, name=None):
+        self.path          = path
+        self.callback      = callback
+        self.parse         = parse
+        self.loader        = loader or _load_json_strict
+        self.mode          = (mode or WATCHER_MODE).lower()
+        self.poll_interval = poll_interval or WATCHER_POLL_INTERVAL
+        self.debounce      = debounce
+        self.name          = name or os.path.basename(path)
+
+        self.snapshot   = None
+        self._stat_key  = None
+        self._has_value = False
+        self._stop      = threading.Event()
+        self._thread    = None
+        self._wake_r, self._wake_w = os.pipe()
+        self.active_mode = None
+
+    # ------------------------------------------------------------------
+    def _current_stat_key(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def check(self, force=False) -> bool:
+        """
+        Baca ulang jika stat berubah. Return True jika callback dipanggil.
+        """
+        key = self._current_stat_key()
+        if not force and key == self._stat_key:
+            return False
+        if key is None:
+            self._stat_key = None
+            return False
+        try:
+            raw = self.loader(self.path)
+            value = self.parse(raw) if self.parse else raw
+        except (ValueError, OSError) as e:
+            # Torn read / isi tidak valid => pertahankan snapshot lama, coba lagi nanti
+            print(f"[WARNING] FileWatcher({self.name}) => isi belum valid: {e}")
+            return False
+        self._stat_key = key
+        if self._has_value and value == self.snapshot:
+            return False
+        self.snapshot = value
+        self._has_value = True
+        try:
+            self.callback(value)
+        except Exception as e:
+            print(f"[ERROR] FileWatcher({self.name}) callback => {e}")
+        return True
+
+    # ------------------------------------------------------------------
+    def _init_inotify(self):
+        libc = _get_libc()
+        fd = libc.inotify_init1(_IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 gagal")
+        parent = os.path.dirname(os.path.abspath(self.path)) or "."
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_MODIFY
+        wd = libc.inotify_add_watch(fd, parent.encode(), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, f"inotify_add_watch({parent}) gagal")
+        return fd
+
+    def _inotify_relevant(self, buf: bytes) -> bool:
+        target = os.path.basename(self.path).encode()
+        offset = 0
+        while offset + _IN_EVENT_HDR.size <= len(buf):
+            _, _, _, name_len = _IN_EVENT_HDR.unpack_from(buf, offset)
+            offset += _IN_EVENT_HDR.size
+            name = buf[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if name == target:
+                return True
+        return False
+
+    def _run_inotify(self, fd):
+        try:
+            while not self._stop.is_set():
+                readable, _, _ = select.select([fd, self._wake_r], [], [])
+                if self._wake_r in readable:
+                    break
+                relevant = self._inotify_relevant(os.read(fd, 65536))
+                if not relevant:
+                    continue
+                # Debounce => gabungkan burst event (tulis + rename)
+                while select.select([fd], [], [], self.debounce)[0]:
+                    os.read(fd, 65536)
+                self.check()
+        finally:
+            os.close(fd)
+
+    def _run_poll(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+    def _run(self):
+        self.check(force=True)
+        fd = None
+        if self.mode != "poll":
+            fstype = get_fs_type(os.path.dirname(os.path.abspath(self.path)))
+            if self.mode == "auto" and fstype in _REMOTE_FS_TYPES:
+                print(f"[INFO] FileWatcher({self.name}) => {fstype}, pakai polling.")
+            else:
+                try:
+                    fd = self._init_inotify()
+                except OSError as e:
+                    print(f"[WARNING] FileWatcher({self.name}) inotify gagal => {e}, pakai polling.")
+        if fd is not None:
+            self.active_mode = "inotify"
+            self._run_inotify(fd)
+        else:
+            self.active_mode = "poll"
+            self._run_poll()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name=f"watch-{self.name}")
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass
+
+
+###############################################################################
+# 6c) STATE PUBLISHING (atomic replace + nomor versi)
+###############################################################################
+STATE_META_KEY = "_meta"
+
+_state_seq      = {}   # {file_path: seq terakhir yang ditulis proses ini}
+_state_seq_lock = threading.Lock()
+
+
+def _atomic_write_bytes(file_path: str, payload: bytes, durable: bool = True):
+    """
+    Tulis ke file temp unik di folder yang sama, (fsync), lalu os.replace.
+    Pembaca (container lain) selalu melihat file lama atau file baru yang utuh.
+    durable=False => tanpa fsync file & direktori (atomic terhadap pembaca, tidak
+    terhadap crash host) => biaya sama dengan .tmp -> replace biasa.
+    """
+    folder = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix="." + os.path.basename(file_path) + ".",
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    if not durable:
+        return
+    try:
+        dfd = os.open(folder, os.O_RDONLY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+    except OSError:
+        pass
+
+
+def _next_state_seq(file_path: str) -> int:
+    with _state_seq_lock:
+        seq = _state_seq.get(file_path)
+        if seq is None:
+            # Lanjutkan dari file yang ada => seq tetap naik meski writer restart
+            try:
+                seq = int(_load_json_strict(file_path).get(STATE_META_KEY, {}).get("seq", 0))
+            except (OSError, ValueError, AttributeError, TypeError):
+                seq = 0
+        seq += 1
+        _state_seq[file_path] = seq
+        return seq
+
+
+def publish_state(file_path: str, data: dict) -> int:
+    """
+    Publikasikan dokumen state (mis. resource_monitor_state.json) secara atomic.
+    Menambahkan data["_meta"] = {"seq", "published_at"}; return seq.
+    Error dilempar ke pemanggil (writer yang memutuskan log/retry).
+    """
+    seq = _next_state_seq(file_path)
+    doc = dict(data)
+    doc[STATE_META_KEY] = {"seq": seq, "published_at": time.time()}
+    _atomic_write_bytes(file_path, json.dumps(doc, indent=2).encode())
+    return seq
+
+
+class StateReader:
+    """
+    Pembaca dokumen yang dipublikasikan lewat publish_state().
+
+    - Versi = (inode, mtime, size). Jika sama dengan bacaan terakhir => kembalikan
+      hasil parse sebelumnya tanpa open/json.load.
+    - Torn read (writer lama yang masih menulis in-place, cache NFS) => retry singkat;
+      jika tetap gagal => kembalikan dokumen valid terakhir, bukan {}.
+    - File belum ada & belum pernah terbaca => default.
+
+    Contoh:
+        resource_state = StateReader("/mnt/Data/Syslog/resource/resource_monitor_state.json")
+        data = resource_state.read() or {}
+    """
+    def __init__(self, path: str, retries: int = 3, retry_delay: float = 0.05):
+        self.path        = path
+        self.retries     = retries
+        self.retry_delay = retry_delay
+
+        self.data      = None
+        self.seq       = None
+        self._stat_key = None
+        self._bad_key  = None    # versi yang sudah dicoba & gagal => tidak diulang
+        self._lock     = threading.Lock()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def read(self, default=None):
+        with self._lock:
+            key = self._stat()
+            if key is not None and key in (self._stat_key, self._bad_key):
+                return self.data if self.data is not None else default
+            for attempt in range(self.retries + 1):
+                if key is None:
+                    break
+                try:
+                    data = _load_json_strict(self.path)
+                    if not isinstance(data, dict):
+                        raise ValueError("dokumen state bukan object JSON")
+                except FileNotFoundError:
+                    key = None
+                    break
+                except (ValueError, OSError) as e:
+                    if attempt >= self.retries:
+                        print(f"[WARNING] StateReader({self.path}) => torn/invalid: {e}, "
+                              f"pakai versi terakhir (seq={self.seq}).")
+                        self._bad_key = key
+                        break
+                    time.sleep(self.retry_delay)
+                    key = self._stat()
+                    continue
+                self.data      = data
+                self.seq       = data.get(STATE_META_KEY, {}).get("seq")
+                self._stat_key = key
+                return data
+            return self.data if self.data is not None else default
+
+
 ###############################################################################
 # 7) DOKUMENTASI PENGGUNAAN
 ###############################################################################
@@ -386,6 +810,16 @@ Dokumentasi Penggunaan (Production-Ready):
    # 2.4 Decode credentials (default pakai RTSP_USER_BASE64 & RTSP_PASSWORD_BASE64)
    user, pwd = decode_credentials()
 
+   # 2.5 Pantau perubahan file JSON (inotify, fallback polling untuk NFS)
+   def on_change(data):
+       print("config berubah:", data)
+   FileWatcher("/path/to/config.json", on_change).start()
+
+   # 2.6 Publikasi state bersama (atomic, berversi) & pembacanya
+   publish_state("/path/to/state.json", {"foo": "bar"})      # => _meta.seq naik
+   reader = StateReader("/path/to/state.json")
+   data = reader.read() or {}     # tanpa json.load jika versi belum berubah
+
 3) Syslog-ng:
    - Gunakan filter berdasarkan substring [RTSP], [Resource-Monitor], dsb.
    - Sesuaikan level log dengan DEBUG_MODE di environment.
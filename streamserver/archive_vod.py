@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+archive_vod.py
+
+Playlist HLS VOD dari rekaman arsip (/mnt/Data/Backup), dipakai bersama oleh
+main.py (Flask) dan async_server.py (aiohttp) untuk route:
+
+- /archive/ch<N>?from=&to=        => playlist m3u8 (dibuat on-the-fly)
+- /archive/ch<N>/<path rekaman>   => file rekaman (byte-range) / segmen remux
+
+Alur:
+- Katalog rekaman (recordings.db, index channel+start_ts) => file yang beririsan
+  dengan [from, to]; indeks keyframe sidecar (recording_index.py) per file =>
+  batas segmen selalu di keyframe yang sudah ada, tanpa re-encode.
+- fMP4 (RECORD_FORMAT=fmp4): segmen = byte-range fragmen (moof+mdat) berurutan yang
+  digabung sampai ~ARCHIVE_SEGMENT_TARGET detik, plus EXT-X-MAP (init segment) per
+  file. Player mengambil langsung dari file (Range) => CPU server ~0.
+- Matroska tidak bisa di-byte-range oleh player => tiap segmen di-remux ke MPEG-TS
+  (ffmpeg -c copy dari keyframe, tanpa decode). Rentang campuran mkv + fMP4 juga
+  memakai mode remux (EXT-X-MAP berlaku untuk semua segmen sesudahnya). Remux hanya
+  di mode async (asyncio subprocess); mode sync (Flask, 1 worker) menolak dengan 503.
+- Indeks keyframe di-cache di memori per file (LRU, kunci size+mtime) => request
+  playlist berikutnya / scrub tidak membaca sidecar atau menjalankan ffprobe lagi.
+- URI file di playlist membawa versi (?v=<size>-<mtime_ns>). File di-transcode
+  (os.replace) / dihapus => versi beda => request lama ditolak (410) dan cache
+  byte-range file lama tidak tercampur offset indeks baru. Hanya URI berversi yang
+  boleh di-cache lama (immutable); tanpa versi => no-cache + ETag.
+- Antar file => EXT-X-DISCONTINUITY + EXT-X-PROGRAM-DATE-TIME (jam dinding) =>
+  gap rekaman terlihat di timeline player.
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import math
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import quote
+
+sys.path.append("/app/scripts")
+from utils import setup_category_logger
+from recording_catalog import RecordingCatalog, parse_recording_path, RECORDING_ROOT
+from recording_index import load_index
+
+logger = setup_category_logger("CCTV")
+
+ARCHIVE_ENABLE            = os.getenv("ARCHIVE_ENABLE", "true").lower() == "true"
+ARCHIVE_SEGMENT_TARGET    = float(os.getenv("ARCHIVE_SEGMENT_TARGET", "6"))
+ARCHIVE_DEFAULT_SPAN      = float(os.getenv("ARCHIVE_DEFAULT_SPAN", "3600"))
+ARCHIVE_MAX_SPAN          = float(os.getenv("ARCHIVE_MAX_SPAN", "21600"))
+ARCHIVE_INDEX_CACHE       = int(os.getenv("ARCHIVE_INDEX_CACHE", "256"))
+ARCHIVE_REMUX_MAX_CONCURRENCY = int(os.getenv("ARCHIVE_REMUX_MAX_CONCURRENCY", "4"))
+ARCHIVE_REMUX_TIMEOUT     = float(os.getenv("ARCHIVE_REMUX_TIMEOUT", "30"))
+ARCHIVE_SEGMENT_MAX_AGE   = int(os.getenv("ARCHIVE_SEGMENT_MAX_AGE", "86400"))
+
+# -ss sedikit setelah keyframe => demuxer (stream copy) mundur tepat ke keyframe itu,
+# bukan ke keyframe sebelumnya karena selisih start_time container vs pts video.
+_SEEK_EPS = 0.05
+
+
+class ArchiveError(Exception):
+    """
+    Request arsip tidak valid / tidak ada rekaman. status => kode HTTP.
+    """
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+###############################################################################
+# 1. Cache indeks keyframe
+###############################################################################
+def _version(st) -> str:
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def file_version(path: str):
+    try:
+        return _version(os.stat(path))
+    except OSError:
+        return None
+
+
+class IndexCache:
+    """
+    LRU {path: (versi, doc)}. File berubah (transcode tier, rollover file yang
+    masih ditulis) => versi (size, mtime_ns) beda => indeks dimuat ulang.
+    get() => (versi, doc) atau (None, None).
+    """
+    def __init__(self, maxsize: int = None):
+        self.maxsize = maxsize or ARCHIVE_INDEX_CACHE
+        self._items  = OrderedDict()
+        self._lock   = threading.Lock()
+
+    def get(self, path: str):
+        key = file_version(path)
+        if key is None:
+            return None, None
+        with self._lock:
+            hit = self._items.get(path)
+            if hit is not None and hit[0] == key:
+                self._items.move_to_end(path)
+                return hit
+        # Build (sidecar / parse / ffprobe) di luar lock => file lain tidak ikut menunggu
+        try:
+            doc = load_index(path)
+        except Exception as e:
+            logger.warning(f"[archive] Indeks {path} gagal => {e}")
+            doc = None
+        if doc is None:
+            return None, None
+        with self._lock:
+            self._items[path] = (key, doc)
+            self._items.move_to_end(path)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return key, doc
+
+
+index_cache = IndexCache()
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    # Reader dibuka sekali DB tersedia (writer = container backup)
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = RecordingCatalog.open_reader()
+        return _catalog
+
+
+###############################################################################
+# 2. Parameter request & path file
+###############################################################################
+def parse_time(value: str) -> float:
+    """
+    Epoch, "YYYY-mm-ddTHH:MM:SS" atau "YYYY-mm-dd HH:MM:SS" (waktu lokal).
+    """
+    value = (value or "").strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ArchiveError(f"format waktu tidak dikenal: {value!r}")
+
+
+def parse_range(from_value: str, to_value: str):
+    if not from_value:
+        raise ArchiveError("parameter 'from' wajib diisi")
+    start = parse_time(from_value)
+    end = parse_time(to_value) if to_value else start + ARCHIVE_DEFAULT_SPAN
+    if end <= start:
+        raise ArchiveError("'to' harus setelah 'from'")
+    if end - start > ARCHIVE_MAX_SPAN:
+        raise ArchiveError(f"rentang maksimal {ARCHIVE_MAX_SPAN:.0f} detik")
+    return start, end
+
+
+def resolve_recording(channel: int, rel_path: str):
+    """
+    Path relatif di URL => path absolut di bawah RECORDING_ROOT. Hanya file rekaman
+    standar milik channel itu (tolak traversal / dotfile / file lain).
+    """
+    base = os.path.realpath(RECORDING_ROOT)
+    full = os.path.realpath(os.path.join(base, rel_path))
+    if not full.startswith(base + os.sep) or os.path.basename(full).startswith("."):
+        return None
+    parsed = parse_recording_path(full)
+    if parsed is None or parsed[0] != channel or not os.path.isfile(full):
+        return None
+    return full
+
+
+def open_recording(channel: int, rel_path: str, version: str):
+    """
+    resolve_recording + cache_control_for => (path, cache_control), atau (None, None)
+    jika bukan file rekaman channel itu. Blocking (realpath / isfile / stat di NAS)
+    => mode async memanggilnya di executor.
+    """
+    path = resolve_recording(channel, rel_path)
+    if path is None:
+        return None, None
+    return path, cache_control_for(path, version)
+
+
+def _url_for(channel: int, path: str, version: str) -> str:
+    rel = os.path.relpath(path, RECORDING_ROOT).replace(os.sep, "/")
+    return f"/archive/ch{channel}/{quote(rel)}?v={version}"
+
+
+def cache_control_for(path: str, version: str) -> str:
+    """
+    Cache-Control file / segmen arsip. Versi dari playlist tidak cocok dengan file
+    sekarang (transcode / dihapus lalu dibuat ulang) => ArchiveError 410, player
+    harus memuat ulang playlist.
+    """
+    if not version:
+        return "no-cache"
+    if version != file_version(path):
+        raise ArchiveError("file rekaman sudah berubah, muat ulang playlist", 410)
+    return f"public, max-age={ARCHIVE_SEGMENT_MAX_AGE}, immutable"
+
+
+###############################################################################
+# 3. Playlist
+###############################################################################
+def _segments(doc: dict, rel_from: float, rel_to: float, byte_range: bool) -> list:
+    """
+    Keyframe yang menutupi [rel_from, rel_to] (detik relatif file) digabung jadi
+    segmen ~ARCHIVE_SEGMENT_TARGET. Return list (t, durasi, pos, panjang).
+    """
+    frames = doc["keyframes"]
+    times = doc.get("_times")
+    if times is None:
+        times = doc["_times"] = [k[0] for k in frames]
+    end_of_file = doc.get("duration")
+    if end_of_file is None:
+        end_of_file = times[-1] + (times[-1] - times[0]) / max(1, len(times) - 1)
+
+    i0 = max(0, bisect.bisect_right(times, rel_from) - 1)
+    i1 = max(i0 + 1, bisect.bisect_left(times, rel_to))
+    out = []
+    for i in range(i0, min(i1, len(frames))):
+        t, pos, length = frames[i]
+        t_end = times[i + 1] if i + 1 < len(times) else end_of_file
+        if t_end <= t:
+            continue
+        if out:
+            s_t, s_dur, s_pos, s_len = out[-1]
+            contiguous = not byte_range or s_pos + s_len == pos
+            if s_dur < ARCHIVE_SEGMENT_TARGET and contiguous:
+                out[-1] = (s_t, t_end - s_t, s_pos, (s_len or 0) + (length or 0))
+                continue
+        out.append((t, t_end - t, pos, length))
+    return out
+
+
+def _program_date_time(ts: float) -> str:
+    return datetime.fromtimestamp(ts).astimezone().isoformat(timespec="milliseconds")
+
+
+def build_playlist(channel: int, start_ts: float, end_ts: float, cache: IndexCache = None) -> str:
+    """
+    Playlist VOD untuk [start_ts, end_ts]. ArchiveError jika tidak ada rekaman.
+    Dipanggil di thread (executor) => boleh blocking (SQLite, sidecar, ffprobe).
+    """
+    cache = cache or index_cache
+    catalog = get_catalog()
+    if catalog is None:
+        raise ArchiveError("katalog rekaman belum tersedia", 503)
+
+    files = []
+    for row in catalog.query(channel, start_ts, end_ts):
+        version, doc = cache.get(row["path"])
+        if doc is None or not doc.get("keyframes"):
+            continue
+        files.append((row["path"], version, doc))
+    if not files:
+        raise ArchiveError(f"tidak ada rekaman ch{channel} di rentang itu", 404)
+
+    byte_range = all(doc.get("format") == "fmp4" and doc.get("init") for _, _, doc in files)
+    body, target = [], 1
+    for n, (path, version, doc) in enumerate(files):
+        segs = _segments(doc, start_ts - doc["start_ts"], end_ts - doc["start_ts"], byte_range)
+        if not segs:
+            continue
+        uri = _url_for(channel, path, version)
+        if n > 0:
+            body.append("#EXT-X-DISCONTINUITY")
+        body.append(f"#EXT-X-PROGRAM-DATE-TIME:{_program_date_time(doc['start_ts'] + segs[0][0])}")
+        if byte_range:
+            init_pos, init_len = doc["init"]
+            body.append(f'#EXT-X-MAP:URI="{uri}",BYTERANGE="{init_len}@{init_pos}"')
+        for t, dur, pos, length in segs:
+            target = max(target, math.ceil(dur))
+            body.append(f"#EXTINF:{dur:.3f},")
+            if byte_range:
+                body.append(f"#EXT-X-BYTERANGE:{length}@{pos}")
+                body.append(uri)
+            else:
+                body.append(f"{uri}&t={t:.3f}&d={dur:.3f}")
+
+    header = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    return "\n".join(header + body + ["#EXT-X-ENDLIST", ""])
+
+
+###############################################################################
+# 4. Remux segmen (Matroska / rentang campuran)
+###############################################################################
+def parse_segment_args(t_value: str, d_value: str):
+    try:
+        t, d = float(t_value), float(d_value)
+    except (TypeError, ValueError):
+        raise ArchiveError("parameter segmen 't' dan 'd' tidak valid")
+    if t < 0 or d <= 0 or d > ARCHIVE_SEGMENT_TARGET * 4 + 30:
+        raise ArchiveError("rentang segmen tidak valid")
+    return t, d
+
+
+def remux_command(path: str, t: float, d: float) -> list:
+    """
+    Stream copy dari keyframe t selama d detik => MPEG-TS ke stdout. output_ts_offset
+    => timestamp segmen berurutan dalam satu file tetap kontinu.
+    """
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-ss", f"{t + _SEEK_EPS:.3f}" if t > 0 else "0",
+        "-i", path,
+        "-t", f"{d:.3f}",
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-c", "copy",
+        "-output_ts_offset", f"{t:.3f}",
+        "-muxdelay", "0",
+        "-f", "mpegts", "pipe:1",
+    ]
+
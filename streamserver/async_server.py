@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+async_server.py
+
+Mode serving asinkron (aiohttp) untuk route yang paling sering diakses viewer:
+- /ch<int>/            => index.m3u8 & segmen HLS
+- /snapshots/<file>    => snapshot cctv
+- /status              => ringkasan channel (JSON, kontrak sama dengan main.py)
+- /archive/ch<int>     => playlist HLS VOD rekaman arsip (lihat archive_vod.py)
+
+Alasan:
+- Flask (sync worker) menahan satu worker per request; puluhan player yang
+  polling playlist + segmen cukup untuk menghabiskan worker.
+- Di sini satu event loop melayani ratusan koneksi. File dikirim lewat
+  web.FileResponse (loop.sendfile => zero-copy, stat di executor),
+  lengkap dengan ETag/Last-Modified/Range.
+- channel_validation.json tidak dibaca per request; task background
+  me-reload hanya jika stat file berubah.
+
+Route statis (/, /img, /css, /js) ikut dilayani agar mode async bisa
+menggantikan main.py (Flask) sepenuhnya di port 8080.
+
+Penggunaan:
+-----------
+- Lewat supervisord: STREAM_SERVER_MODE=async =>
+    gunicorn --worker-class aiohttp.GunicornWebWorker async_server:app
+- Standalone: python3 async_server.py
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import json
+import asyncio
+from aiohttp import web
+
+sys.path.append("/app/scripts")
+from utils import setup_category_logger, touch_hls_viewer
+
+from main import (
+    CHANNEL_VALIDATION_PATH,
+    HLS_OUTPUT_DIR,
+    HTML_BASE_DIR,
+    HLS_MIMETYPES,
+    HLS_SEGMENT_MAX_AGE,
+    mask_any_rtsp_in_string,
+    pick_snapshot_variant,
+    status_cache,
+)
+from status_cache import etag_matches
+import archive_vod
+
+logger = setup_category_logger("CCTV")
+
+# Interval (detik) cek perubahan channel_validation.json
+VALIDATION_RELOAD_INTERVAL = float(os.getenv("VALIDATION_RELOAD_INTERVAL", "1.0"))
+
+SNAPSHOT_DIR = os.path.join(HTML_BASE_DIR, "snapshots")
+
+# --------------------------------------------------------------------
+# 0. State channel_validation (di-refresh oleh task background)
+# --------------------------------------------------------------------
+class ValidationState:
+    """
+    Menyimpan isi terakhir channel_validation.json.
+    Reload hanya jika (inode, mtime, size) berubah => tidak ada parse ulang saat idle.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.data = {}
+        self._stat_key = None
+
+    def _read_if_changed(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self._stat_key is not None:
+                self._stat_key = None
+                self.data = {}
+            return
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key == self._stat_key:
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            # File sedang ditulis => coba lagi di putaran berikutnya
+            logger.warning(f"[async_server] Gagal baca {self.path} => {e}")
+            return
+        if isinstance(data, dict):
+            self.data = data
+            self._stat_key = key
+
+    async def refresh_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self._read_if_changed)
+            except Exception as e:
+                logger.error(f"[async_server] refresh_loop => {e}")
+            await asyncio.sleep(VALIDATION_RELOAD_INTERVAL)
+
+
+validation_state = ValidationState(CHANNEL_VALIDATION_PATH)
+
+# --------------------------------------------------------------------
+# 1. Helper
+# --------------------------------------------------------------------
+def _safe_join(base_dir: str, filename: str):
+    """
+    Gabungkan base_dir + filename, tolak path traversal ('..', absolut).
+    """
+    base = os.path.realpath(base_dir)
+    full = os.path.realpath(os.path.join(base, filename))
+    if full != base and not full.startswith(base + os.sep):
+        return None
+    return full
+
+def _not_found():
+    err_404_file = os.path.join(HTML_BASE_DIR, "error", "404.html")
+    if os.path.isfile(err_404_file):
+        return web.FileResponse(err_404_file, status=404)
+    return web.Response(text="<h1>404 Not Found</h1>", status=404, content_type="text/html")
+
+def _file_response(path: str, cache_control: str, content_type: str = None):
+    """
+    FileResponse => sendfile non-blocking + ETag/If-None-Match + Last-Modified + Range.
+    """
+    if not path or not os.path.isfile(path):
+        return _not_found()
+    headers = {"Cache-Control": cache_control}
+    if content_type:
+        headers["Content-Type"] = content_type
+    return web.FileResponse(path, headers=headers)
+
+# --------------------------------------------------------------------
+# 2. Route HLS => /ch<int:channel>/
+# --------------------------------------------------------------------
+async def ch_no_slash(request: web.Request):
+    channel = int(request.match_info["channel"])
+    raise web.HTTPFound(f"/ch{channel}/")
+
+async def serve_channel_files(request: web.Request):
+    """
+    Sama dengan main.serve_channel_files: validasi error_msg & is_active,
+    lalu kirim playlist/segmen dengan Cache-Control yang sesuai.
+    """
+    channel  = int(request.match_info["channel"])
+    filename = request.match_info.get("filename") or "index.m3u8"
+
+    info = validation_state.data.get(str(channel), {})
+    err_msg   = info.get("error_msg")
+    is_active = info.get("is_active", False)
+
+    if err_msg:
+        masked = mask_any_rtsp_in_string(err_msg)
+        err_file = os.path.join(HTML_BASE_DIR, "error", "error.stream.html")
+        if os.path.isfile(err_file):
+            with open(err_file, "r") as f:
+                tmpl = f.read()
+            out_html = tmpl.replace("{{ channel }}", str(channel))
+            out_html = out_html.replace("{{ error_msg }}", masked)
+            out_html = out_html.replace("{{ is_active }}", str(is_active))
+            return web.Response(text=out_html, status=200, content_type="text/html")
+        return web.Response(text=f"<h1>Channel {channel} error => {masked}</h1>",
+                            status=404, content_type="text/html")
+
+    if not is_active:
+        return web.Response(text=f"<h1>Channel {channel} is_active=false => pipeline off</h1>",
+                            status=404, content_type="text/html")
+
+    touch_hls_viewer(channel)
+
+    folder_path = os.path.join(HLS_OUTPUT_DIR, f"ch_{channel}")
+    path = _safe_join(folder_path, filename)
+    ext  = os.path.splitext(filename)[1].lower()
+    if ext == ".m3u8":
+        cache_control = "no-cache"
+    else:
+        # Nama segmen unik lintas restart pipeline (-hls_start_number_source epoch_us)
+        cache_control = f"public, max-age={HLS_SEGMENT_MAX_AGE}, immutable"
+    return _file_response(path, cache_control, HLS_MIMETYPES.get(ext))
+
+# --------------------------------------------------------------------
+# 3. Snapshot => /snapshots/<filename>
+# --------------------------------------------------------------------
+async def serve_snapshots(request: web.Request):
+    """
+    ?size=160|320|full => varian multi-ukuran (lihat main.pick_snapshot_variant).
+    """
+    name = pick_snapshot_variant(request.match_info["filename"],
+                                 request.query.get("size", ""),
+                                 request.headers.get("Accept", ""))
+    path = _safe_join(SNAPSHOT_DIR, name)
+    resp = _file_response(path, "no-cache")
+    resp.headers["Vary"] = "Accept"
+    return resp
+
+# --------------------------------------------------------------------
+# 4. /status => kontrak sama dengan main.status_all_channels
+# --------------------------------------------------------------------
+async def status_all_channels(request: web.Request):
+    """
+    Dokumen dari status_cache (sudah di-serialize) => tanpa I/O di event loop.
+    If-None-Match cocok => 304.
+    """
+    body, etag = status_cache.get(f"{request.scheme}://{request.host}")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type="application/json", headers=headers)
+
+async def index(request: web.Request):
+    index_file = os.path.join(HTML_BASE_DIR, "index.html")
+    if os.path.isfile(index_file):
+        return web.FileResponse(index_file)
+    return web.Response(text="<h1>Welcome. No index.html found.</h1>", content_type="text/html")
+
+# --------------------------------------------------------------------
+# 5. Arsip => /archive/ch<int>?from=&to=
+# --------------------------------------------------------------------
+_remux_slots = None
+
+def _archive_error(e: archive_vod.ArchiveError):
+    return web.Response(text=f"<h1>Archive => {e}</h1>", status=e.status, content_type="text/html")
+
+async def archive_playlist(request: web.Request):
+    """
+    Playlist dibuat di executor (query katalog + indeks keyframe bisa membaca disk).
+    """
+    channel = int(request.match_info["channel"])
+    loop = asyncio.get_running_loop()
+    try:
+        start_ts, end_ts = archive_vod.parse_range(request.query.get("from"), request.query.get("to"))
+        text = await loop.run_in_executor(None, archive_vod.build_playlist, channel, start_ts, end_ts)
+    except archive_vod.ArchiveError as e:
+        return _archive_error(e)
+    return web.Response(text=text, content_type=HLS_MIMETYPES[".m3u8"],
+                        headers={"Cache-Control": "no-cache"})
+
+async def archive_file(request: web.Request):
+    """
+    Tanpa t/d => file rekaman apa adanya (FileResponse: Range => byte-range fMP4).
+    ?t=&d= => segmen remux MPEG-TS (stream copy) untuk Matroska.
+    ?v= => versi file dari playlist (lihat archive_vod.cache_control_for).
+    Resolve path + cek versi (realpath / isfile / stat di NAS) di executor => NAS
+    lambat tidak membekukan HLS live & /status di event loop.
+    """
+    global _remux_slots
+    channel = int(request.match_info["channel"])
+    loop = asyncio.get_running_loop()
+    try:
+        path, cache_control = await loop.run_in_executor(
+            None, archive_vod.open_recording, channel,
+            request.match_info["filename"], request.query.get("v"))
+        if path is None:
+            return _not_found()
+        if "t" not in request.query:
+            # Tanpa _file_response (isfile lagi); FileResponse stat & open di executor
+            headers = {"Cache-Control": cache_control}
+            content_type = HLS_MIMETYPES.get(os.path.splitext(path)[1].lower())
+            if content_type:
+                headers["Content-Type"] = content_type
+            return web.FileResponse(path, headers=headers)
+        t, d = archive_vod.parse_segment_args(request.query.get("t"), request.query.get("d"))
+    except archive_vod.ArchiveError as e:
+        return _archive_error(e)
+    if _remux_slots is None:
+        _remux_slots = asyncio.Semaphore(archive_vod.ARCHIVE_REMUX_MAX_CONCURRENCY)
+
+    async with _remux_slots:
+        proc = await asyncio.create_subprocess_exec(
+            *archive_vod.remux_command(path, t, d),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            # Segmen pendek (~ARCHIVE_SEGMENT_TARGET) => dikumpulkan utuh, lalu
+            # Content-Length pasti (player butuh untuk buffer & retry)
+            body, _ = await asyncio.wait_for(proc.communicate(), archive_vod.ARCHIVE_REMUX_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            logger.warning(f"[archive] Remux timeout => {path} t={t} d={d}")
+            return web.Response(text="<h1>Archive => remux timeout</h1>", status=504,
+                                content_type="text/html")
+    if proc.returncode != 0 or not body:
+        logger.warning(f"[archive] Remux gagal rc={proc.returncode} => {path} t={t} d={d}")
+        return web.Response(text="<h1>Archive => remux gagal</h1>", status=502,
+                            content_type="text/html")
+    return web.Response(body=body, content_type=HLS_MIMETYPES[".ts"],
+                        headers={"Cache-Control": cache_control})
+
+# --------------------------------------------------------------------
+# 6. App factory
+# --------------------------------------------------------------------
+async def _start_background(app: web.Application):
+    app["validation_task"] = asyncio.create_task(validation_state.refresh_loop())
+    status_cache.start()
+
+async def _stop_background(app: web.Application):
+    task = app.get("validation_task")
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+def create_app() -> web.Application:
+    application = web.Application()
+    application.router.add_get(r"/ch{channel:\d+}", ch_no_slash)
+    application.router.add_get(r"/ch{channel:\d+}/", serve_channel_files)
+    application.router.add_get(r"/ch{channel:\d+}/{filename:.+}", serve_channel_files)
+    application.router.add_get(r"/snapshots/{filename:.+}", serve_snapshots)
+    application.router.add_get("/status", status_all_channels)
+    if archive_vod.ARCHIVE_ENABLE:
+        application.router.add_get(r"/archive/ch{channel:\d+}", archive_playlist)
+        application.router.add_get(r"/archive/ch{channel:\d+}/", archive_playlist)
+        application.router.add_get(r"/archive/ch{channel:\d+}/{filename:.+}", archive_file)
+    application.router.add_get("/", index)
+    for sub in ("img", "css", "js"):
+        static_dir = os.path.join(HTML_BASE_DIR, sub)
+        if os.path.isdir(static_dir):
+            application.router.add_static(f"/{sub}/", static_dir)
+    application.on_startup.append(_start_background)
+    application.on_cleanup.append(_stop_background)
+    return application
+
+app = create_app()
+
+if __name__ == "__main__":
+    web.run_app(app, host="0.0.0.0", port=int(os.getenv("ASYNC_SERVER_PORT", "8080")))
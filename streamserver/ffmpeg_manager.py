@@ -8,7 +8,12 @@ Script Manager yang bertugas menjalankan pipeline FFmpeg HLS:
 - Menjalankan pipeline FFmpeg jika is_active=true & error_msg=None.
 - Hentikan pipeline jika is_active=false atau ada error_msg.
 - Tidak menulis balik ke channel_validation.json (hanya membaca).
-- Memantau perubahan JSON tiap 60 detik => update pipeline (add/remove channel).
+- Memantau perubahan JSON via utils.FileWatcher (inotify, fallback polling untuk NFS)
+  => update pipeline (add/remove channel) dalam hitungan milidetik, tanpa I/O saat idle.
+- Load governor (backup/load_governor.py): channel dengan step pause_hls yang tidak
+  punya viewer >= HLS_VIEWER_IDLE detik dijeda; di-resume saat ada viewer / beban turun.
+- Opsional (HLS_RAM_STORE=true): segmen live ditulis ke tmpfs berukuran terbatas
+  (HLS_RAM_DIR), dijaga agar total tidak melewati HLS_RAM_MAX_MB.
 """
 
 import os
@@ -18,13 +23,15 @@ import shlex
 import sys
 import time
 import threading
-import hashlib
 from datetime import datetime
 from urllib.parse import quote, urlparse, urlunparse
 
 # Pastikan utils.py ada di /app/scripts
 sys.path.append("/app/scripts")
-from utils import decode_credentials, setup_category_logger, load_json_file
+from utils import (
+    decode_credentials, setup_category_logger, load_json_file, get_hls_output_dir,
+    FileWatcher, StateReader, last_hls_viewer
+)
 
 logger = setup_category_logger("CCTV-Manager")
 
@@ -40,41 +47,80 @@ def log_error(msg):
 # ----------------------------------------------------------------------------
 RESOURCE_MONITOR_PATH   = os.getenv("RESOURCE_MONITOR_PATH", "/mnt/Data/Syslog/resource/resource_monitor_state.json")
 CHANNEL_VALIDATION_PATH = os.getenv("CHANNEL_VALIDATION_PATH", "/mnt/Data/Syslog/rtsp/channel_validation.json")
-HLS_OUTPUT_DIR          = os.getenv("HLS_OUTPUT_DIR", "/app/streamserver/hls")
+HLS_OUTPUT_DIR          = get_hls_output_dir()
 
 # Param HLS
 HLS_TIME      = os.getenv("HLS_TIME", "2")
 HLS_LIST_SIZE = os.getenv("HLS_LIST_SIZE", "5")
 
+# RAM store (tmpfs) => batas ukuran & interval pengecekan
+HLS_RAM_STORE          = (os.getenv("HLS_RAM_STORE", "false").lower() == "true")
+HLS_RAM_MAX_MB         = int(os.getenv("HLS_RAM_MAX_MB", "192"))
+HLS_RAM_CHECK_INTERVAL = int(os.getenv("HLS_RAM_CHECK_INTERVAL", "5"))
+
+# Load governor (backup/load_governor.py) => HLS channel tanpa viewer boleh dijeda
+GOVERNOR_STATE_PATH         = os.getenv("GOVERNOR_STATE_PATH", "/mnt/Data/Syslog/rtsp/load_governor.json")
+HLS_VIEWER_IDLE             = float(os.getenv("HLS_VIEWER_IDLE", "120"))
+HLS_GOVERNOR_CHECK_INTERVAL = float(os.getenv("HLS_GOVERNOR_CHECK_INTERVAL", "2"))
+
 # Pipeline states
 ffmpeg_processes = {}   # {channel: subprocess.Popen}
 tracked_channels = set()  # channel yang terdaftar
 channel_states   = {}   # {channel: bool} => pipeline running or not?
+governor_pausable = set()  # channel yang boleh dijeda (dari load_governor.json)
+hls_paused       = {}   # {channel: epoch dijeda} => HLS dihentikan governor
 
-# Lock & hash file
+# Lock & watcher file
 data_lock        = threading.Lock()
-resource_hash    = None
-validation_hash  = None
+watchers         = []
 
 # ----------------------------------------------------------------------------
-# 1) Fungsi get_file_hash
+# 1) Proyeksi JSON => hanya field yang relevan untuk pipeline
+#    (FileWatcher memanggil callback hanya jika proyeksi ini berubah)
 # ----------------------------------------------------------------------------
-def get_file_hash(filepath):
-    if not os.path.isfile(filepath):
-        return None
-    import hashlib
-    try:
-        md5 = hashlib.md5()
-        with open(filepath, "rb") as f:
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                md5.update(chunk)
-        return md5.hexdigest()
-    except Exception as e:
-        log_error(f"get_file_hash({filepath}): {e}")
-        return None
+def parse_resource_channels(data: dict) -> tuple:
+    """
+    resource_monitor_state.json => (title, tuple(channels), rtsp_ip).
+    Field yang sering berubah (cpu, ping, dsb.) diabaikan.
+    """
+    if not isinstance(data, dict) or not data:
+        return ("DefaultTitle", (), "127.0.0.1")
+
+    scfg     = data.get("stream_config", {})
+    rtsp_ip  = scfg.get("rtsp_ip", "127.0.0.1")
+    title    = scfg.get("stream_title", "DefaultTitle")
+
+    test_ch  = scfg.get("test_channel", "off")
+    ch_count = scfg.get("channel_count", 0)
+    ch_list  = scfg.get("channel_list", [])
+
+    if test_ch.lower() != "off":
+        arr = [int(x.strip()) for x in test_ch.split(",") if x.strip().isdigit()]
+        return (title, tuple(arr), rtsp_ip)
+    else:
+        if ch_count and ch_list:
+            return (title, tuple(ch_list[:ch_count]), rtsp_ip)
+        else:
+            return (title, (), rtsp_ip)
+
+def parse_validation_state(data: dict) -> dict:
+    """
+    channel_validation.json => {ch_str: {is_active, error_msg, livestream_link}}.
+    last_update, recording, dsb. diabaikan agar pipeline tidak diproses ulang
+    setiap kali backup menulis status.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("channel_validation.json bukan object")
+    out = {}
+    for ch_str, info in data.items():
+        if not isinstance(info, dict):
+            continue
+        out[ch_str] = {
+            "is_active": info.get("is_active", False),
+            "error_msg": info.get("error_msg"),
+            "livestream_link": info.get("livestream_link"),
+        }
+    return out
 
 # ----------------------------------------------------------------------------
 # 2) override_userpass & mask_url_for_log
@@ -128,6 +174,14 @@ def start_ffmpeg_pipeline(channel, title, rtsp_link):
     out_dir = os.path.join(HLS_OUTPUT_DIR, f"ch_{channel}")
     os.makedirs(out_dir, exist_ok=True)
 
+    # temp_file => playlist ditulis ke .tmp lalu rename, agar main.py tidak
+    # pernah men-serve playlist setengah jadi (ETag tetap konsisten).
+    # Di RAM store, segmen lama langsung dihapus (threshold 1) supaya hemat tmpfs.
+    # start_number_source epoch_us => nomor segmen tidak mulai dari index0.ts lagi setiap
+    # pipeline restart (purge, jeda governor, flap validasi) => nama segmen unik
+    # selamanya, aman di-cache "immutable" oleh player/proxy.
+    delete_threshold = "-hls_delete_threshold 1 " if HLS_RAM_STORE else ""
+
     masked_link = mask_url_for_log(rtsp_link)
     cmd = (
         f"ffmpeg -y "
@@ -137,7 +191,9 @@ def start_ffmpeg_pipeline(channel, title, rtsp_link):
         f"-c copy "
         f"-hls_time {HLS_TIME} "
         f"-hls_list_size {HLS_LIST_SIZE} "
-        f"-hls_flags delete_segments+program_date_time "
+        f"-hls_start_number_source epoch_us "
+        f"-hls_flags delete_segments+program_date_time+temp_file "
+        f"{delete_threshold}"
         f"-metadata title='{title} | CH {channel}' "
         f"-f hls {os.path.join(out_dir, 'index.m3u8')}"
     )
@@ -163,30 +219,163 @@ def stop_ffmpeg_pipeline(channel):
     ffmpeg_processes.pop(channel, None)
     channel_states[channel] = False
 
+    # Di RAM store, sisa segmen channel yang berhenti langsung dibuang
+    if HLS_RAM_STORE:
+        purge_channel_dir(channel)
+
 # ----------------------------------------------------------------------------
-# 4) Ambil channel & title dari resource_monitor_state.json
+# 3b) RAM STORE => batasi ukuran working set HLS di tmpfs
 # ----------------------------------------------------------------------------
-def get_channels_from_resource():
-    data = load_json_file(RESOURCE_MONITOR_PATH)
-    if not data:
-        return ("DefaultTitle", [], "127.0.0.1")
+def purge_channel_dir(channel):
+    """
+    Hapus semua file HLS milik channel (dipakai saat pipeline berhenti).
+    """
+    out_dir = os.path.join(HLS_OUTPUT_DIR, f"ch_{channel}")
+    try:
+        with os.scandir(out_dir) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    os.remove(entry.path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log_error(f"purge_channel_dir({channel}) => {e}")
 
-    scfg     = data.get("stream_config", {})
-    rtsp_ip  = scfg.get("rtsp_ip", "127.0.0.1")
-    title    = scfg.get("stream_title", "DefaultTitle")
+def _playlist_segments(ch_dir: str) -> set:
+    """
+    Nama segmen yang masih tercantum di index.m3u8 channel (playlist live).
+    """
+    try:
+        with open(os.path.join(ch_dir, "index.m3u8"), "r") as f:
+            return {line.strip() for line in f
+                    if line.strip() and not line.startswith("#")}
+    except OSError:
+        return set()
 
-    test_ch  = scfg.get("test_channel", "off")
-    ch_count = scfg.get("channel_count", 0)
-    ch_list  = scfg.get("channel_list", [])
+def enforce_hls_store_budget():
+    """
+    Pastikan total segmen .ts di HLS_OUTPUT_DIR <= HLS_RAM_MAX_MB.
+    Jika lewat => hapus segmen paling lama (mtime) lintas channel, HANYA segmen yang
+    sudah keluar dari playlist channel-nya. Segmen yang masih tercantum di index.m3u8
+    dan HLS_LIST_SIZE+1 segmen terbaru per channel (cadangan segmen berikutnya) tidak
+    pernah dihapus => player tidak kena 404 di tengah playlist.
+    Playlist (.m3u8) tidak pernah dihapus di sini.
+    """
+    budget = HLS_RAM_MAX_MB * 1024 * 1024
+    segments = []
+    total = 0
+    try:
+        with os.scandir(HLS_OUTPUT_DIR) as ch_dirs:
+            for ch_dir in ch_dirs:
+                if not ch_dir.is_dir(follow_symlinks=False):
+                    continue
+                ch_segments = []
+                with os.scandir(ch_dir.path) as files:
+                    for entry in files:
+                        if not entry.name.endswith(".ts"):
+                            continue
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except FileNotFoundError:
+                            continue
+                        ch_segments.append((st.st_mtime, st.st_size, entry.path, entry.name))
+                        total += st.st_size
+                live = _playlist_segments(ch_dir.path)
+                ch_segments.sort()
+                keep_newest = int(HLS_LIST_SIZE) + 1
+                for item in ch_segments[:-keep_newest]:
+                    if item[3] not in live:
+                        segments.append(item[:3])
+    except FileNotFoundError:
+        return
 
-    if test_ch.lower() != "off":
-        arr = [int(x.strip()) for x in test_ch.split(",") if x.strip().isdigit()]
-        return (title, arr, rtsp_ip)
-    else:
-        if ch_count and ch_list:
-            return (title, ch_list[:ch_count], rtsp_ip)
-        else:
-            return (title, [], rtsp_ip)
+    if total <= budget:
+        return
+
+    segments.sort()
+    freed = 0
+    for _, size, path in segments:
+        if total - freed <= budget:
+            break
+        try:
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+    if total - freed > budget:
+        log_warning(
+            f"HLS RAM store melewati batas {HLS_RAM_MAX_MB} MB, sisa segmen masih di "
+            f"playlist live => naikkan HLS_RAM_MAX_MB / ukuran tmpfs."
+        )
+    if freed:
+        log_warning(
+            f"HLS RAM store melewati batas {HLS_RAM_MAX_MB} MB => "
+            f"hapus {freed // 1024} KiB segmen lama."
+        )
+
+def hls_store_loop(interval=5):
+    while True:
+        try:
+            enforce_hls_store_budget()
+        except Exception as e:
+            log_error(f"hls_store_loop => {e}")
+        time.sleep(interval)
+
+# ----------------------------------------------------------------------------
+# 3c) Governor => jeda HLS channel tanpa viewer saat overload
+# ----------------------------------------------------------------------------
+def parse_governor_state(data: dict) -> frozenset:
+    """
+    load_governor.json => set channel yang boleh dijeda (step pause_hls).
+    """
+    if not isinstance(data, dict):
+        raise ValueError("load_governor.json invalid")
+    return frozenset(int(c) for c in data.get("hls_pausable", []))
+
+def apply_hls_pause():
+    """
+    Dipanggil dengan data_lock.
+    - Resume: channel tidak lagi pausable, atau ada viewer sejak dijeda.
+    - Pause : channel pausable, pipeline jalan, tanpa viewer >= HLS_VIEWER_IDLE detik.
+    """
+    now = time.time()
+    resumed = []
+    for ch, paused_at in list(hls_paused.items()):
+        if ch not in governor_pausable or last_hls_viewer(ch) > paused_at:
+            del hls_paused[ch]
+            resumed.append(ch)
+    if resumed:
+        log_info(f"[governor] Resume HLS => channel {sorted(resumed)}")
+        update_channels_state(load_json_file(CHANNEL_VALIDATION_PATH))
+
+    for ch in sorted(governor_pausable & tracked_channels):
+        if ch in hls_paused or not channel_states.get(ch):
+            continue
+        idle = now - last_hls_viewer(ch)
+        if idle >= HLS_VIEWER_IDLE:
+            log_info(f"[governor] Jeda HLS channel={ch} (tanpa viewer {int(min(idle, 1e6))}s)")
+            stop_ffmpeg_pipeline(ch)
+            hls_paused[ch] = now
+
+def hls_governor_loop(interval=2.0):
+    while True:
+        time.sleep(interval)
+        try:
+            with data_lock:
+                if hls_paused or governor_pausable:
+                    apply_hls_pause()
+        except Exception as e:
+            log_error(f"hls_governor_loop => {e}")
+
+# ----------------------------------------------------------------------------
+# 4) Ambil channel & title dari resource_monitor_state.json
+# ----------------------------------------------------------------------------
+resource_state = StateReader(RESOURCE_MONITOR_PATH)
+
+def get_channels_from_resource():
+    # StateReader => torn read tidak lagi dianggap "tidak ada channel"
+    title, channels, rtsp_ip = parse_resource_channels(resource_state.read() or {})
+    return (title, list(channels), rtsp_ip)
 
 # ----------------------------------------------------------------------------
 # 5) initial_ffmpeg_setup
@@ -234,35 +423,34 @@ def initial_ffmpeg_setup():
                 channel_states[ch] = False
 
 # ----------------------------------------------------------------------------
-# 6) monitor_loop => pantau perubahan JSON
+# 6) Watcher => reaksi terhadap perubahan JSON
 # ----------------------------------------------------------------------------
-def monitor_loop(interval=60):
-    global resource_hash, validation_hash
-
-    while True:
-        try:
-            # Cek hash file resource
-            new_res = get_file_hash(RESOURCE_MONITOR_PATH)
-            # Cek hash file channel_validation
-            new_val = get_file_hash(CHANNEL_VALIDATION_PATH)
+def on_validation_change(val_data: dict):
+    with data_lock:
+        update_channels_state(val_data)
 
-            with data_lock:
-                # Jika channel_validation.json berubah => cek state
-                if new_val != validation_hash:
-                    validation_hash = new_val
-                    val_data = load_json_file(CHANNEL_VALIDATION_PATH)
-                    update_channels_state(val_data)
-
-                # Jika resource_monitor_state.json berubah => update channels
-                if new_res != resource_hash:
-                    resource_hash = new_res
-                    title, new_ch_list, rtsp_ip = get_channels_from_resource()
-                    update_channels_list(title, new_ch_list, rtsp_ip)
+def on_resource_change(resource_state: tuple):
+    title, new_ch_list, rtsp_ip = resource_state
+    with data_lock:
+        update_channels_list(title, list(new_ch_list), rtsp_ip)
 
-        except Exception as e:
-            log_error(f"monitor_loop => {e}")
+def on_governor_change(pausable: frozenset):
+    global governor_pausable
+    with data_lock:
+        governor_pausable = set(pausable)
+        apply_hls_pause()
 
-        time.sleep(interval)
+def start_watchers():
+    """
+    Pasang FileWatcher untuk channel_validation.json & resource_monitor_state.json.
+    Callback hanya terpanggil jika proyeksi (parse_*) berubah.
+    """
+    watchers.append(FileWatcher(CHANNEL_VALIDATION_PATH, on_validation_change,
+                                parse=parse_validation_state).start())
+    watchers.append(FileWatcher(RESOURCE_MONITOR_PATH, on_resource_change,
+                                parse=parse_resource_channels).start())
+    watchers.append(FileWatcher(GOVERNOR_STATE_PATH, on_governor_change,
+                                parse=parse_governor_state).start())
 
 # ----------------------------------------------------------------------------
 # 7) update_channels_state => cek is_active/error_msg
@@ -297,7 +485,8 @@ def update_channels_state(val_data: dict):
             continue
 
         if is_active:
-            if not prev_state:
+            # Dijeda governor => tetap mati sampai ada viewer / beban turun
+            if not prev_state and ch not in hls_paused:
                 raw_link = info.get("livestream_link")
                 if not raw_link:
                     raw_link = f"rtsp://{fallback_ip}:554/cam/realmonitor?channel={ch}&subtype=0"
@@ -360,14 +549,23 @@ def update_channels_list(title, new_ch_list, rtsp_ip):
             stop_ffmpeg_pipeline(ch)
             tracked_channels.remove(ch)
             channel_states.pop(ch, None)
+            hls_paused.pop(ch, None)
 
 # ----------------------------------------------------------------------------
 # 9) main_service
 # ----------------------------------------------------------------------------
 def main_service():
+    if HLS_RAM_STORE:
+        os.makedirs(HLS_OUTPUT_DIR, exist_ok=True)
+        log_info(f"HLS RAM store aktif => dir={HLS_OUTPUT_DIR}, max={HLS_RAM_MAX_MB} MB")
+        t_store = threading.Thread(target=hls_store_loop,
+                                   kwargs={"interval": HLS_RAM_CHECK_INTERVAL}, daemon=True)
+        t_store.start()
+
     initial_ffmpeg_setup()
-    t = threading.Thread(target=monitor_loop, kwargs={"interval":60}, daemon=True)
-    t.start()
+    start_watchers()
+    threading.Thread(target=hls_governor_loop,
+                     kwargs={"interval": HLS_GOVERNOR_CHECK_INTERVAL}, daemon=True).start()
 
     # Idle loop agar script tidak exit
     while True:
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+loadtest_hls.py
+
+Load test sederhana untuk stream server (mode sync Flask maupun async aiohttp).
+Mensimulasikan N client HLS:
+- Ambil /ch<N>/index.m3u8
+- Ambil segmen terbaru yang tercantum di playlist
+- Tunggu --think detik (default ~ HLS_TIME/2), ulangi
+Opsional: sebagian client hanya polling /status (dashboard).
+
+Output: total request, request/s berkelanjutan, latency p50/p95/p99, error & status code.
+
+Contoh:
+  python3 loadtest_hls.py --base http://127.0.0.1:8080 --clients 200 \
+      --channels 1,2,3,4 --duration 60 --status-clients 10
+
+Author: (Anda)
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import aiohttp
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.status = Counter()
+        self.errors = 0
+        self.bytes = 0
+
+    def add(self, latency: float, status: int, size: int):
+        self.latencies.append(latency)
+        self.status[status] += 1
+        self.bytes += size
+
+    def percentile(self, pct: float) -> float:
+        if not self.latencies:
+            return 0.0
+        data = sorted(self.latencies)
+        idx = min(len(data) - 1, int(round(pct / 100.0 * (len(data) - 1))))
+        return data[idx]
+
+
+async def fetch(session, url, stats: Stats):
+    t0 = time.perf_counter()
+    try:
+        async with session.get(url) as resp:
+            body = await resp.read()
+            stats.add(time.perf_counter() - t0, resp.status, len(body))
+            return resp.status, body
+    except Exception:
+        stats.errors += 1
+        return None, b""
+
+
+def last_segment(playlist: bytes):
+    for line in reversed(playlist.decode(errors="ignore").splitlines()):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            return line
+    return None
+
+
+async def hls_client(session, base, channel, deadline, think, stats: Stats):
+    ch_url = f"{base}/ch{channel}/"
+    while time.monotonic() < deadline:
+        status, body = await fetch(session, ch_url + "index.m3u8", stats)
+        if status == 200:
+            seg = last_segment(body)
+            if seg:
+                await fetch(session, ch_url + seg, stats)
+        await asyncio.sleep(think)
+
+
+async def status_client(session, base, deadline, think, stats: Stats):
+    while time.monotonic() < deadline:
+        await fetch(session, f"{base}/status", stats)
+        await asyncio.sleep(think)
+
+
+async def run(args):
+    channels = [int(c) for c in args.channels.split(",") if c.strip()]
+    stats = Stats()
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    deadline = time.monotonic() + args.duration
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = []
+        for i in range(args.clients):
+            ch = channels[i % len(channels)]
+            tasks.append(hls_client(session, args.base, ch, deadline, args.think, stats))
+        for _ in range(args.status_clients):
+            tasks.append(status_client(session, args.base, deadline, args.status_think, stats))
+        t0 = time.monotonic()
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - t0
+
+    total = len(stats.latencies)
+    print(f"clients={args.clients} status_clients={args.status_clients} duration={elapsed:.1f}s")
+    print(f"requests={total} errors={stats.errors} req/s={total / elapsed:.1f} "
+          f"MiB/s={stats.bytes / elapsed / (1024 * 1024):.2f}")
+    print(f"latency ms => p50={stats.percentile(50) * 1000:.1f} "
+          f"p95={stats.percentile(95) * 1000:.1f} p99={stats.percentile(99) * 1000:.1f} "
+          f"max={max(stats.latencies, default=0) * 1000:.1f}")
+    print(f"status => {dict(stats.status)}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test HLS/status stream server")
+    ap.add_argument("--base", default="http://127.0.0.1:8080")
+    ap.add_argument("--clients", type=int, default=200)
+    ap.add_argument("--channels", default="1")
+    ap.add_argument("--duration", type=float, default=60.0)
+    ap.add_argument("--think", type=float, default=1.0,
+                    help="jeda antar siklus playlist+segmen per client (detik)")
+    ap.add_argument("--status-clients", type=int, default=0)
+    ap.add_argument("--status-think", type=float, default=5.0)
+    ap.add_argument("--timeout", type=float, default=30.0)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,11 @@ Membaca data channel dari channel_validation.json:
 - Menyajikan status channel di /status + men-serve HLS di /ch<int>/.
 
 Juga men-serve snapshot (jika ada) di /snapshots/<filename>.
+Rekaman arsip diputar sebagai HLS VOD di /archive/ch<int>?from=&to= (archive_vod.py).
+
+File HLS di-serve lewat send_file (wsgi.file_wrapper => sendfile di Gunicorn),
+dengan Cache-Control berbeda untuk playlist vs segmen, plus ETag/Last-Modified.
+Jika HLS_RAM_STORE=true, folder HLS berada di tmpfs (lihat utils.get_hls_output_dir).
 
 Penggunaan:
 -----------
@@ -23,22 +28,34 @@ Author: (Anda)
 """
 
 import os
+import re
 import json
 import sys
-from flask import Flask, send_from_directory, redirect, url_for, jsonify
+from flask import Flask, send_from_directory, send_file, redirect, request, Response
 
 # Opsional: logging pakai utils
 sys.path.append("/app/scripts")
-from utils import setup_category_logger, load_json_file
+from utils import setup_category_logger, load_json_file, get_hls_output_dir, touch_hls_viewer
+from status_cache import StatusCache, etag_matches
+import archive_vod
 
 app = Flask(__name__)
 logger = setup_category_logger("CCTV")
 
 # Environment variable atau default
 CHANNEL_VALIDATION_PATH = os.getenv("CHANNEL_VALIDATION_PATH", "/mnt/Data/Syslog/rtsp/channel_validation.json")
-HLS_OUTPUT_DIR          = os.getenv("HLS_OUTPUT_DIR", "/app/streamserver/hls")
+HLS_OUTPUT_DIR          = get_hls_output_dir()
 HTML_BASE_DIR           = os.getenv("HTML_BASE_DIR", "/app/streamserver/html")
 
+# Cache HLS: playlist selalu revalidate (ETag => 304), segmen immutable
+HLS_SEGMENT_MAX_AGE = int(os.getenv("HLS_SEGMENT_MAX_AGE", "60"))
+HLS_MIMETYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts":   "video/mp2t",
+    ".m4s":  "video/iso.segment",
+    ".mp4":  "video/mp4",
+}
+
 def mask_any_rtsp_in_string(text: str) -> str:
     """
     Mask substring 'rtsp://...' => 'rtsp://****:****@'
@@ -54,6 +71,12 @@ def mask_any_rtsp_in_string(text: str) -> str:
         suffix = text[idx:].split(" ", 1)[1]
     return prefix + "rtsp://****:****@" + suffix
 
+status_cache = StatusCache(
+    CHANNEL_VALIDATION_PATH,
+    os.path.join(HTML_BASE_DIR, "snapshots"),
+    mask_any_rtsp_in_string
+)
+
 @app.route("/")
 def index():
     index_file = os.path.join(HTML_BASE_DIR, "index.html")
@@ -84,13 +107,42 @@ def serve_js(filename):
     js_dir = os.path.join(HTML_BASE_DIR, "js")
     return send_from_directory(js_dir, filename)
 
+SNAPSHOT_NAME_RE = re.compile(r"^(ch_\d+)\.jpg$")
+
+def pick_snapshot_variant(filename: str, size: str, accept: str) -> str:
+    """
+    Pilih file snapshot sesuai ?size= (mis. 160/320/full) dan header Accept.
+    ch_1.jpg + size=160 + Accept image/webp => ch_1_160.webp (jika ada),
+    lalu ch_1_160.jpg, terakhir file asli.
+    """
+    m = SNAPSHOT_NAME_RE.match(filename)
+    if not m or not size:
+        return filename
+    base = m.group(1) if size == "full" else f"{m.group(1)}_{size}"
+    candidates = []
+    if accept and "image/webp" in accept:
+        candidates.append(f"{base}.webp")
+    candidates.append(f"{base}.jpg")
+    snap_dir = os.path.join(HTML_BASE_DIR, "snapshots")
+    for name in candidates:
+        if os.path.isfile(os.path.join(snap_dir, name)):
+            return name
+    return filename
+
 @app.route("/snapshots/<path:filename>")
 def serve_snapshots(filename):
     """
-    Men-serve hasil snapshot cctv (.jpg) dari /snapshots.
+    Men-serve hasil snapshot cctv dari /snapshots.
+    ?size=160|320|full => varian multi-ukuran (WebP jika browser mendukung).
+    ETag/If-None-Match => 304 jika snapshot belum berubah.
     """
     snap_dir = os.path.join(HTML_BASE_DIR, "snapshots")
-    return send_from_directory(snap_dir, filename)
+    name = pick_snapshot_variant(filename, request.args.get("size", ""),
+                                 request.headers.get("Accept", ""))
+    resp = send_from_directory(snap_dir, name, max_age=0)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["Vary"] = "Accept"
+    return resp
 
 # --------------------------------------------------------------------
 # 2. Route HLS => /ch<int:channel>/
@@ -128,8 +180,33 @@ def serve_channel_files(channel, filename):
     if not is_active:
         return f"<h1>Channel {channel} is_active=false => pipeline off</h1>", 404
 
+    # Penanda viewer => HLS channel ini tidak dijeda governor (ffmpeg_manager.py)
+    touch_hls_viewer(channel)
+
     folder_path = os.path.join(HLS_OUTPUT_DIR, f"ch_{channel}")
-    return send_from_directory(folder_path, filename)
+    return send_hls_file(folder_path, filename)
+
+def send_hls_file(folder_path: str, filename: str):
+    """
+    Kirim file HLS dengan header cache yang tepat:
+    - .m3u8 => 'no-cache' (player selalu revalidate, dijawab 304 jika ETag sama)
+    - segmen => 'public, max-age=..., immutable' (nomor segmen dimulai dari epoch
+      mikrodetik tiap start pipeline, lihat ffmpeg_manager.start_ffmpeg_pipeline =>
+      nama segmen tidak dipakai ulang walau pipeline restart)
+    send_from_directory => conditional=True, ETag & Last-Modified otomatis,
+    body lewat wsgi.file_wrapper (sendfile, zero-copy di Gunicorn).
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    resp = send_from_directory(
+        folder_path, filename,
+        mimetype=HLS_MIMETYPES.get(ext),
+        max_age=0
+    )
+    if ext == ".m3u8":
+        resp.headers["Cache-Control"] = "no-cache"
+    else:
+        resp.headers["Cache-Control"] = f"public, max-age={HLS_SEGMENT_MAX_AGE}, immutable"
+    return resp
 
 # --------------------------------------------------------------------
 # 3. Endpoint /status => ringkasan channel
@@ -149,46 +226,63 @@ def status_all_channels():
       },
       ...
     }
+
+    Dokumen diambil dari status_cache (sudah di-serialize, rebuild hanya jika
+    channel_validation.json / folder snapshots berubah). If-None-Match => 304.
     """
-    data = load_json_file(CHANNEL_VALIDATION_PATH)
-    result = {}
-    for ch_str, info in data.items():
-        try:
-            ch_num = int(ch_str)
-        except:
-            ch_num = ch_str
-
-        hls_url = url_for("serve_channel_files", channel=ch_num, filename="", _external=True)
-
-        err = info.get("error_msg")
-        if err:
-            err = mask_any_rtsp_in_string(err)
-
-        # Livestream link di-mask
-        raw_link = info.get("livestream_link", "")
-        masked_link = mask_any_rtsp_in_string(raw_link) if raw_link else None
-
-        # Cek snapshot => ch_<channel>.jpg
-        snapshot_filename = f"ch_{ch_str}.jpg"
-        snapshot_path = os.path.join(HTML_BASE_DIR, "snapshots", snapshot_filename)
-        if os.path.isfile(snapshot_path):
-            thumbnail_url = url_for("serve_snapshots", filename=snapshot_filename, _external=True)
-        else:
-            # Fallback default
-            thumbnail_url = url_for("serve_images", filename="default-thumb.jpg", _external=True)
-
-        result[ch_str] = {
-            "is_active": info.get("is_active", False),
-            "error_msg": err,
-            "last_update": info.get("last_update"),
-            "hls_url": hls_url,
-            "livestream_link": masked_link,
-            "thumbnail_url": thumbnail_url
-        }
-    return jsonify(result)
+    body, etag = status_cache.get(request.host_url.rstrip("/"))
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype="application/json")
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+# --------------------------------------------------------------------
+# 4. Arsip => /archive/ch<int>?from=&to=
+# --------------------------------------------------------------------
+@app.route("/archive/ch<int:channel>", strict_slashes=False)
+def archive_playlist(channel):
+    """
+    Playlist HLS VOD dari rekaman yang menutupi rentang from..to (lihat archive_vod.py).
+    """
+    if not archive_vod.ARCHIVE_ENABLE:
+        return "<h1>404 Not Found</h1>", 404
+    try:
+        start_ts, end_ts = archive_vod.parse_range(request.args.get("from"), request.args.get("to"))
+        text = archive_vod.build_playlist(channel, start_ts, end_ts)
+    except archive_vod.ArchiveError as e:
+        return f"<h1>Archive => {e}</h1>", e.status
+    resp = Response(text, mimetype=HLS_MIMETYPES[".m3u8"])
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+@app.route("/archive/ch<int:channel>/<path:filename>")
+def archive_file(channel, filename):
+    """
+    Tanpa t/d => file rekaman (send_file conditional => Range / byte-range fMP4).
+    ?t=&d= => segmen remux MPEG-TS (Matroska) => 503: ffmpeg remux (s/d
+    ARCHIVE_REMUX_TIMEOUT) di satu-satunya worker sync akan memblokir HLS live.
+    Remux hanya di STREAM_SERVER_MODE=async.
+    ?v= => versi file dari playlist (lihat archive_vod.cache_control_for).
+    """
+    path = archive_vod.resolve_recording(channel, filename) if archive_vod.ARCHIVE_ENABLE else None
+    if path is None:
+        return "<h1>404 Not Found</h1>", 404
+    if "t" in request.args:
+        return "<h1>Archive => remux Matroska hanya di STREAM_SERVER_MODE=async</h1>", 503
+    try:
+        cache_control = archive_vod.cache_control_for(path, request.args.get("v"))
+    except archive_vod.ArchiveError as e:
+        return f"<h1>Archive => {e}</h1>", e.status
+    ext = os.path.splitext(path)[1].lower()
+    resp = send_file(path, mimetype=HLS_MIMETYPES.get(ext), conditional=True, max_age=0)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
 
 # --------------------------------------------------------------------
-# 4. Custom error
+# 5. Custom error
 # --------------------------------------------------------------------
 @app.errorhandler(404)
 def custom_404(e):
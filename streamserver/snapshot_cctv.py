@@ -6,10 +6,23 @@ Mengambil snapshot (frame tunggal) dari beberapa channel RTSP
 (baca dari /mnt/Data/Syslog/rtsp/channel_validation.json).
 Hanya channel "is_active": true yang di-snapshot.
 
-- Reload otomatis jika file JSON berubah (dengan cek hash/mtime).
+- Reload otomatis jika file JSON berubah (utils.FileWatcher => inotify,
+  fallback polling untuk NFS); hanya daftar channel aktif + link yang dibandingkan.
+- Scheduler: worker pool dibatasi SNAPSHOT_MAX_CONCURRENCY (sesi NVR bersamaan),
+  deadline keras SNAPSHOT_TIMEOUT per capture, dan jadwal channel disebar merata
+  sepanjang INTERVAL_SEC (tidak burst).
+- Statistik per channel (latency, ok/fail/timeout/skip) => SNAPSHOT_STATS_PATH.
+- Sumber frame: keyframe pertama dari segmen HLS terbaru (ffmpeg_manager) jika
+  masih segar (<= SNAPSHOT_SEGMENT_MAX_AGE detik); RTSP hanya sebagai fallback.
+- ch_<N>.jpg tidak ditulis ulang jika perceptual hash (dHash 64-bit) frame baru
+  sama dengan sebelumnya (jarak Hamming <= SNAPSHOT_PHASH_THRESHOLD).
+- Multi-ukuran (SNAPSHOT_SIZES, mis. "160,320,full") => ch_<N>_<size>.<ext>,
+  format WebP jika encoder tersedia (SNAPSHOT_THUMB_FORMAT=auto), selain itu JPEG.
+  Semua file ditulis atomik (tmp + rename). ch_<N>.jpg tetap ada untuk kompatibilitas.
 - ENV:
   * RTSP_USER_BASE64, RTSP_PASSWORD_BASE64 (user/pass)
   * DEBUG_CREDENTIALS="true"/"false"
+  * SNAPSHOT_INTERVAL, SNAPSHOT_MAX_CONCURRENCY, SNAPSHOT_TIMEOUT, SNAPSHOT_STATS_PATH
 
 Author: Anda
 """
@@ -19,17 +32,37 @@ import sys
 import time
 import subprocess
 import re
-import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append("/app/scripts")
-from utils import decode_credentials, setup_category_logger, load_json_file
+from utils import (
+    decode_credentials, setup_category_logger, save_json_file,
+    get_hls_output_dir, FileWatcher
+)
 
 ###############################################################################
 # KONFIGURASI
 ###############################################################################
 CHANNEL_VALIDATION_JSON = "/mnt/Data/Syslog/rtsp/channel_validation.json"
 SNAPSHOT_DIR            = "/app/streamserver/html/snapshots"
-INTERVAL_SEC            = 30
+INTERVAL_SEC            = int(os.getenv("SNAPSHOT_INTERVAL", "30"))
+
+# Scheduler
+SNAPSHOT_MAX_CONCURRENCY = int(os.getenv("SNAPSHOT_MAX_CONCURRENCY", "2"))
+SNAPSHOT_TIMEOUT         = float(os.getenv("SNAPSHOT_TIMEOUT", "15"))
+SNAPSHOT_STATS_PATH      = os.getenv("SNAPSHOT_STATS_PATH", "/mnt/Data/Syslog/rtsp/snapshot_stats.json")
+# Sisa budget minimal (detik) agar langkah berikutnya (RTSP fallback / thumbnail) masih dijalankan
+_MIN_STEP_BUDGET         = 0.5
+
+# Sumber segmen HLS lokal & perceptual hash
+HLS_OUTPUT_DIR            = get_hls_output_dir()
+SNAPSHOT_SEGMENT_MAX_AGE  = float(os.getenv("SNAPSHOT_SEGMENT_MAX_AGE", "10"))
+SNAPSHOT_PHASH_THRESHOLD  = int(os.getenv("SNAPSHOT_PHASH_THRESHOLD", "2"))
+
+# Multi-ukuran thumbnail
+SNAPSHOT_SIZES        = [x.strip() for x in os.getenv("SNAPSHOT_SIZES", "160,320,full").split(",") if x.strip()]
+SNAPSHOT_THUMB_FORMAT = os.getenv("SNAPSHOT_THUMB_FORMAT", "auto").lower()
 
 logger = setup_category_logger("RTSP")
 DEBUG_CREDENTIALS = (os.getenv("DEBUG_CREDENTIALS", "false").lower() == "true")
@@ -37,23 +70,6 @@ DEBUG_CREDENTIALS = (os.getenv("DEBUG_CREDENTIALS", "false").lower() == "true")
 ###############################################################################
 # FUNGSI BANTU
 ###############################################################################
-def get_file_hash(filepath):
-    """Menghasilkan hash MD5 file, atau None jika tidak ada."""
-    if not os.path.isfile(filepath):
-        return None
-    try:
-        md5 = hashlib.md5()
-        with open(filepath, "rb") as f:
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                md5.update(chunk)
-        return md5.hexdigest()
-    except Exception as e:
-        logger.error(f"get_file_hash({filepath}) => {e}")
-        return None
-
 def mask_rtsp_link(rtsp_link: str) -> str:
     """Mask user:pass => ****:**** dalam link RTSP."""
     pattern = re.compile(r"(rtsp://)([^:]+):([^@]+)@(.*)")
@@ -94,17 +110,152 @@ def replace_credentials_in_link(link: str, user: str, pwd: str) -> str:
 
     return link_final
 
-def take_snapshot(rtsp_link: str, output_path: str) -> bool:
-    cmd = [
-        "ffmpeg", "-y",
+def dhash_from_gray(pixels: bytes) -> int:
+    """
+    dHash 64-bit dari frame grayscale 9x8 (72 byte):
+    bit = 1 jika piksel lebih terang dari tetangga kanannya.
+    """
+    value = 0
+    for row in range(8):
+        base = row * 9
+        for col in range(8):
+            value = (value << 1) | (1 if pixels[base + col] > pixels[base + col + 1] else 0)
+    return value
+
+def grab_frame(input_args: list, tmp_path: str, timeout: float = None):
+    """
+    Satu proses ffmpeg, dua output:
+    - JPEG penuh => tmp_path
+    - frame grayscale 9x8 => stdout (untuk dHash)
+    Return (result, dhash) dengan result "ok" / "fail" / "timeout".
+    """
+    deadline = timeout if timeout else SNAPSHOT_TIMEOUT
+    cmd = (
+        ["ffmpeg", "-y", "-loglevel", "error"]
+        + input_args
+        + ["-map", "0:v:0", "-frames:v", "1", "-update", "1", tmp_path,
+           "-map", "0:v:0", "-frames:v", "1", "-vf", "scale=9:8,format=gray",
+           "-f", "rawvideo", "pipe:1"]
+    )
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                timeout=deadline)
+    except subprocess.TimeoutExpired:
+        return "timeout", None
+    if result.returncode != 0 or not os.path.isfile(tmp_path):
+        return "fail", None
+    gray = result.stdout
+    return "ok", (dhash_from_gray(gray) if len(gray) >= 72 else None)
+
+def take_snapshot(rtsp_link: str, output_path: str, timeout: float = None):
+    """
+    Ambil 1 frame dari RTSP (fallback jika tidak ada segmen HLS segar).
+    """
+    deadline = timeout if timeout else SNAPSHOT_TIMEOUT
+    return grab_frame([
         "-rtsp_transport", "tcp",
+        # socket I/O timeout (mikrodetik) => gagal lebih cepat dari deadline keras
+        "-timeout", str(int(deadline * 1_000_000)),
         "-i", rtsp_link,
-        "-frames:v", "1",
-        output_path
-    ]
-    # Minimalkan log => stdout/stderr ke DEVNULL
-    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    return (result.returncode == 0)
+    ], output_path, deadline)
+
+def take_snapshot_from_segment(segment_path: str, output_path: str, timeout: float = None):
+    """
+    Ambil keyframe pertama dari segmen .ts lokal (tanpa sesi RTSP baru).
+    -skip_frame nokey => decoder hanya men-decode keyframe.
+    """
+    return grab_frame(["-skip_frame", "nokey", "-i", segment_path], output_path, timeout)
+
+_thumb_ext = None
+
+def get_thumb_ext() -> str:
+    """
+    Format thumbnail: 'webp' jika ffmpeg punya encoder libwebp (cek sekali), selain itu 'jpg'.
+    """
+    global _thumb_ext
+    if _thumb_ext is None:
+        if SNAPSHOT_THUMB_FORMAT in ("webp", "jpg"):
+            _thumb_ext = SNAPSHOT_THUMB_FORMAT
+        else:
+            try:
+                out = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"],
+                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     timeout=10).stdout
+                _thumb_ext = "webp" if b"libwebp" in out else "jpg"
+            except Exception:
+                _thumb_ext = "jpg"
+        logger.info(f"[snapshot_cctv] Format thumbnail => {_thumb_ext}")
+    return _thumb_ext
+
+def write_thumbnails(ch: str, full_jpg: str, timeout: float = None) -> bool:
+    """
+    Dari JPEG penuh (sudah di-capture) => semua ukuran SNAPSHOT_SIZES dalam satu
+    proses ffmpeg. Tiap file ditulis ke .tmp lalu di-rename (atomik).
+    """
+    ext = get_thumb_ext()
+    if not SNAPSHOT_SIZES or (ext == "jpg" and SNAPSHOT_SIZES == ["full"]):
+        return True  # full JPEG = ch_<N>.jpg, tidak perlu varian
+
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-i", full_jpg]
+    outputs = []
+    for size in SNAPSHOT_SIZES:
+        if size == "full":
+            if ext == "jpg":
+                continue
+            final = os.path.join(SNAPSHOT_DIR, f"ch_{ch}.{ext}")
+            vf = []
+        elif size.isdigit():
+            final = os.path.join(SNAPSHOT_DIR, f"ch_{ch}_{size}.{ext}")
+            vf = ["-vf", f"scale={size}:-2"]
+        else:
+            continue
+        tmp = os.path.join(SNAPSHOT_DIR, f".{os.path.basename(final)}.tmp.{ext}")
+        cmd += vf + ["-frames:v", "1", "-update", "1"]
+        if ext == "webp":
+            cmd += ["-quality", "70"]
+        else:
+            cmd += ["-q:v", "5"]
+        cmd.append(tmp)
+        outputs.append((tmp, final))
+
+    try:
+        r = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           timeout=timeout if timeout else SNAPSHOT_TIMEOUT)
+        ok = (r.returncode == 0)
+    except subprocess.TimeoutExpired:
+        ok = False
+
+    for tmp, final in outputs:
+        if ok and os.path.isfile(tmp):
+            os.replace(tmp, final)
+        else:
+            _remove_quiet(tmp)
+    return ok
+
+def newest_fresh_segment(ch: str):
+    """
+    Segmen .ts terbaru milik channel di HLS_OUTPUT_DIR/ch_<N>,
+    atau None jika tidak ada / lebih tua dari SNAPSHOT_SEGMENT_MAX_AGE.
+    """
+    ch_dir = os.path.join(HLS_OUTPUT_DIR, f"ch_{ch}")
+    newest = None
+    newest_mtime = 0.0
+    try:
+        with os.scandir(ch_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".ts"):
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if mtime > newest_mtime:
+                    newest, newest_mtime = entry.path, mtime
+    except FileNotFoundError:
+        return None
+    if newest is None or (time.time() - newest_mtime) > SNAPSHOT_SEGMENT_MAX_AGE:
+        return None
+    return newest
 
 def log_credentials(user: str, pwd: str):
     if DEBUG_CREDENTIALS:
@@ -126,9 +277,196 @@ def log_rtsp(ch: str, rtsp_link: str, success: bool):
         else:
             logger.warning(f"[snapshot_cctv] Gagal snapshot ch {ch} => {masked}")
 
+def _remove_quiet(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+###############################################################################
+# SCHEDULER
+###############################################################################
+class SnapshotScheduler:
+    """
+    Menjadwalkan snapshot per channel:
+    - Channel ke-i (dari N) mendapat offset i * interval / N => capture tersebar
+      merata sepanjang interval, bukan burst di awal putaran.
+    - Worker pool berukuran max_concurrency => batas sesi RTSP bersamaan ke NVR.
+    - Jika capture channel sebelumnya masih berjalan saat jadwal berikutnya tiba
+      => skip (dihitung), agar satu kamera lambat tidak menumpuk antrian.
+    """
+    def __init__(self, interval, max_concurrency, timeout, stats_path):
+        self.interval   = max(1.0, float(interval))
+        self.timeout    = timeout
+        self.stats_path = stats_path
+        self.max_concurrency = max(1, max_concurrency)
+        self.pool       = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                             thread_name_prefix="snapshot")
+        self.lock       = threading.Lock()
+        self.links      = {}     # {ch_str: rtsp_link}
+        self.next_due   = {}     # {ch_str: monotonic time}
+        self.in_flight  = set()
+        self.stats      = {}     # {ch_str: {...}}
+        self.hashes     = {}     # {ch_str: dHash snapshot terakhir yang ditulis}
+
+    def _ch_stats(self, ch: str) -> dict:
+        st = self.stats.get(ch)
+        if st is None:
+            st = {
+                "ok": 0, "fail": 0, "timeout": 0, "skipped": 0,
+                "from_segment": 0, "from_rtsp": 0, "unchanged": 0,
+                "last_result": None, "last_latency_ms": None,
+                "avg_latency_ms": None, "last_ok_at": None
+            }
+            self.stats[ch] = st
+        return st
+
+    def set_channels(self, links: dict):
+        """
+        Perbarui daftar channel aktif. Jadwal channel baru disebar ulang
+        sesuai urutan channel.
+        """
+        with self.lock:
+            if set(links) == set(self.links):
+                self.links = dict(links)
+                return
+            self.links = dict(links)
+            chans = sorted(self.links, key=lambda c: int(c) if c.isdigit() else c)
+            now = time.monotonic()
+            step = self.interval / len(chans) if chans else 0
+            self.next_due = {ch: now + i * step for i, ch in enumerate(chans)}
+
+    def _capture(self, ch: str, link: str):
+        """
+        Segmen HLS segar => keyframe lokal; jika tidak ada => RTSP.
+        Frame dengan dHash sama => file lama dipertahankan (tidak ditulis ulang).
+        Satu deadline (self.timeout) untuk seluruh capture: tiap langkah hanya dapat
+        sisa budget; budget habis => RTSP fallback / thumbnail dilewati.
+        Return (result, source, changed).
+        """
+        snapshot_path = os.path.join(SNAPSHOT_DIR, f"ch_{ch}.jpg")
+        tmp_path = os.path.join(SNAPSHOT_DIR, f".ch_{ch}.tmp.jpg")
+        deadline = time.monotonic() + self.timeout
+
+        def remaining():
+            return deadline - time.monotonic()
+
+        source = "segment"
+        segment = newest_fresh_segment(ch)
+        result, new_hash = ("fail", None)
+        if segment:
+            result, new_hash = take_snapshot_from_segment(segment, tmp_path, remaining())
+        if result != "ok":
+            source = "rtsp"
+            if remaining() >= _MIN_STEP_BUDGET:
+                result, new_hash = take_snapshot(link, tmp_path, remaining())
+            else:
+                result = "timeout"
+        if result != "ok":
+            _remove_quiet(tmp_path)
+            return result, source, False
+
+        old_hash = self.hashes.get(ch)
+        if (new_hash is not None and old_hash is not None
+                and bin(new_hash ^ old_hash).count("1") <= SNAPSHOT_PHASH_THRESHOLD
+                and os.path.isfile(snapshot_path)):
+            _remove_quiet(tmp_path)
+            return result, source, False
+
+        if remaining() < _MIN_STEP_BUDGET:
+            logger.debug(f"[snapshot_cctv] Budget habis => thumbnail ch {ch} dilewati")
+        elif not write_thumbnails(ch, tmp_path, remaining()):
+            logger.warning(f"[snapshot_cctv] Gagal membuat thumbnail multi-ukuran ch {ch}")
+        os.replace(tmp_path, snapshot_path)
+        self.hashes[ch] = new_hash
+        return result, source, True
+
+    def _run_capture(self, ch: str, link: str):
+        t0 = time.monotonic()
+        result, source, changed = "fail", "rtsp", False
+        try:
+            result, source, changed = self._capture(ch, link)
+        except Exception as e:
+            logger.error(f"[snapshot_cctv] ch {ch} => {e}")
+        latency_ms = (time.monotonic() - t0) * 1000.0
+
+        with self.lock:
+            self.in_flight.discard(ch)
+            st = self._ch_stats(ch)
+            st[result] += 1
+            st["last_result"] = result
+            st["last_latency_ms"] = round(latency_ms, 1)
+            prev = st["avg_latency_ms"]
+            st["avg_latency_ms"] = round(latency_ms if prev is None else (0.8 * prev + 0.2 * latency_ms), 1)
+            if result == "ok":
+                st["last_ok_at"] = time.time()
+                st[f"from_{source}"] += 1
+                if not changed:
+                    st["unchanged"] += 1
+
+        if result == "timeout":
+            logger.warning(f"[snapshot_cctv] Timeout snapshot ch {ch} (>{self.timeout}s)")
+        if source == "rtsp":
+            log_rtsp(ch, link, result == "ok")
+        elif result == "ok":
+            logger.debug(f"[snapshot_cctv] Channel {ch} => segmen HLS (OK, changed={changed})")
+
+    def tick(self) -> float:
+        """
+        Submit capture yang sudah jatuh tempo. Return detik sampai jadwal berikutnya.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for ch, due in self.next_due.items():
+                if due > now:
+                    continue
+                # Jadwal berikutnya tetap di fase yang sama
+                self.next_due[ch] = due + self.interval * max(1, int((now - due) // self.interval) + 1)
+                if ch in self.in_flight:
+                    self._ch_stats(ch)["skipped"] += 1
+                    logger.warning(f"[snapshot_cctv] Skip ch {ch} => capture sebelumnya belum selesai")
+                    continue
+                self.in_flight.add(ch)
+                self.pool.submit(self._run_capture, ch, self.links[ch])
+            if not self.next_due:
+                return 1.0
+            return max(0.0, min(self.next_due.values()) - time.monotonic())
+
+    def write_stats(self):
+        with self.lock:
+            data = {
+                "interval_sec": self.interval,
+                "max_concurrency": self.max_concurrency,
+                "timeout_sec": self.timeout,
+                "in_flight": sorted(self.in_flight),
+                "updated_at": time.time(),
+                "channels": {ch: dict(st) for ch, st in self.stats.items()}
+            }
+        save_json_file(self.stats_path, data)
+
 ###############################################################################
 # MAIN
 ###############################################################################
+def parse_active_links(data: dict) -> dict:
+    """
+    channel_validation.json => {ch_str: raw_link} untuk channel is_active.
+    Dipakai sebagai proyeksi FileWatcher (perubahan last_update dsb. diabaikan).
+    """
+    if not isinstance(data, dict) or not data:
+        raise ValueError(f"{CHANNEL_VALIDATION_JSON} kosong/invalid")
+    links = {}
+    for ch_str, info in data.items():
+        if not isinstance(info, dict):
+            continue
+        if not info.get("is_active", False):
+            continue
+        raw_link = info.get("livestream_link","")
+        if not raw_link:
+            # skip channel tanpa link
+            continue
+        links[ch_str] = raw_link
+    return links
+
 def main():
     os.makedirs(SNAPSHOT_DIR, exist_ok=True)
 
@@ -139,47 +477,33 @@ def main():
         logger.error(f"[snapshot_cctv] Gagal decode kredensial => {e}")
         return
 
-    old_hash = get_file_hash(CHANNEL_VALIDATION_JSON)
-    logger.info(f"[snapshot_cctv] Mulai loop setiap {INTERVAL_SEC} detik...")
+    scheduler = SnapshotScheduler(INTERVAL_SEC, SNAPSHOT_MAX_CONCURRENCY,
+                                  SNAPSHOT_TIMEOUT, SNAPSHOT_STATS_PATH)
+    changed = threading.Event()
 
-    while True:
-        start = time.time()
-        new_hash = get_file_hash(CHANNEL_VALIDATION_JSON)
-        if new_hash != old_hash:
-            # Hanya log sekali
-            logger.info(f"[snapshot_cctv] Deteksi perubahan pada {CHANNEL_VALIDATION_JSON}, reload...")
-            old_hash = new_hash
-
-        # Load JSON
-        data = load_json_file(CHANNEL_VALIDATION_JSON)
-        if not data:
-            logger.warning(f"[snapshot_cctv] {CHANNEL_VALIDATION_JSON} kosong/invalid, skip.")
-            time.sleep(INTERVAL_SEC)
-            continue
+    def on_validation_change(raw_links: dict):
+        logger.info(f"[snapshot_cctv] Deteksi perubahan pada {CHANNEL_VALIDATION_JSON}, reload...")
+        scheduler.set_channels({
+            ch: replace_credentials_in_link(link, user, pwd) for ch, link in raw_links.items()
+        })
+        changed.set()
 
-        # Ambil snapshot utk channel is_active
-        for ch_str, info in data.items():
-            if not isinstance(info, dict):
-                continue
-            if not info.get("is_active", False):
-                continue
+    FileWatcher(CHANNEL_VALIDATION_JSON, on_validation_change, parse=parse_active_links).start()
+    logger.info(
+        f"[snapshot_cctv] Mulai scheduler => interval={INTERVAL_SEC}s, "
+        f"concurrency={SNAPSHOT_MAX_CONCURRENCY}, timeout={SNAPSHOT_TIMEOUT}s"
+    )
 
-            raw_link = info.get("livestream_link","")
-            if not raw_link:
-                # skip channel tanpa link
-                continue
-
-            rtsp_final = replace_credentials_in_link(raw_link, user, pwd)
-            snapshot_path = os.path.join(SNAPSHOT_DIR, f"ch_{ch_str}.jpg")
-
-            ok = take_snapshot(rtsp_final, snapshot_path)
-            log_rtsp(ch_str, rtsp_final, ok)
+    next_stats = time.monotonic() + INTERVAL_SEC
+    while True:
+        if time.monotonic() >= next_stats:
+            next_stats += INTERVAL_SEC
+            scheduler.write_stats()
 
-        elapsed = time.time() - start
-        delay = INTERVAL_SEC - elapsed
-        if delay < 0:
-            delay = 0
-        time.sleep(delay)
+        delay = scheduler.tick()
+        # Bangun lebih awal jika daftar channel berubah
+        changed.wait(min(delay, max(0.0, next_stats - time.monotonic())) + 0.01)
+        changed.clear()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
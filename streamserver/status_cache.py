@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+status_cache.py
+
+Dokumen /status yang sudah di-precompute & di-serialize, dipakai bersama oleh
+main.py (Flask) dan async_server.py (aiohttp).
+
+- Thread background memantau channel_validation.json (inode/mtime/size) dan
+  folder snapshots (mtime). Hanya jika salah satunya berubah => rebuild.
+- Rebuild menghasilkan entri per channel dengan path relatif (hls, thumbnail)
+  + field yang sudah di-mask. Jika hasilnya sama persis dengan sebelumnya,
+  generation (dan ETag) tidak berubah.
+- Body JSON final (URL absolut per host) di-cache per base_url + ETag.
+  Request => cek If-None-Match => 304, atau kirim bytes siap pakai.
+  Tidak ada akses filesystem di jalur request.
+
+Author: (Anda)
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+sys.path.append("/app/scripts")
+from utils import setup_category_logger
+
+logger = setup_category_logger("CCTV")
+
+STATUS_REFRESH_INTERVAL = float(os.getenv("STATUS_REFRESH_INTERVAL", "1.0"))
+# base_url berasal dari header Host klien => jumlah body yang di-cache dibatasi (LRU)
+STATUS_RENDER_CACHE     = int(os.getenv("STATUS_RENDER_CACHE", "8"))
+
+
+class StatusCache:
+    """
+    Cache dokumen /status.
+
+    get(base_url) => (body_bytes, etag)
+    mask_fn => fungsi masking RTSP (main.mask_any_rtsp_in_string).
+    """
+    def __init__(self, validation_path: str, snapshot_dir: str, mask_fn, refresh_interval: float = None):
+        self.validation_path  = validation_path
+        self.snapshot_dir     = snapshot_dir
+        self.mask_fn          = mask_fn
+        self.refresh_interval = refresh_interval or STATUS_REFRESH_INTERVAL
+
+        self._lock        = threading.Lock()
+        self._thread      = None
+        self._val_key     = None
+        self._snap_key    = None
+        self._entries     = None   # list[(ch_str, dict)] dengan path relatif
+        self._generation  = 0
+        self._rendered    = OrderedDict()   # LRU {base_url: (generation, body, etag)}
+
+    # ------------------------------------------------------------------
+    # Build (hanya dipanggil thread background / build pertama)
+    # ------------------------------------------------------------------
+    def _stat_keys(self):
+        try:
+            st = os.stat(self.validation_path)
+            val_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            val_key = None
+        try:
+            snap_key = os.stat(self.snapshot_dir).st_mtime_ns
+        except FileNotFoundError:
+            snap_key = None
+        return val_key, snap_key
+
+    def _load_validation(self):
+        try:
+            with open(self.validation_path, "r") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            # Kemungkinan sedang ditulis => None = pakai dokumen lama
+            logger.warning(f"[status_cache] Gagal baca {self.validation_path} => {e}")
+            return None
+
+    def _list_snapshots(self) -> set:
+        try:
+            with os.scandir(self.snapshot_dir) as it:
+                return {e.name for e in it}
+        except FileNotFoundError:
+            return set()
+
+    def _build_entries(self, data: dict, snapshots: set) -> list:
+        entries = []
+        for ch_str, info in data.items():
+            if not isinstance(info, dict):
+                continue
+            err = info.get("error_msg")
+            if err:
+                err = self.mask_fn(err)
+
+            raw_link = info.get("livestream_link", "")
+            masked_link = self.mask_fn(raw_link) if raw_link else None
+
+            snapshot_filename = f"ch_{ch_str}.jpg"
+            if snapshot_filename in snapshots:
+                thumbnail_path = f"/snapshots/{snapshot_filename}"
+            else:
+                thumbnail_path = "/img/default-thumb.jpg"
+
+            entries.append((ch_str, {
+                "is_active": info.get("is_active", False),
+                "error_msg": err,
+                "last_update": info.get("last_update"),
+                "hls_path": f"/ch{ch_str}/",
+                "livestream_link": masked_link,
+                "thumbnail_path": thumbnail_path
+            }))
+        return entries
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Rebuild jika stat berubah. Return True jika dokumen berubah.
+        """
+        val_key, snap_key = self._stat_keys()
+        if not force and val_key == self._val_key and snap_key == self._snap_key:
+            return False
+
+        data = self._load_validation()
+        if data is None:
+            return False
+        entries = self._build_entries(data, self._list_snapshots())
+
+        with self._lock:
+            self._val_key  = val_key
+            self._snap_key = snap_key
+            if entries == self._entries:
+                return False
+            self._entries = entries
+            self._generation += 1
+            self._rendered = OrderedDict()
+        return True
+
+    def _loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"[status_cache] refresh => {e}")
+            time.sleep(self.refresh_interval)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Jalur request
+    # ------------------------------------------------------------------
+    def get(self, base_url: str):
+        """
+        Kembalikan (body_bytes, etag) untuk base_url (mis. 'http://host:8080').
+        """
+        if self._entries is None:
+            # Request pertama sebelum thread sempat build
+            self.refresh(force=True)
+            self.start()
+
+        with self._lock:
+            gen = self._generation
+            cached = self._rendered.get(base_url)
+            if cached and cached[0] == gen:
+                self._rendered.move_to_end(base_url)
+                return cached[1], cached[2]
+
+            result = {}
+            for ch_str, e in self._entries or []:
+                result[ch_str] = {
+                    "is_active": e["is_active"],
+                    "error_msg": e["error_msg"],
+                    "last_update": e["last_update"],
+                    "hls_url": base_url + e["hls_path"],
+                    "livestream_link": e["livestream_link"],
+                    "thumbnail_url": base_url + e["thumbnail_path"]
+                }
+            body = json.dumps(result, sort_keys=True).encode()
+            etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+            self._rendered[base_url] = (gen, body, etag)
+            self._rendered.move_to_end(base_url)
+            while len(self._rendered) > STATUS_RENDER_CACHE:
+                self._rendered.popitem(last=False)
+        return body, etag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Cek header If-None-Match (bisa berisi beberapa ETag / '*' / prefix W/).
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag == etag or tag == "W/" + etag:
+            return True
+    return False
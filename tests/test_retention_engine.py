@@ -0,0 +1,158 @@
+"""
+Unit test rencana retensi (scripts/retention_engine.py): build_plan & forecast
+dengan data pemakaian sintetis (tanpa disk / katalog).
+
+Jalankan: python -m pytest -q tests
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+import retention_engine as re_  # noqa: E402
+from retention_engine import RetentionPolicy, build_plan, forecast, DATE_FORMAT  # noqa: E402
+
+GB = 1024 ** 3
+TODAY = date(2026, 10, 19)
+
+
+def make_policy(**overrides) -> RetentionPolicy:
+    policy = RetentionPolicy()
+    policy.min_days, policy.min_days_ch = 3, {}
+    policy.max_days, policy.max_days_ch = 0, {}
+    policy.quota_gb, policy.quota_ch = 0, {}
+    policy.high, policy.target = 90, 80
+    for key, value in overrides.items():
+        setattr(policy, key, value)
+    return policy
+
+
+def days_usage(n_days: int, gb_per_day: float, start_age: int = 0) -> dict:
+    """
+    {date: {"bytes", "files"}} untuk umur start_age .. start_age + n_days - 1 hari.
+    """
+    return {TODAY - timedelta(days=age): {"bytes": int(gb_per_day * GB), "files": 10}
+            for age in range(start_age, start_age + n_days)}
+
+
+def disk(used_gb: float, total_gb: float = 1000) -> dict:
+    return {"total": int(total_gb * GB), "used": int(used_gb * GB),
+            "free": int((total_gb - used_gb) * GB),
+            "percent": round(used_gb / total_gb * 100.0, 2)}
+
+
+def day_str(age: int) -> str:
+    return (TODAY - timedelta(days=age)).strftime(DATE_FORMAT)
+
+
+def test_quota_overflow_trims_oldest_days_first():
+    usage = {1: days_usage(10, 1.0), 2: days_usage(10, 1.0)}
+    plan, blocked = build_plan(usage, disk(20), make_policy(quota_ch={1: 6.5}), today=TODAY)
+
+    assert blocked == []
+    assert [p["channel"] for p in plan] == [1] * 4
+    assert [p["day"] for p in plan] == [day_str(9), day_str(8), day_str(7), day_str(6)]
+    assert {p["reason"] for p in plan} == {"quota"}
+
+
+def test_quota_blocked_by_min_days():
+    # Semua hari lebih muda dari min_days channel => tidak ada yang boleh dihapus
+    usage = {1: days_usage(5, 2.0)}
+    policy = make_policy(quota_ch={1: 1.0}, min_days_ch={1: 14})
+    plan, blocked = build_plan(usage, disk(10), policy, today=TODAY)
+
+    assert plan == []
+    assert len(blocked) == 1
+    assert blocked[0]["channel"] == 1 and blocked[0]["reason"] == "quota"
+    assert blocked[0]["over_bytes"] == 9 * GB
+
+
+def test_min_days_stops_quota_partway():
+    usage = {1: days_usage(6, 1.0)}
+    plan, blocked = build_plan(usage, disk(10), make_policy(quota_ch={1: 1.0}), today=TODAY)
+
+    # umur 5, 4, 3 boleh dihapus; umur 0..2 dilindungi min_days=3
+    assert [p["day"] for p in plan] == [day_str(5), day_str(4), day_str(3)]
+    assert blocked and blocked[0]["reason"] == "quota"
+
+
+def test_disk_pressure_trims_largest_channel_first():
+    usage = {1: days_usage(10, 5.0), 2: days_usage(10, 1.0), 3: days_usage(10, 2.0)}
+    # 95% dari 100 GB terpakai, target 80% => perlu 15 GB
+    plan, blocked = build_plan(usage, disk(95, 100), make_policy(), today=TODAY)
+
+    assert blocked == []
+    assert [p["channel"] for p in plan] == [1, 1, 1]
+    assert [p["day"] for p in plan] == [day_str(9), day_str(8), day_str(7)]
+    assert {p["reason"] for p in plan} == {"disk"}
+    assert sum(p["bytes"] for p in plan) >= 15 * GB
+
+
+def test_disk_pressure_balances_between_channels():
+    usage = {1: days_usage(10, 3.0), 2: days_usage(10, 2.0)}
+    plan, _ = build_plan(usage, disk(95, 100), make_policy(), today=TODAY)
+
+    channels = [p["channel"] for p in plan]
+    # ch1 (30 GB) dipangkas dulu sampai setara ch2 (20 GB) sebelum ch2 tersentuh
+    first_ch2 = channels.index(2) if 2 in channels else len(channels)
+    assert all(ch == 1 for ch in channels[:first_ch2])
+    assert first_ch2 >= 3
+
+
+def test_disk_pressure_blocked_when_everything_is_protected():
+    usage = {1: days_usage(3, 10.0)}
+    plan, blocked = build_plan(usage, disk(95, 100), make_policy(), today=TODAY)
+
+    assert plan == []
+    assert blocked and blocked[0]["reason"] == "disk"
+
+
+def test_no_pressure_no_plan():
+    usage = {1: days_usage(10, 1.0)}
+    plan, blocked = build_plan(usage, disk(50), make_policy(), today=TODAY)
+    assert plan == [] and blocked == []
+
+
+def test_max_age_respects_min_days():
+    usage = {1: days_usage(10, 1.0), 2: days_usage(10, 1.0)}
+    policy = make_policy(max_days=5, min_days_ch={2: 8})
+    plan, _ = build_plan(usage, disk(10), policy, today=TODAY)
+
+    ch1 = [p["day"] for p in plan if p["channel"] == 1]
+    ch2 = [p["day"] for p in plan if p["channel"] == 2]
+    assert ch1 == [day_str(age) for age in (9, 8, 7, 6)]
+    assert ch2 == [day_str(9)]
+    assert {p["reason"] for p in plan} == {"max_age"}
+
+
+def test_today_never_planned_with_zero_min_days():
+    usage = {1: days_usage(2, 50.0)}
+    policy = make_policy(min_days=0, quota_ch={1: 1.0}, max_days=0)
+    plan, blocked = build_plan(usage, disk(99, 100), policy, today=TODAY)
+
+    assert day_str(0) not in [p["day"] for p in plan]
+    assert [p["day"] for p in plan] == [day_str(1)]
+    assert blocked
+
+
+def test_forecast_uses_complete_days_only():
+    usage = {1: days_usage(10, 2.0), 2: days_usage(10, 1.0)}
+    # Hari ini (belum lengkap) jauh lebih besar => tidak boleh ikut rata-rata
+    usage[1][TODAY] = {"bytes": 100 * GB, "files": 1}
+    out = forecast(usage, disk(500), make_policy(), today=TODAY)
+
+    assert out["sample_days"] == re_.RETENTION_FORECAST_DAYS
+    assert out["daily_growth_bytes"] == 3 * GB
+    assert out["channel_daily_growth_bytes"] == {"1": 2 * GB, "2": 1 * GB}
+    assert out["retention_days"] == {"1": 10, "2": 10}
+    assert out["days_until_high"] == round((900 - 500) / 3, 1)
+    assert out["days_until_full"] == round(500 / 3, 1)
+
+
+def test_forecast_without_history():
+    out = forecast({1: days_usage(1, 1.0)}, disk(500), make_policy(), today=TODAY)
+    assert out["sample_days"] == 0
+    assert out["daily_growth_bytes"] == 0
+    assert out["days_until_high"] is None and out["days_until_full"] is None